@@ -1,12 +1,16 @@
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
+from src.auth.hash_password import hash_password
+from src.cache.local import listen_invalidations, local_cache
 from src.config import settings
-from src.database.connection import engine
+from src.database.connection import engine, replica_engines
 from src.routers import root_router
+from src.utils.schedule_executor import schedule_executor
 
 
 logging.basicConfig(
@@ -18,8 +22,19 @@ logging.basicConfig(
 
 @asynccontextmanager
 async def lifespan(application: FastAPI):
+    invalidation_listener: asyncio.Task | None = None
+    if local_cache.enabled:
+        invalidation_listener = asyncio.create_task(listen_invalidations())
     yield
+    if invalidation_listener:
+        invalidation_listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await invalidation_listener
+    hash_password.shutdown()
+    schedule_executor.shutdown()
     await engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
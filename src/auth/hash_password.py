@@ -1,10 +1,34 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
 from passlib.context import CryptContext
 
+from src.config import settings
+from src.utils.metrics import metrics
+
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 class HashPassword:
+    """Password hashing, the async methods run it in a pool so that the event loop is not blocked.
+
+    At most ``max_concurrency`` hashes are computed at once, the rest wait in the queue.
+    """
+
+    def __init__(self, workers: int, executor_type: str, max_concurrency: int):
+        self.workers: int = workers
+        self.executor_type: str = executor_type
+        self.waiting: int = 0
+        self.running: int = 0
+        self._executor: Executor | None = None
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrency)
+
+        metrics.gauge("auth.hash.queue_depth", lambda: self.waiting)
+        metrics.gauge("auth.hash.running", lambda: self.running)
+
     @staticmethod
     def create_hash(password: str) -> str:
         return pwd_context.hash(password)
@@ -13,5 +37,46 @@ class HashPassword:
     def verify_hash(plain_password: str, hashes_password: str) -> bool:
         return pwd_context.verify(plain_password, hashes_password)
 
+    async def create_hash_async(self, password: str) -> str:
+        return await self._run(HashPassword.create_hash, password)
+
+    async def verify_hash_async(self, plain_password: str, hashes_password: str) -> bool:
+        return await self._run(HashPassword.verify_hash, plain_password, hashes_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+        return self._executor
+
+    async def _run[T](self, func: Callable[..., T], *args) -> T:
+        queued_at: float = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        started_at: float = time.perf_counter()
+        metrics.observe("auth.hash.wait_seconds", started_at - queued_at)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            metrics.observe("auth.hash.seconds", time.perf_counter() - started_at)
+
 
-hash_password = HashPassword()
+hash_password = HashPassword(
+    workers=settings.auth.hash_workers,
+    executor_type=settings.auth.hash_executor,
+    max_concurrency=settings.auth.hash_max_concurrency,
+)
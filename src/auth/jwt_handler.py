@@ -1,10 +1,18 @@
+import hashlib
 import logging
+import time
 from datetime import timedelta, datetime, UTC
+from uuid import UUID
 
+import redis
 from fastapi import HTTPException, status
 from jose import jwt, JWTError
 
+from src.auth.token_cache import verified_tokens
+from src.cache.breaker import cache_errors
+from src.cache.client import cache_client
 from src.config import settings
+from src.schemas.token import TokenData
 
 
 logger = logging.getLogger(__name__)
@@ -12,11 +20,13 @@ logger = logging.getLogger(__name__)
 
 def create_access_token(
         user: str,
+        user_id: UUID,
         expires_delta: timedelta = timedelta(minutes=settings.auth.access_token_expire_minutes)
 ) -> str:
     expire: datetime = datetime.now(UTC) + expires_delta
     payload = {
         'sub': user,
+        'uid': str(user_id),
         'exp': expire
     }
     token: str = jwt.encode(
@@ -27,7 +37,16 @@ def create_access_token(
     return token
 
 
-async def verify_access_token(token: str) -> str:
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def verify_access_token(token: str) -> TokenData:
+    token_hash: str = hash_token(token)
+    token_data: TokenData | None = verified_tokens.get(token_hash)
+    if token_data is not None:
+        return token_data
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -42,15 +61,44 @@ async def verify_access_token(token: str) -> str:
 
         expired_at: int = payload.get("exp")
         username: str = payload.get("sub")
+        user_id: str = payload.get("uid")
 
-        if expired_at is None or username is None:
+        if expired_at is None or username is None or user_id is None:
             raise credentials_exception
 
         if datetime.now(UTC) > datetime.fromtimestamp(expired_at, UTC):
             raise credentials_exception
 
-        return username
-
     except JWTError as e:
         logger.exception(e)
         raise credentials_exception
+
+    token_data = TokenData(email=username, user_id=user_id, expires_at=expired_at)
+    try:
+        revoked: bytes | None = await cache_client.get(f'token:revoked:{token_hash}')
+    except redis.exceptions.ConnectionError as e:
+        # the denylist is not available, so the token is not cached to be checked again
+        cache_errors.exception(logger, e)
+        return token_data
+    if revoked:
+        raise credentials_exception
+    verified_tokens.set(token_hash, token_data, expires_at=expired_at)
+    return token_data
+
+
+async def revoke_access_token(token: str, token_data: TokenData) -> None:
+    token_hash: str = hash_token(token)
+    verified_tokens.discard(token_hash)
+    # the token is denied only until it expires by itself
+    ttl: int = token_data.expires_at - int(time.time())
+    if ttl <= 0:
+        return
+    try:
+        async with cache_client.batch() as batch:
+            batch.set(f'token:revoked:{token_hash}', b'1', ex=ttl)
+    except redis.exceptions.ConnectionError as e:
+        cache_errors.exception(logger, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The token could not be revoked, try again later",
+        )
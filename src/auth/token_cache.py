@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+
+from src.config import settings
+from src.schemas.token import TokenData
+from src.utils.metrics import metrics
+
+
+class VerifiedTokenCache:
+    """Per-worker LRU cache of the decoded access tokens, keyed by the token hash.
+
+    An entry lives until the token expires but not longer than ``ttl`` seconds,
+    so that a token revoked by another worker stops being accepted here as well.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: OrderedDict[str, tuple[float, TokenData]] = OrderedDict()
+
+        metrics.gauge("auth.token_cache.entries", lambda: len(self._entries))
+        metrics.gauge("auth.token_cache.hits", lambda: self.hits)
+        metrics.gauge("auth.token_cache.misses", lambda: self.misses)
+
+    def get(self, token_hash: str) -> TokenData | None:
+        entry: tuple[float, TokenData] | None = self._entries.get(token_hash)
+        if entry is None or entry[0] < time.time():
+            self._entries.pop(token_hash, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token_hash)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, token_hash: str, token_data: TokenData, expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[token_hash] = (min(expires_at, time.time() + self.ttl), token_data)
+        self._entries.move_to_end(token_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, token_hash: str) -> None:
+        self._entries.pop(token_hash, None)
+
+
+verified_tokens: VerifiedTokenCache = VerifiedTokenCache(
+    max_size=settings.auth.token_cache_size,
+    ttl=settings.auth.token_cache_ttl,
+)
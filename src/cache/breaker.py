@@ -0,0 +1,146 @@
+import logging
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+from src.config import settings
+from src.utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(redis.exceptions.ConnectionError):
+    """Raised instead of sending a command to Redis while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Fails the Redis commands at once while Redis is failing, instead of waiting for each to time out.
+
+    The circuit is closed while Redis answers. ``failure_threshold`` connection errors or
+    timeouts in a row open it, then the commands fail with ``CircuitOpenError`` for
+    ``reset_timeout`` seconds. After that it is half-open: one command probes Redis, its
+    answer closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.failures: int = 0
+        self.opened_at: float | None = None
+        self.probe: object | None = None
+        self.probe_started_at: float = 0
+
+        metrics.gauge("cache.breaker.open", lambda: float(self.opened_at is not None))
+
+    def before_command(self, connection: object) -> None:
+        """Raise ``CircuitOpenError`` unless the connection may send a command."""
+        if self.opened_at is None or self.probe is connection:
+            return
+        now: float = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            metrics.incr("cache.breaker.rejected")
+            raise CircuitOpenError("The circuit to Redis is open")
+        # a probe that never got its answer, e.g. it was cancelled, is replaced after the same time
+        if self.probe is not None and now - self.probe_started_at < self.reset_timeout:
+            metrics.incr("cache.breaker.rejected")
+            raise CircuitOpenError("The circuit to Redis is half-open")
+        self.probe = connection
+        self.probe_started_at = now
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.opened_at is not None:
+            logger.warning("The circuit to Redis is closed")
+            self.opened_at = None
+            self.probe = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("The circuit to Redis is open after %d failures", self.failures)
+                metrics.incr("cache.breaker.opened")
+            self.opened_at = time.monotonic()
+            self.probe = None
+
+
+circuit_breaker: CircuitBreaker = CircuitBreaker(
+    failure_threshold=settings.cache.failure_threshold,
+    reset_timeout=settings.cache.reset_timeout,
+)
+
+
+class BreakerConnection(aioredis.Connection):
+    """Connection of the shared client, guarded by the circuit breaker.
+
+    Timeouts are raised as ``redis.exceptions.ConnectionError``, which the services
+    handle by going to the database.
+    """
+
+    async def connect(self) -> None:
+        if self.is_connected:
+            return
+        circuit_breaker.before_command(self)
+        try:
+            await super().connect()
+        except redis.exceptions.TimeoutError as e:
+            circuit_breaker.record_failure()
+            raise redis.exceptions.ConnectionError(*e.args) from e
+        except redis.exceptions.ConnectionError:
+            circuit_breaker.record_failure()
+            raise
+
+    async def send_packed_command(self, command, check_health: bool = True) -> None:
+        circuit_breaker.before_command(self)
+        try:
+            await super().send_packed_command(command, check_health)
+        except redis.exceptions.TimeoutError as e:
+            circuit_breaker.record_failure()
+            raise redis.exceptions.ConnectionError(*e.args) from e
+        except redis.exceptions.ConnectionError:
+            circuit_breaker.record_failure()
+            raise
+
+    async def read_response(self, *args, **kwargs):
+        try:
+            response = await super().read_response(*args, **kwargs)
+        except redis.exceptions.TimeoutError as e:
+            circuit_breaker.record_failure()
+            raise redis.exceptions.ConnectionError(*e.args) from e
+        except redis.exceptions.ConnectionError:
+            circuit_breaker.record_failure()
+            raise
+        circuit_breaker.record_success()
+        return response
+
+
+class ErrorLog:
+    """Logs the Redis errors at most once per ``interval`` seconds per logger, counting the others.
+
+    The errors of an open circuit are not logged, the breaker logs when it opens and closes.
+    """
+
+    def __init__(self, interval: float):
+        self.interval: float = interval
+        self._logged_at: dict[str, float] = {}
+        self._suppressed: dict[str, int] = {}
+
+    def exception(self, log: logging.Logger, error: redis.exceptions.RedisError) -> None:
+        metrics.incr("cache.errors")
+        if isinstance(error, CircuitOpenError):
+            return
+        now: float = time.monotonic()
+        if now - self._logged_at.get(log.name, -self.interval) < self.interval:
+            self._suppressed[log.name] = self._suppressed.get(log.name, 0) + 1
+            return
+        self._logged_at[log.name] = now
+        suppressed: int = self._suppressed.pop(log.name, 0)
+        if suppressed:
+            log.exception("%s, %d similar errors were not logged", error.args, suppressed)
+        else:
+            log.exception(error.args)
+
+
+cache_errors: ErrorLog = ErrorLog(interval=settings.cache.error_log_interval)
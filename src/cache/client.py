@@ -0,0 +1,561 @@
+import math
+import random
+import secrets
+from typing import Awaitable, Callable, Mapping, NamedTuple, Self, Sequence
+
+import redis.asyncio as aioredis
+from redis.commands.core import AsyncScript
+from orjson import orjson
+
+from src.cache.connection import cache
+from src.cache.local import local_cache
+from src.config import settings
+from src.utils.metrics import metrics
+
+
+# the generations never repeat, even after the hash expired, since they start from the current time
+# in microseconds, which stay exact in the numbers of Lua and are written without an exponent
+#
+# KEYS[1] is the hash of the generations, ARGV[1] its ttl and ARGV[2] the prefix of the keys of the names,
+# followed by each name with the write of its new key, see VersionWrite
+BUMP_GENERATIONS_SCRIPT: str = """
+local function zadd(key, first, count)
+    local last = first + count * 2 - 1
+    for start = first, last, 1000 do
+        redis.call('ZADD', key, unpack(ARGV, start, math.min(start + 999, last)))
+    end
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local generations = {}
+local index = 3
+while index <= #ARGV do
+    local name, write = ARGV[index], ARGV[index + 1]
+    index = index + 2
+    local previous = tonumber(redis.call('HGET', KEYS[1], name) or 0)
+    local generation = math.max(previous + 1, now)
+    redis.call('HSET', KEYS[1], name, string.format('%.0f', generation))
+    generations[#generations + 1] = {previous, generation}
+
+    local key = ARGV[2] .. name .. '@' .. string.format('%.0f', generation)
+    if write == 'set' then
+        redis.call('SET', key, ARGV[index + 1], 'EX', ARGV[index])
+        index = index + 2
+    elseif write == 'set_sorted' then
+        local count = tonumber(ARGV[index + 1])
+        zadd(key, index + 2, count)
+        if count > 0 then
+            redis.call('EXPIRE', key, ARGV[index])
+        end
+        index = index + 2 + count * 2
+    elseif write == 'patch_sorted' then
+        local removed = tonumber(ARGV[index])
+        local added = tonumber(ARGV[index + removed + 1])
+        -- members are patched only in an existing set, a partial one would be served as the whole
+        local source = ARGV[2] .. name .. '@' .. string.format('%.0f', previous)
+        if redis.call('COPY', source, key, 'REPLACE') == 1 then
+            for member = index + 1, index + removed do
+                redis.call('ZREM', key, ARGV[member])
+            end
+            zadd(key, index + removed + 2, added)
+        end
+        index = index + removed + 2 + added * 2
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return generations
+"""
+
+# the key of the current generation of a name is resolved and read in one round trip,
+# KEYS[1] is the hash of the generations, ARGV[1] the name and ARGV[2] the prefix of its keys,
+# the generation is returned first, then what ARGV[3] reads
+READ_CURRENT_SCRIPT: str = """
+local generation = redis.call('HGET', KEYS[1], ARGV[1]) or '0'
+local key = ARGV[2] .. ARGV[1] .. '@' .. generation
+local read = ARGV[3]
+if read == 'value' then
+    return {generation, redis.call('GET', key), redis.call('GET', 'missing:' .. key)}
+end
+local pttl = redis.call('PTTL', key)
+if read == 'fields' then
+    return {generation, pttl, redis.call('HMGET', key, unpack(ARGV, 4))}
+end
+local members
+if read == 'range' then
+    members = redis.call('ZRANGE', key, ARGV[4], ARGV[5])
+else
+    members = redis.call('ZRANGEBYSCORE', key, '(' .. ARGV[4], '+inf', 'LIMIT', 0, ARGV[5])
+end
+return {generation, pttl, members, redis.call('GET', 'missing:' .. key)}
+"""
+
+RELEASE_LOCK_SCRIPT: str = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def jittered(ttl: int) -> int:
+    # keys written together do not expire together
+    return ttl + random.randint(0, int(ttl * settings.cache.ttl_jitter))
+
+
+def expires_early(pttl: int) -> bool:
+    """Decide whether a read should rebuild the key before it expires, the more likely the sooner it does.
+
+    Probabilistic early expiration: with ``early_refresh`` being about the time a rebuild takes,
+    a single read refreshes a hot key shortly before it expires instead of every read after it.
+    """
+    if settings.cache.early_refresh <= 0 or pttl < 0:
+        return False
+    return -settings.cache.early_refresh * math.log(1 - random.random()) * 1000 >= pttl
+
+
+class VersionWrite(NamedTuple):
+    """A write of the new key of a bumped name, done by the bump in the same step."""
+
+    arguments: tuple
+
+    @staticmethod
+    def set(value: bytes, ex: int = settings.cache.ttl) -> "VersionWrite":
+        return VersionWrite(("set", jittered(ex), value))
+
+    @staticmethod
+    def set_sorted(members: Mapping[bytes, float], ex: int = settings.cache.ttl) -> "VersionWrite":
+        """Write a sorted set of the members, scored for range reads."""
+        return VersionWrite((
+            "set_sorted",
+            jittered(ex),
+            len(members),
+            *(argument for member, score in members.items() for argument in (score, member)),
+        ))
+
+    @staticmethod
+    def patch_sorted(removed: Sequence[bytes], added: Mapping[bytes, float]) -> "VersionWrite":
+        """Copy the sorted set of the previous key replacing its ``removed`` members with the ``added`` ones.
+
+        Nothing is written if the previous key does not exist.
+        """
+        return VersionWrite((
+            "patch_sorted",
+            len(removed),
+            *removed,
+            len(added),
+            *(argument for member, score in added.items() for argument in (score, member)),
+        ))
+
+
+NO_WRITE: VersionWrite = VersionWrite(("none",))
+
+
+class VersionedName(NamedTuple):
+    """A name whose keys are versioned by the generations stored in a hash."""
+
+    generations_key: str
+    prefix: str
+    name: str
+
+    def key(self, generation: int) -> str:
+        return f'{self.prefix}{self.name}@{generation}'
+
+
+class CurrentRead[T](NamedTuple):
+    """What was read from the current key of a versioned name."""
+
+    key: str
+    generation: int
+    value: T | None
+    # the reason the value was cached as missing
+    missing: str | None = None
+
+
+class CacheBatch:
+    """Cache writes and invalidations of one request, sent to Redis in a single MULTI/EXEC round trip.
+
+    Changed keys are also dropped from the local cache of this worker and published
+    to the other workers within the same transaction.
+    """
+
+    def __init__(self, client: aioredis.Redis):
+        self._pipeline: aioredis.client.Pipeline = client.pipeline(transaction=True)
+        self._keys: list[str] = []
+
+    def set(self, key: str, value: bytes, ex: int = settings.cache.ttl) -> Self:
+        self._pipeline.set(key, value, ex=jittered(ex))
+        self._keys.append(key)
+        return self
+
+    def set_missing(self, key: str, reason: str, ex: int = settings.cache.negative_ttl) -> Self:
+        """Cache for a short time that the value of the key does not exist, e.g. its loan was not found."""
+        return self.set(f'missing:{key}', reason.encode(), ex=ex)
+
+    def set_sorted(self, key: str, members: Mapping[bytes, float], ex: int = settings.cache.ttl) -> Self:
+        """Replace the key with a sorted set of the members, scored for range reads."""
+        self._pipeline.delete(key)
+        if members:
+            self._pipeline.zadd(key, members)
+            self._pipeline.expire(key, jittered(ex))
+        self._keys.append(key)
+        return self
+
+    def set_fields(self, key: str, fields: Mapping[str, bytes], ex: int = settings.cache.ttl) -> Self:
+        """Add the fields to the hash stored at the key, e.g. chunks of a long list."""
+        if fields:
+            self._pipeline.hset(key, mapping=fields)
+            self._pipeline.expire(key, jittered(ex))
+            self._keys.append(key)
+        return self
+
+    def bump(
+            self,
+            key: str,
+            prefix: str,
+            fields: Sequence[str],
+            writes: Mapping[str, VersionWrite] | None = None,
+            ex: int = settings.cache.generation_ttl,
+    ) -> Self:
+        """Increase the generations stored in the fields of the hash, the result is a pair of
+        the previous and the new generation per field.
+
+        The new keys of the fields, which start with ``prefix``, are written with their ``writes``.
+        """
+        arguments: list = []
+        for field in fields:
+            arguments.append(field)
+            arguments.extend((writes or {}).get(field, NO_WRITE).arguments)
+        self._pipeline.eval(BUMP_GENERATIONS_SCRIPT, 1, key, ex, prefix, *arguments)
+        self._keys.append(key)
+        return self
+
+    def delete(self, *keys: str) -> Self:
+        if keys:
+            self._pipeline.delete(*keys)
+            self._keys.extend(keys)
+        return self
+
+    async def execute(self) -> list:
+        if not len(self._pipeline):
+            return []
+        if local_cache.enabled:
+            self._pipeline.publish(settings.cache.invalidation_channel, orjson.dumps(self._keys))
+        try:
+            return await self._pipeline.execute()
+        finally:
+            local_cache.invalidate(*self._keys)
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            if exc_type is None:
+                await self.execute()
+        finally:
+            await self._pipeline.reset()
+
+
+class CacheClient:
+    def __init__(self, client: aioredis.Redis):
+        self.client: aioredis.Redis = client
+        self._read_current_script: AsyncScript = client.register_script(READ_CURRENT_SCRIPT)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def get_decoded[T](self, key: str, decode: Callable[[bytes], T]) -> T | None:
+        """Get the decoded value of the key, serving repeated reads from the local cache if it is enabled."""
+        if local_cache.enabled:
+            value: T | None = local_cache.get(key)
+            if value is not None:
+                return value
+        raw: bytes | None = await self.client.get(key)
+        if raw is None:
+            return None
+        value = decode(raw)
+        if local_cache.enabled:
+            local_cache.set(key, value, size=len(raw))
+        return value
+
+    async def get_missing(self, key: str) -> str | None:
+        """Get the reason the value of the key was cached as missing, ``None`` if it was not."""
+        return await self.get_decoded(f'missing:{key}', decode=bytes.decode)
+
+    async def get_decoded_or_missing[T](self, key: str, decode: Callable[[bytes], T]) -> tuple[T | None, str | None]:
+        """Get the decoded value of the key and the reason it was cached as missing, in one round trip.
+
+        Like ``get_decoded`` and ``get_missing`` together, at most one of the two is not ``None``.
+        """
+        missing_key: str = f'missing:{key}'
+        if local_cache.enabled:
+            value: T | None = local_cache.get(key)
+            if value is not None:
+                return value, None
+            reason: str | None = local_cache.get(missing_key)
+            if reason is not None:
+                return None, reason
+        raw, raw_reason = await self.get_many([key, missing_key])
+        if raw is not None:
+            value = decode(raw)
+            if local_cache.enabled:
+                local_cache.set(key, value, size=len(raw))
+            return value, None
+        if raw_reason is not None:
+            reason = raw_reason.decode()
+            if local_cache.enabled:
+                local_cache.set(missing_key, reason, size=len(raw_reason))
+            return None, reason
+        return None, None
+
+    async def get_range[T](
+            self,
+            key: str,
+            start: int,
+            stop: int,
+            decode: Callable[[list[bytes]], T],
+    ) -> T | None:
+        """Get the members of the sorted set from ``start`` to ``stop`` inclusive.
+
+        ``None`` if there is no key or it is chosen to be refreshed before it expires.
+        """
+        return await self._get_members(key, f"range:{start}:{stop}", decode, lambda pipe: pipe.zrange(key, start, stop))
+
+    async def get_range_after[T](
+            self,
+            key: str,
+            score: float,
+            count: int,
+            decode: Callable[[list[bytes]], T],
+    ) -> T | None:
+        """Get up to ``count`` members of the sorted set scored above ``score``, ``None`` if there is no key."""
+        return await self._get_members(
+            key,
+            f"after:{score}:{count}",
+            decode,
+            lambda pipe: pipe.zrangebyscore(key, f"({score}", "+inf", start=0, num=count),
+        )
+
+    async def get_fields[T](self, key: str, fields: Sequence[str], decode: Callable[[bytes], T]) -> list[T | None]:
+        """Get the decoded values of the hash fields, ``None`` for the missing ones.
+
+        All of them are ``None`` if the key is chosen to be refreshed before it expires.
+        """
+        values: list[T | None] = [
+            local_cache.get(key, f"field:{field}") if local_cache.enabled else None
+            for field in fields
+        ]
+        missing: list[int] = [index for index, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.pttl(key)
+            pipe.hmget(key, [fields[index] for index in missing])
+            pttl, raw_values = await pipe.execute()
+        decoded: list[T | None] | None = self._decode_fields(
+            key, [fields[index] for index in missing], pttl, raw_values, decode,
+        )
+        if decoded is None:
+            return [None] * len(fields)
+        for index, value in zip(missing, decoded):
+            values[index] = value
+        return values
+
+    async def get_current_decoded_or_missing[T](
+            self,
+            name: VersionedName,
+            decode: Callable[[bytes], T],
+    ) -> CurrentRead[T]:
+        """Get the decoded value of the current key of the name and the reason it was cached as missing,
+        resolving the key in the same round trip.
+        """
+        generation: int | None = self._local_generation(name)
+        if generation is not None:
+            value, reason = await self.get_decoded_or_missing(name.key(generation), decode)
+            return CurrentRead(name.key(generation), generation, value, reason)
+        generation, (raw, raw_reason) = await self._read_current(name, "value")
+        key: str = name.key(generation)
+        if raw is not None:
+            value = decode(raw)
+            if local_cache.enabled:
+                local_cache.set(key, value, size=len(raw))
+            return CurrentRead(key, generation, value)
+        return CurrentRead(key, generation, None, self._decode_missing(key, raw_reason))
+
+    async def get_current_fields[T](
+            self,
+            name: VersionedName,
+            fields: Sequence[str],
+            decode: Callable[[bytes], T],
+    ) -> CurrentRead[list[T | None]]:
+        """Like ``get_fields`` on the current key of the name, resolving the key in the same round trip."""
+        generation: int | None = self._local_generation(name)
+        if generation is not None:
+            return CurrentRead(
+                name.key(generation), generation, await self.get_fields(name.key(generation), fields, decode),
+            )
+        generation, (pttl, raw_values) = await self._read_current(name, "fields", *fields)
+        key: str = name.key(generation)
+        values: list[T | None] | None = self._decode_fields(key, fields, pttl, raw_values, decode)
+        return CurrentRead(key, generation, values or [None] * len(fields))
+
+    async def get_current_range[T](
+            self,
+            name: VersionedName,
+            start: int,
+            stop: int,
+            decode: Callable[[list[bytes]], T],
+    ) -> CurrentRead[T]:
+        """Like ``get_range`` on the current key of the name, with the reason it was cached as missing."""
+        return await self._get_current_members(
+            name, f"range:{start}:{stop}", decode, ("range", start, stop),
+            lambda key: self.get_range(key, start, stop, decode),
+        )
+
+    async def get_current_range_after[T](
+            self,
+            name: VersionedName,
+            score: float,
+            count: int,
+            decode: Callable[[list[bytes]], T],
+    ) -> CurrentRead[T]:
+        """Like ``get_range_after`` on the current key of the name, with the reason it was cached as missing."""
+        return await self._get_current_members(
+            name, f"after:{score}:{count}", decode, ("after", score, count),
+            lambda key: self.get_range_after(key, score, count, decode),
+        )
+
+    async def get_sorted(self, key: str) -> dict[bytes, float] | None:
+        """Get all the members of the sorted set with their scores, ``None`` if there is no key."""
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            pipe.zrange(key, 0, -1, withscores=True)
+            exists, members = await pipe.execute()
+        if not exists:
+            return None
+        return dict(members)
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        """Take the short lock of the key, return the token to release it or ``None`` if it is taken."""
+        token: str = secrets.token_hex(8)
+        if await self.client.set(f'lock:{key}', token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        # only the owner releases the lock, it might have expired and been taken by another worker
+        await self.client.eval(RELEASE_LOCK_SCRIPT, 1, f'lock:{key}', token)
+
+    async def _get_members[T](
+            self,
+            key: str,
+            part: str,
+            decode: Callable[[list[bytes]], T],
+            command: Callable[[aioredis.client.Pipeline], ...],
+    ) -> T | None:
+        if local_cache.enabled:
+            value: T | None = local_cache.get(key, part)
+            if value is not None:
+                return value
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.pttl(key)
+            command(pipe)
+            pttl, members = await pipe.execute()
+        return self._decode_members(key, part, pttl, members, decode)
+
+    async def _get_current_members[T](
+            self,
+            name: VersionedName,
+            part: str,
+            decode: Callable[[list[bytes]], T],
+            read: tuple,
+            get: Callable[[str], Awaitable[T | None]],
+    ) -> CurrentRead[T]:
+        generation: int | None = self._local_generation(name)
+        if generation is not None:
+            key: str = name.key(generation)
+            value: T | None = await get(key)
+            return CurrentRead(key, generation, value, None if value is not None else await self.get_missing(key))
+        generation, (pttl, members, raw_reason) = await self._read_current(name, *read)
+        key = name.key(generation)
+        value = self._decode_members(key, part, pttl, members, decode)
+        return CurrentRead(key, generation, value, None if value is not None else self._decode_missing(key, raw_reason))
+
+    async def _read_current(self, name: VersionedName, *arguments) -> tuple[int, list]:
+        """Resolve the current generation of the name and read its key as the ``arguments`` say."""
+        epoch: int = local_cache.epoch
+        raw_generation, *results = await self._read_current_script(
+            keys=[name.generations_key],
+            args=[name.name, name.prefix, *arguments],
+            client=self.client,
+        )
+        generation: int = int(raw_generation)
+        # a generation bumped during the read must not be kept
+        if local_cache.enabled and local_cache.epoch == epoch:
+            local_cache.set(name.generations_key, generation, size=len(raw_generation), part=f"field:{name.name}")
+        return generation, results
+
+    @staticmethod
+    def _local_generation(name: VersionedName) -> int | None:
+        if not local_cache.enabled:
+            return None
+        return local_cache.get(name.generations_key, f"field:{name.name}")
+
+    @staticmethod
+    def _decode_missing(key: str, raw_reason: bytes | None) -> str | None:
+        if raw_reason is None:
+            return None
+        reason: str = raw_reason.decode()
+        if local_cache.enabled:
+            local_cache.set(f'missing:{key}', reason, size=len(raw_reason))
+        return reason
+
+    @staticmethod
+    def _decode_fields[T](
+            key: str,
+            fields: Sequence[str],
+            pttl: int,
+            raw_values: list[bytes | None],
+            decode: Callable[[bytes], T],
+    ) -> list[T | None] | None:
+        """``None`` if the key is chosen to be refreshed before it expires."""
+        if expires_early(pttl):
+            metrics.incr("cache.early_refreshes")
+            return None
+        values: list[T | None] = []
+        for field, raw in zip(fields, raw_values):
+            values.append(None if raw is None else decode(raw))
+            if raw is not None and local_cache.enabled:
+                local_cache.set(key, values[-1], size=len(raw), part=f"field:{field}")
+        return values
+
+    @staticmethod
+    def _decode_members[T](
+            key: str,
+            part: str,
+            pttl: int,
+            members: list[bytes],
+            decode: Callable[[list[bytes]], T],
+    ) -> T | None:
+        # PTTL is -2 for a missing key
+        if pttl == -2:
+            return None
+        if expires_early(pttl):
+            metrics.incr("cache.early_refreshes")
+            return None
+        value: T = decode(members)
+        if local_cache.enabled:
+            local_cache.set(key, value, size=sum(map(len, members)), part=part)
+        return value
+
+    async def get_many(self, keys: Sequence[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        return await self.client.mget(keys)
+
+    def batch(self) -> CacheBatch:
+        return CacheBatch(self.client)
+
+
+cache_client: CacheClient = CacheClient(cache)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import redis
+
+from src.cache.breaker import cache_errors
+from src.cache.client import cache_client
+from src.config import settings
+from src.utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Runs one call per key at a time, the concurrent calls with the same key share its result."""
+
+    def __init__(self):
+        self._flights: dict[str, asyncio.Future] = {}
+
+    async def run[T](self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        flight: asyncio.Future | None = self._flights.get(key)
+        if flight is not None:
+            metrics.incr("cache.fill.coalesced")
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the request running the call was cancelled, so this one runs it instead
+
+        flight = asyncio.get_running_loop().create_future()
+        # the result is retrieved here, so that an error nobody else waited for is not reported
+        flight.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._flights[key] = flight
+        try:
+            result: T = await func()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+
+single_flight: SingleFlight = SingleFlight()
+
+
+async def fill_once[T](
+        key: str,
+        read: Callable[[], Awaitable[T | None]],
+        rebuild: Callable[[], Awaitable[T]],
+) -> T:
+    """Rebuild the missing value of the cache key once for all the concurrent requests.
+
+    The requests of this worker share one call. Across the workers the call holding a short
+    Redis lock runs ``rebuild``, which is expected to write the key, the others ``read`` it
+    once it appears. They rebuild it themselves if it does not appear within the lock wait.
+    """
+    return await single_flight.run(key, lambda: _fill_locked(key, read, rebuild))
+
+
+async def _fill_locked[T](
+        key: str,
+        read: Callable[[], Awaitable[T | None]],
+        rebuild: Callable[[], Awaitable[T]],
+) -> T:
+    try:
+        token: str | None = await cache_client.acquire_lock(key, ttl=settings.cache.lock_ttl)
+    except redis.exceptions.ConnectionError as e:
+        cache_errors.exception(logger, e)
+        return await rebuild()
+
+    if token is None:
+        metrics.incr("cache.fill.lock_waits")
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        deadline: float = loop.time() + settings.cache.lock_wait
+        while loop.time() < deadline:
+            await asyncio.sleep(settings.cache.lock_poll_interval)
+            try:
+                value: T | None = await read()
+            except redis.exceptions.ConnectionError as e:
+                cache_errors.exception(logger, e)
+                break
+            if value is not None:
+                return value
+        return await rebuild()
+
+    metrics.incr("cache.fill.rebuilds")
+    try:
+        return await rebuild()
+    finally:
+        try:
+            await cache_client.release_lock(key, token)
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
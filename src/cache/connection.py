@@ -1,9 +1,20 @@
 import redis.asyncio as aioredis
 
+from src.cache.breaker import BreakerConnection
 from src.config import settings
 
 
 cache: aioredis.Redis = aioredis.from_url(
     url=settings.cache.url,
     max_connections=settings.cache.max_connections,
+    socket_timeout=settings.cache.socket_timeout,
+    socket_connect_timeout=settings.cache.connect_timeout,
+    connection_class=BreakerConnection,
+)
+
+# the invalidations are awaited without a read timeout, so their connection is not in the breaker
+subscriber: aioredis.Redis = aioredis.from_url(
+    url=settings.cache.url,
+    max_connections=1,
+    socket_connect_timeout=settings.cache.connect_timeout,
 )
@@ -0,0 +1,117 @@
+"""Registry of the cache keys of the users' data.
+
+The keys are versioned by generation counters kept in one hash per user. A change of
+the data bumps the generations of the affected names instead of deleting their keys,
+so a value cached by a read that raced with the change is written under the previous
+key and is never read again. The previous keys are left to expire.
+
+A bump that fails, e.g. while the circuit to Redis is open, is retried before the next
+use of the keys, until then the reads of this worker do not use the cache.
+
+The generations are the times of the changes, the data changed within the replica lag
+is read from the primary, so that a stale replica does not fill its new keys.
+"""
+import time
+from typing import Awaitable, Callable, Mapping, NamedTuple
+from uuid import UUID
+
+import redis
+
+from src.cache.breaker import CircuitOpenError
+from src.cache.client import CacheClient, CurrentRead, VersionedName, VersionWrite, cache_client
+from src.config import settings
+from src.database.routing import read_from_primary
+
+
+LOANS_NAME: str = "loans"
+
+
+def loan_name(loan_id: UUID) -> str:
+    return f"loan:{loan_id}"
+
+
+def schedule_name(loan_id: UUID) -> str:
+    # the name changes with the format of the cached schedule
+    return f"loan:{loan_id}.payments:packed"
+
+
+class KeyVersion(NamedTuple):
+    previous: str
+    current: str
+
+
+class CacheKeys:
+    def __init__(self, client: CacheClient):
+        self.client: CacheClient = client
+        self._unbumped: dict[str, set[str]] = {}
+
+    @staticmethod
+    def generations_key(email: str) -> str:
+        return f'user:{email}.generations'
+
+    @staticmethod
+    def prefix(email: str) -> str:
+        return f'user:{email}.'
+
+    @staticmethod
+    def key(email: str, name: str, generation: int) -> str:
+        return f'{CacheKeys.prefix(email)}{name}@{generation}'
+
+    @staticmethod
+    def versioned(email: str, name: str) -> VersionedName:
+        return VersionedName(CacheKeys.generations_key(email), CacheKeys.prefix(email), name)
+
+    async def read_current[T](
+            self,
+            email: str,
+            name: str,
+            read: Callable[[VersionedName], Awaitable[CurrentRead[T]]],
+    ) -> CurrentRead[T]:
+        """Read the current key of the name with one of the ``get_current_*`` reads of the client."""
+        if settings.cache.bypass:
+            raise CircuitOpenError("The cache is bypassed")
+        await self._bump_unbumped()
+        current: CurrentRead[T] = await read(CacheKeys.versioned(email, name))
+        if current.generation > (time.time() - settings.db.replica_lag) * 1_000_000:
+            read_from_primary()
+        return current
+
+    async def bump(
+            self,
+            email: str,
+            *names: str,
+            writes: Mapping[str, VersionWrite] | None = None,
+    ) -> list[KeyVersion]:
+        """Move the names to new keys written with their ``writes``, return their previous and new keys.
+
+        Call it after the change is committed, the values read before it are then unreachable.
+        """
+        try:
+            await self._bump_unbumped()
+            async with self.client.batch() as batch:
+                batch.bump(CacheKeys.generations_key(email), CacheKeys.prefix(email), names, writes)
+                results: list = await batch.execute()
+        except redis.exceptions.ConnectionError:
+            self._unbumped.setdefault(email, set()).update(names)
+            raise
+        return [
+            KeyVersion(CacheKeys.key(email, name, previous), CacheKeys.key(email, name, generation))
+            for name, (previous, generation) in zip(names, results[0])
+        ]
+
+    async def _bump_unbumped(self) -> None:
+        if not self._unbumped:
+            return
+        unbumped: dict[str, set[str]] = self._unbumped
+        self._unbumped = {}
+        try:
+            async with self.client.batch() as batch:
+                for email, names in unbumped.items():
+                    batch.bump(CacheKeys.generations_key(email), CacheKeys.prefix(email), sorted(names))
+        except redis.exceptions.ConnectionError:
+            for email, names in unbumped.items():
+                self._unbumped.setdefault(email, set()).update(names)
+            raise
+
+
+cache_keys: CacheKeys = CacheKeys(cache_client)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any
+
+import redis
+from orjson import orjson
+
+from src.cache.breaker import cache_errors
+from src.cache.connection import subscriber
+from src.config import settings
+from src.utils.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """Per-worker LRU cache of decoded Redis values, bounded by the size of the raw payloads.
+
+    A Redis key may have several local entries, one per ``part`` read from it (e.g. a page),
+    all of them are dropped together when the key is invalidated. ``epoch`` changes on every
+    invalidation, a value read from Redis before it changed may be stale.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, metrics_prefix: str = "cache.local"):
+        self.max_bytes: int = max_bytes
+        self.ttl: float = ttl
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.epoch: int = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[float, int, Any]] = OrderedDict()
+        self._parts: defaultdict[str, set[str]] = defaultdict(set)
+
+        self.metrics_prefix: str = metrics_prefix
+
+        metrics.gauge(f"{metrics_prefix}.bytes", lambda: self.size)
+        metrics.gauge(f"{metrics_prefix}.entries", lambda: len(self._entries))
+        metrics.gauge(f"{metrics_prefix}.hits", lambda: self.hits)
+        metrics.gauge(f"{metrics_prefix}.misses", lambda: self.misses)
+        metrics.gauge(f"{metrics_prefix}.hit_rate", lambda: self.hits / ((self.hits + self.misses) or 1))
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str, part: str = "") -> Any | None:
+        entry: tuple[float, int, Any] | None = self._entries.get((key, part))
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._drop(key, part)
+            self.misses += 1
+            return None
+        self._entries.move_to_end((key, part))
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, size: int, part: str = "") -> None:
+        if size > self.max_bytes:
+            return
+        self._drop(key, part)
+        self._entries[(key, part)] = (time.monotonic() + self.ttl, size, value)
+        self._parts[key].add(part)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._drop(*next(iter(self._entries)))
+            metrics.incr(f"{self.metrics_prefix}.evictions")
+
+    def invalidate(self, *keys: str) -> None:
+        self.epoch += 1
+        for key in keys:
+            for part in self._parts.pop(key, ()):
+                self._drop(key, part)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self._entries.clear()
+        self._parts.clear()
+        self.size = 0
+
+    def _drop(self, key: str, part: str) -> None:
+        entry: tuple[float, int, Any] | None = self._entries.pop((key, part), None)
+        if entry is not None:
+            self.size -= entry[1]
+            if key in self._parts:
+                self._parts[key].discard(part)
+                if not self._parts[key]:
+                    del self._parts[key]
+
+
+local_cache: LocalCache = LocalCache(max_bytes=settings.cache.local_max_bytes, ttl=settings.cache.local_ttl)
+
+
+async def listen_invalidations() -> None:
+    """Drop keys from the local cache when any worker publishes their invalidation."""
+    while True:
+        try:
+            async with subscriber.pubsub() as pubsub:
+                await pubsub.subscribe(settings.cache.invalidation_channel)
+                # entries cached while unsubscribed might have missed invalidations
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        local_cache.invalidate(*orjson.loads(message["data"]))
+                        metrics.incr("cache.local.invalidations")
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
+            local_cache.clear()
+            await asyncio.sleep(1)
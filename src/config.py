@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, Literal
 
 from pydantic import (
     AmqpDsn,
@@ -28,14 +28,28 @@ class AuthSettings(BaseModel):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int = 15
+    hash_executor: Literal["thread", "process"] = "thread"
+    hash_workers: int = 4
+    hash_max_concurrency: int = 4
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 30
 
 
 class DatabaseSettings(BaseModel):
     url: Annotated[str, PostgresDsn]
+    replica_urls: list[Annotated[str, PostgresDsn]] = []
+    replica_balancing: Literal["round_robin", "least_connections"] = "round_robin"
+    # the data changed within this many seconds is read from the primary, see src.cache.keys
+    replica_lag: float = 5
     echo: bool = False
     echo_pool: bool = False
     max_overflow: int = 10
     pool_size: int = 50
+    bulk_insert_batch_size: int = 1000
+    bulk_insert_copy: bool = False
+    query_cache_size: int = 500
+    prepared_statement_cache_size: int = 500
+    stream_batch_size: int = 1000
 
     naming_convention: dict[str, str] = {
         "ix": "ix_%(column_0_label)s",
@@ -49,7 +63,35 @@ class DatabaseSettings(BaseModel):
 class CacheSettings(BaseModel):
     url: Annotated[str, RedisDsn]
     max_connections: int = 10
+    socket_timeout: float = 0.5
+    connect_timeout: float = 0.5
+    failure_threshold: int = 5
+    reset_timeout: float = 5
+    error_log_interval: float = 10
+    # the reads skip the cache, the changes still move its keys, see src.cache.keys
+    bypass: bool = False
     ttl: int = 10 * 60
+    list_chunk_size: int = 100
+    local_max_bytes: int = 0
+    local_ttl: float = 5
+    invalidation_channel: str = "cache:invalidate"
+    ttl_jitter: float = 0.1
+    early_refresh: float = 1
+    lock_ttl: float = 5
+    lock_wait: float = 2
+    lock_poll_interval: float = 0.05
+    negative_ttl: int = 30
+    # must be longer than the ttl of the values, see src.cache.keys
+    generation_ttl: int = 7 * 24 * 60 * 60
+
+
+class ScheduleSettings(BaseModel):
+    batch_max_loans: int = 1000
+    executor: Literal["inline", "process"] = "inline"
+    workers: int = 4
+    chunk_size: int = 50
+    quote_cache_max_bytes: int = 16 * 1024 * 1024
+    quote_cache_ttl: int = 24 * 60 * 60
 
 
 class AmqpSettings(BaseModel):
@@ -59,6 +101,8 @@ class AmqpSettings(BaseModel):
 class PaginationParams(BaseModel):
     offset: int = 0
     limit: int = 100
+    # a page reads and caches the chunks of the list it covers, so its size is bounded
+    max_limit: int = 1000
 
 
 class Settings(BaseSettings):
@@ -72,6 +116,7 @@ class Settings(BaseSettings):
 
     logging: LoggingSettings = LoggingSettings()
     pagination: PaginationParams = PaginationParams()
+    schedule: ScheduleSettings = ScheduleSettings()
     auth: AuthSettings
     db: DatabaseSettings
     cache: CacheSettings
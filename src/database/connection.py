@@ -1,31 +1,77 @@
 from typing import AsyncGenerator
 
+from fastapi import Request
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     AsyncEngine,
     AsyncSession,
 )
+from sqlalchemy.orm import Session
 
 from src.config import settings
+from src.database.instrumentation import (
+    StatementCounter,
+    instrument,
+    instrument_sessions,
+    statement_counter,
+    used_connection,
+)
+from src.database.routing import ReplicaRouter, RoutingSession, primary_reads
+from src.utils.metrics import metrics
 
 
-engine: AsyncEngine = create_async_engine(
-    url=settings.db.url,
-    echo=settings.db.echo,
-    echo_pool=settings.db.echo_pool,
-    max_overflow=settings.db.max_overflow,
-    pool_size=settings.db.pool_size,
-)
+def _create_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url=url,
+        echo=settings.db.echo,
+        echo_pool=settings.db.echo_pool,
+        max_overflow=settings.db.max_overflow,
+        pool_size=settings.db.pool_size,
+        query_cache_size=settings.db.query_cache_size,
+        connect_args={"prepared_statement_cache_size": settings.db.prepared_statement_cache_size},
+    )
+
+
+engine: AsyncEngine = _create_engine(settings.db.url)
+instrument(engine.sync_engine)
+
+replica_engines: list[AsyncEngine] = [_create_engine(url) for url in settings.db.replica_urls]
+for index, replica_engine in enumerate(replica_engines):
+    instrument(replica_engine.sync_engine, prefix=f"db.replica.{index}")
 
 session_maker: async_sessionmaker[AsyncSession] = async_sessionmaker[AsyncSession](
-    bind=engine,
+    sync_session_class=RoutingSession,
+    router=ReplicaRouter(
+        primary=engine.sync_engine,
+        replicas=[replica_engine.sync_engine for replica_engine in replica_engines],
+        balancing=settings.db.replica_balancing,
+    ),
     autocommit=False,
     autoflush=False,
     expire_on_commit=False,
 )
+instrument_sessions(Session)
+
 
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Provide the session of a request.
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
+    The session checks out a connection from the pool only when it runs its first statement
+    and returns it on commit, rollback or close, so requests served from the cache never hold one.
+    Only the sessions of GET requests read from the replicas, the others may read what they change.
+    """
+    # the statements of the request are counted in its context, which the dependency shares
+    counter: StatementCounter = StatementCounter()
+    statement_counter.set(counter)
+    primary_reads.set(False)
     async with session_maker() as session:
-        yield session
+        if request.method not in ("GET", "HEAD"):
+            session.sync_session.info["primary"] = True
+        try:
+            yield session
+        finally:
+            metrics.incr("db.session.requests")
+            if not used_connection(session.sync_session):
+                metrics.incr("db.session.requests_without_db")
+            metrics.observe("db.session.statements", counter.count)
@@ -0,0 +1,71 @@
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.orm import Session
+
+from src.utils.metrics import metrics
+
+
+class StatementCounter:
+    """Number of statements run by one request."""
+
+    def __init__(self):
+        self.count: int = 0
+
+
+statement_counter: ContextVar[StatementCounter | None] = ContextVar("statement_counter", default=None)
+
+
+def _statement_name(context) -> str:
+    # hot statements are named by the repositories, the rest are grouped by their kind
+    name: str | None = context.execution_options.get("statement_name")
+    if name is None:
+        name = context.statement.lstrip().split(" ", 1)[0].lower() if context.statement else "unknown"
+    return name
+
+
+def instrument(engine: Engine, prefix: str = "db") -> None:
+    """Collect the compiled cache hits and misses, the execution time of each statement and the pool usage."""
+    metrics.gauge(f"{prefix}.pool.checked_out", engine.pool.checkedout)
+    compiled_cache: dict[str, int] = {"hits": 0, "misses": 0}
+    metrics.gauge(f"{prefix}.compiled_cache.hits", lambda: compiled_cache["hits"])
+    metrics.gauge(f"{prefix}.compiled_cache.misses", lambda: compiled_cache["misses"])
+    metrics.gauge(
+        f"{prefix}.compiled_cache.hit_rate",
+        lambda: compiled_cache["hits"] / ((compiled_cache["hits"] + compiled_cache["misses"]) or 1),
+    )
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        counter: StatementCounter | None = statement_counter.get()
+        if counter is not None:
+            counter.count += 1
+        if context is not None:
+            # kept on the execution context, so that a failed statement leaves nothing behind
+            context.statement_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        if context is None:
+            return
+        duration: float = time.perf_counter() - context.statement_start
+        if context.cache_hit is CacheStats.CACHE_HIT:
+            compiled_cache["hits"] += 1
+        elif context.cache_hit is CacheStats.CACHE_MISS:
+            compiled_cache["misses"] += 1
+        metrics.observe(f"{prefix}.statement.{_statement_name(context)}.seconds", duration)
+
+
+def instrument_sessions(session_class: type[Session]) -> None:
+    """Mark the sessions that checked out a connection in their ``info``, see ``used_connection``."""
+
+    @event.listens_for(session_class, "after_begin")
+    def after_begin(session, transaction, connection) -> None:
+        session.info["used_connection"] = True
+
+
+def used_connection(session: Session) -> bool:
+    return session.info.get("used_connection", False)
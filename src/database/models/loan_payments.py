@@ -2,7 +2,7 @@ from datetime import date
 from decimal import Decimal
 from uuid import UUID
 
-from sqlalchemy import ForeignKey, Numeric, UniqueConstraint
+from sqlalchemy import ForeignKey, Index, Numeric, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.database.models.base_model import Base, uuid_pk
@@ -25,5 +25,21 @@ class LoanPayment(Base):
 
     __table_args__ = (
         UniqueConstraint("loan_id", "payment_number"),
-        UniqueConstraint("loan_id", "payment_date"),
+        # schedules are read by the loan in the order of dates, the included columns
+        # let these reads be served by an index-only scan
+        Index(
+            "ix_loan_payments_loan_id_payment_date",
+            "loan_id",
+            "payment_date",
+            unique=True,
+            postgresql_include=[
+                "id",
+                "payment_number",
+                "payment_amount",
+                "interest_amount",
+                "principal_amount",
+                "incoming_balance",
+                "remaining_balance",
+            ],
+        ),
     )
@@ -21,5 +21,6 @@ class Loan(Base):
     user_id: Mapped[UUID] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
 
     __table_args__ = (
+        # also serves the lookups of user loans ordered by name, so user_id needs no separate index
         UniqueConstraint("user_id", "name"),
     )
@@ -0,0 +1,63 @@
+import itertools
+from contextvars import ContextVar
+from typing import Iterator, Literal, Sequence
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+# set for the reads of data changed too recently to be on the replicas, see read_from_primary
+primary_reads: ContextVar[bool] = ContextVar("primary_reads", default=False)
+
+
+def read_from_primary() -> None:
+    """Send the following reads of the current request to the primary."""
+    primary_reads.set(True)
+
+
+class ReplicaRouter:
+    """Chooses the engine of a session: the primary or one of the read replicas."""
+
+    def __init__(
+            self,
+            primary: Engine,
+            replicas: Sequence[Engine],
+            balancing: Literal["round_robin", "least_connections"],
+    ):
+        self.primary: Engine = primary
+        self.replicas: Sequence[Engine] = replicas
+        self.balancing: Literal["round_robin", "least_connections"] = balancing
+        self._next_replicas: Iterator[Engine] = itertools.cycle(replicas)
+
+    def replica(self) -> Engine:
+        if self.balancing == "least_connections":
+            return min(self.replicas, key=lambda replica: replica.pool.checkedout())
+        return next(self._next_replicas)
+
+
+class RoutingSession(Session):
+    """Session reading from a replica and writing to the primary.
+
+    A session reads from one replica, so that its reads see the same data. It reads from
+    the primary once it wrote, with ``info["primary"]`` set and while ``primary_reads`` is set.
+    """
+
+    def __init__(self, *args, router: ReplicaRouter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router: ReplicaRouter = router
+
+    def get_bind(self, mapper=None, clause=None, **kwargs) -> Engine:
+        if clause is None or not clause.is_select or self._flushing:
+            # e.g. an INSERT, or a connection for COPY
+            self.info["primary"] = True
+            return self.router.primary
+        if (
+                not self.router.replicas
+                or self.info.get("primary")
+                or primary_reads.get()
+                or getattr(clause, "_for_update_arg", None) is not None
+        ):
+            return self.router.primary
+        if "replica" not in self.info:
+            self.info["replica"] = self.router.replica()
+        return self.info["replica"]
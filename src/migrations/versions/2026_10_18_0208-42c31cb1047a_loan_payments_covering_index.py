@@ -0,0 +1,49 @@
+"""loan payments covering index
+
+Revision ID: 42c31cb1047a
+Revises: f60c33b2f07f
+Create Date: 2026-10-18 02:08:56.531958
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "42c31cb1047a"
+down_revision: Union[str, None] = "f60c33b2f07f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint(
+        "uq_loan_payments_loan_id_payment_date",
+        "loan_payments",
+        type_="unique",
+    )
+    op.create_index(
+        "ix_loan_payments_loan_id_payment_date",
+        "loan_payments",
+        ["loan_id", "payment_date"],
+        unique=True,
+        postgresql_include=[
+            "id",
+            "payment_number",
+            "payment_amount",
+            "interest_amount",
+            "principal_amount",
+            "incoming_balance",
+            "remaining_balance",
+        ],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_loan_payments_loan_id_payment_date", table_name="loan_payments")
+    op.create_unique_constraint(
+        "uq_loan_payments_loan_id_payment_date",
+        "loan_payments",
+        ["loan_id", "payment_date"],
+    )
@@ -1,28 +1,221 @@
-from typing import Sequence
+from typing import AsyncIterator, Sequence
+from uuid import UUID
 
-from sqlalchemy import ScalarResult, select, and_
+from sqlalchemy import Integer, Row, RowMapping, ScalarResult, select, delete, exists, and_, bindparam
+from sqlalchemy.engine import Result
+from sqlalchemy.ext.asyncio import AsyncResult
+from sqlalchemy.orm import load_only
 
 from src.database.models.loan_payments import LoanPayment
 from src.database.models.loans import Loan
 from .sqlalchemy_repository import SqlAlchemyRepository
-from ..database.models import User
+
+
+# the hot statements are built once, so that only their parameters change between the calls
+SELECT_PAYMENTS = (
+    select(LoanPayment)
+    .select_from(LoanPayment)
+    # only the columns of the covering index, so that the schedule is read by an index-only scan
+    .options(
+        load_only(
+            LoanPayment.loan_id,
+            LoanPayment.payment_number,
+            LoanPayment.payment_date,
+            LoanPayment.payment_amount,
+            LoanPayment.interest_amount,
+            LoanPayment.principal_amount,
+            LoanPayment.incoming_balance,
+            LoanPayment.remaining_balance,
+        )
+    )
+    .join(Loan, Loan.id == LoanPayment.loan_id)
+    .where(
+        and_(
+            Loan.user_id == bindparam('user_id'),
+            Loan.id == bindparam('loan_id')
+        )
+    )
+    .order_by(LoanPayment.payment_date)
+    .offset(bindparam('offset', type_=Integer))
+    .limit(bindparam('limit', type_=Integer))
+    .execution_options(statement_name='loan_payments.get_many')
+)
+SELECT_PAYMENTS_AFTER = (
+    SELECT_PAYMENTS
+    .where(LoanPayment.payment_date > bindparam('after'))
+    .execution_options(statement_name='loan_payments.get_many_after')
+)
+SELECT_PAYMENTS_FROM_NUMBER = (
+    select(LoanPayment)
+    .join(Loan, Loan.id == LoanPayment.loan_id)
+    .where(
+        and_(
+            Loan.user_id == bindparam('user_id'),
+            Loan.id == bindparam('loan_id'),
+            LoanPayment.payment_number >= bindparam('payment_number'),
+        )
+    )
+    .order_by(LoanPayment.payment_number)
+    .execution_options(statement_name='loan_payments.get_from_number')
+)
+DELETE_PAYMENTS_BY_NUMBERS = (
+    delete(LoanPayment)
+    .where(
+        and_(
+            LoanPayment.loan_id == bindparam('loan_id'),
+            LoanPayment.payment_number.in_(bindparam('payment_numbers', expanding=True)),
+        )
+    )
+    .execution_options(statement_name='loan_payments.delete_by_numbers')
+)
+# the whole schedule with the loan in one round trip, a loan without a schedule is a row of nulls
+SELECT_SCHEDULE_WITH_LOAN = (
+    select(
+        LoanPayment.id,
+        LoanPayment.loan_id,
+        LoanPayment.payment_number,
+        LoanPayment.payment_date,
+        LoanPayment.payment_amount,
+        LoanPayment.interest_amount,
+        LoanPayment.principal_amount,
+        LoanPayment.incoming_balance,
+        LoanPayment.remaining_balance,
+    )
+    .select_from(Loan)
+    .outerjoin(LoanPayment, LoanPayment.loan_id == Loan.id)
+    .where(
+        and_(
+            Loan.user_id == bindparam('user_id'),
+            Loan.id == bindparam('loan_id')
+        )
+    )
+    .order_by(LoanPayment.payment_date)
+    .execution_options(statement_name='loan_payments.get_with_loan')
+)
+SELECT_SCHEDULE_STATE = (
+    select(
+        exists()
+        .where(and_(Loan.user_id == bindparam('user_id'), Loan.id == bindparam('loan_id')))
+        .label('has_loan'),
+        exists()
+        .where(
+            and_(
+                Loan.user_id == bindparam('user_id'),
+                Loan.id == bindparam('loan_id'),
+                LoanPayment.loan_id == Loan.id,
+            )
+        )
+        .label('has_schedule'),
+    )
+    .execution_options(statement_name='loan_payments.get_state')
+)
+DELETE_SCHEDULE = (
+    delete(LoanPayment)
+    .where(
+        and_(
+            LoanPayment.loan_id == Loan.id,
+            Loan.user_id == bindparam('user_id'),
+            Loan.id == bindparam('loan_id'),
+        )
+    )
+    .returning(LoanPayment.id)
+    .execution_options(statement_name='loan_payments.delete_many')
+)
+SELECT_SCHEDULED_LOAN_IDS = (
+    select(LoanPayment.loan_id)
+    .where(LoanPayment.loan_id.in_(bindparam('loan_ids', expanding=True)))
+    .distinct()
+    .execution_options(statement_name='loan_payments.get_scheduled_loan_ids')
+)
 
 
 class LoanPaymentRepository(SqlAlchemyRepository[LoanPayment]):
     model = LoanPayment
 
     async def get_many(self, **kwargs) -> Sequence[LoanPayment]:
+        params: dict[str, ...] = {
+            'user_id': kwargs.get('user_id'),
+            'loan_id': kwargs.get('loan_id'),
+            'offset': kwargs.get('offset'),
+            'limit': kwargs.get('limit'),
+        }
+        if kwargs.get('after') is not None:
+            payments: ScalarResult = await self.session.scalars(
+                SELECT_PAYMENTS_AFTER,
+                params | {'after': kwargs.get('after')},
+            )
+        else:
+            payments = await self.session.scalars(SELECT_PAYMENTS, params)
+        return payments.all()
+
+    async def get_with_loan(self, **kwargs) -> Sequence[RowMapping]:
+        """Get the whole schedule of the user loan.
+
+        Nothing if there is no loan, a single row of nulls if the loan has no schedule.
+        """
+        payments: Result = await self.session.execute(
+            SELECT_SCHEDULE_WITH_LOAN,
+            {'user_id': kwargs.get('user_id'), 'loan_id': kwargs.get('loan_id')},
+        )
+        return payments.mappings().all()
+
+    async def get_state(self, **kwargs) -> tuple[bool, bool]:
+        """Probe whether the user loan and its schedule exist."""
+        state: Result = await self.session.execute(
+            SELECT_SCHEDULE_STATE,
+            {'user_id': kwargs.get('user_id'), 'loan_id': kwargs.get('loan_id')},
+        )
+        has_loan, has_schedule = state.one()
+        return has_loan, has_schedule
+
+    async def delete_schedule(self, **kwargs) -> Sequence[UUID]:
+        """Delete the schedule of the user loan, return the ids of the deleted payments."""
+        payment_ids: ScalarResult = await self.session.scalars(
+            DELETE_SCHEDULE,
+            {'user_id': kwargs.get('user_id'), 'loan_id': kwargs.get('loan_id')},
+        )
+        return payment_ids.all()
+
+    async def get_from_number(self, **kwargs) -> Sequence[LoanPayment]:
         payments: ScalarResult = await self.session.scalars(
-            select(LoanPayment)
-            .select_from(LoanPayment)
+            SELECT_PAYMENTS_FROM_NUMBER,
+            {
+                'user_id': kwargs.get('user_id'),
+                'loan_id': kwargs.get('loan_id'),
+                'payment_number': kwargs.get('payment_number'),
+            },
+        )
+        return payments.all()
+
+    async def delete_by_numbers(self, **kwargs) -> None:
+        await self.session.execute(
+            DELETE_PAYMENTS_BY_NUMBERS,
+            {'loan_id': kwargs.get('loan_id'), 'payment_numbers': kwargs.get('payment_numbers')},
+        )
+
+    async def stream_many(self, **kwargs) -> AsyncIterator[Sequence[Row]]:
+        """Yield the ``columns`` of the loan schedule ordered by date in partitions read by a server-side cursor.
+
+        Numeric and UUID columns are yielded as strings.
+        """
+        result: AsyncResult = await self.session.stream(
+            select(*self.text_columns(kwargs.get('columns')))
             .join(Loan, Loan.id == LoanPayment.loan_id)
-            .join(User, User.id == Loan.user_id)
             .where(
                 and_(
-                    User.email == kwargs.get('email'),
+                    Loan.user_id == kwargs.get('user_id'),
                     Loan.id == kwargs.get('loan_id')
                 )
             )
             .order_by(LoanPayment.payment_date)
+            .execution_options(yield_per=kwargs.get('batch_size'), statement_name='loan_payments.stream_many')
         )
-        return payments.all()
+        async for partition in result.partitions():
+            yield partition
+
+    async def get_scheduled_loan_ids(self, **kwargs) -> set[UUID]:
+        loan_ids: ScalarResult = await self.session.scalars(
+            SELECT_SCHEDULED_LOAN_IDS,
+            {'loan_ids': kwargs.get('loan_ids')},
+        )
+        return set(loan_ids.all())
@@ -1,72 +1,129 @@
-from typing import Sequence, override, Mapping
+from typing import AsyncIterator, Sequence, override, Mapping
 
-from sqlalchemy import select, delete, update, and_, ScalarResult
+from sqlalchemy import Integer, Row, select, delete, update, and_, bindparam, ScalarResult
+from sqlalchemy.ext.asyncio import AsyncResult
 from src.database.models.loans import Loan
 from .sqlalchemy_repository import SqlAlchemyRepository
-from ..database.models import User
+
+
+# the hot statements are built once, so that only their parameters change between the calls
+SELECT_LOANS = (
+    select(Loan)
+    .where(Loan.user_id == bindparam('user_id'))
+    .order_by(Loan.name)
+    .offset(bindparam('offset', type_=Integer))
+    .limit(bindparam('limit', type_=Integer))
+    .execution_options(statement_name='loans.get_all')
+)
+SELECT_LOANS_AFTER = (
+    SELECT_LOANS
+    .where(Loan.name > bindparam('after'))
+    .execution_options(statement_name='loans.get_all_after')
+)
+SELECT_LOANS_BY_IDS = (
+    select(Loan)
+    .where(
+        and_(
+            Loan.user_id == bindparam('user_id'),
+            Loan.id.in_(bindparam('ids', expanding=True)),
+        )
+    )
+    .execution_options(statement_name='loans.get_many')
+)
+SELECT_LOAN = (
+    select(Loan)
+    .where(
+        and_(
+            Loan.user_id == bindparam('user_id'),
+            Loan.id == bindparam('id')
+        )
+    )
+    .execution_options(statement_name='loans.get')
+)
+DELETE_LOAN = (
+    delete(Loan)
+    .where(
+        and_(
+            Loan.id == bindparam('id'),
+            Loan.user_id == bindparam('user_id'),
+        )
+    )
+    .returning(Loan)
+    .execution_options(statement_name='loans.delete')
+)
+UPDATE_LOAN = (
+    update(Loan)
+    .where(
+        and_(
+            Loan.id == bindparam('loan_id'),
+            Loan.user_id == bindparam('loan_user_id'),
+        )
+    )
+    .returning(Loan)
+    .execution_options(statement_name='loans.update')
+)
 
 
 class LoanRepository(SqlAlchemyRepository[Loan]):
     model = Loan
 
     async def get_all(self, **kwargs) -> Sequence[Loan]:
-        loans: ScalarResult = await self.session.scalars(
-            select(Loan)
-            .select_from(User)
-            .join(Loan, Loan.user_id == User.id)
-            .where(User.email == kwargs.get('email'))
+        params: dict[str, ...] = {
+            'user_id': kwargs.get('user_id'),
+            'offset': kwargs.get('offset'),
+            'limit': kwargs.get('limit'),
+        }
+        if kwargs.get('after') is not None:
+            loans: ScalarResult = await self.session.scalars(
+                SELECT_LOANS_AFTER,
+                params | {'after': kwargs.get('after')},
+            )
+        else:
+            loans = await self.session.scalars(SELECT_LOANS, params)
+        return loans.all()
+
+    async def stream_all(self, **kwargs) -> AsyncIterator[Sequence[Row]]:
+        """Yield the ``columns`` of the user loans ordered by name in partitions read by a server-side cursor.
+
+        Numeric and UUID columns are yielded as strings.
+        """
+        result: AsyncResult = await self.session.stream(
+            select(*self.text_columns(kwargs.get('columns')))
+            .where(Loan.user_id == kwargs.get('user_id'))
             .order_by(Loan.name)
+            .execution_options(yield_per=kwargs.get('batch_size'), statement_name='loans.stream_all')
+        )
+        async for partition in result.partitions():
+            yield partition
+
+    async def get_many(self, **kwargs) -> Sequence[Loan]:
+        loans: ScalarResult = await self.session.scalars(
+            SELECT_LOANS_BY_IDS,
+            {'user_id': kwargs.get('user_id'), 'ids': kwargs.get('ids')},
         )
         return loans.all()
 
     @override
     async def get(self, **kwargs) -> Loan | None:
         loan: ScalarResult = await self.session.scalars(
-            select(Loan)
-            .select_from(Loan)
-            .join(User, Loan.user_id == User.id)
-            .where(
-                and_(
-                    User.email == kwargs.get('email'),
-                    Loan.id == kwargs.get('id')
-                )
-            )
+            SELECT_LOAN,
+            {'user_id': kwargs.get('user_id'), 'id': kwargs.get('id')},
         )
         return loan.one_or_none()
 
     @override
     async def delete(self, **kwargs) -> Loan | None:
         loan: ScalarResult = await self.session.scalars(
-            delete(Loan)
-            .where(
-                and_(
-                    Loan.id == kwargs.get('id'),
-                    Loan.user_id == (
-                        select(User.id)
-                        .select_from(User)
-                        .where(User.email == kwargs.get('email'))
-                    )
-                )
-            )
-            .returning(Loan)
+            DELETE_LOAN,
+            {'user_id': kwargs.get('user_id'), 'id': kwargs.get('id')},
         )
         return loan.one_or_none()
 
     @override
     async def update(self, data: Mapping[str, ...], **kwargs) -> Loan | None:
+        # the criteria parameters are named apart from the columns, which are bound by their names
         loan: ScalarResult = await self.session.scalars(
-            update(Loan)
-            .where(
-                and_(
-                    Loan.id == kwargs.get("id"),
-                    Loan.user_id == (
-                        select(User.id)
-                        .select_from(User)
-                        .where(User.email == kwargs.get('email'))
-                    )
-                )
-            )
-            .values(**data)
-            .returning(Loan)
+            UPDATE_LOAN.values(**data),
+            {'loan_id': kwargs.get('id'), 'loan_user_id': kwargs.get('user_id')},
         )
         return loan.one_or_none()
@@ -1,9 +1,11 @@
 from typing import Mapping, Sequence
 
+import asyncpg
 import sqlalchemy
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 
 from .abstract_repository import AbstractRepository
+from src.config import settings
 from src.database.models.base_model import Base
 
 
@@ -13,6 +15,17 @@ class SqlAlchemyRepository[Model: Base](AbstractRepository):
     def __init__(self, session: AsyncSession):
         self.session: AsyncSession = session
 
+    def text_columns(self, columns: Sequence[str]) -> list[sqlalchemy.ColumnElement]:
+        """The columns of the model, numeric and UUID ones read as their exact text.
+
+        The rows are then written out as they are, without decimals and the UUIDs of the driver.
+        """
+        return [
+            sqlalchemy.cast(column, sqlalchemy.String).label(column.key)
+            if isinstance(column.type, (sqlalchemy.Numeric, sqlalchemy.Uuid)) else column
+            for column in (getattr(self.model, name) for name in columns)
+        ]
+
     async def create(self, **kwargs) -> Model:
         instance: Model = self.model(**kwargs)
         self.session.add(instance)
@@ -60,8 +73,83 @@ class SqlAlchemyRepository[Model: Base](AbstractRepository):
 
     async def create_many(
             self,
-            entities: Sequence[Model]
-    ) -> Sequence[Model]:
-        self.session.add_all(entities)
-        await self.session.flush()
-        return entities
+            entities: Sequence[Model] | Sequence[Mapping[str, ...]] | Sequence[Sequence],
+            columns: Sequence[str] | None = None,
+            copy: bool = False,
+            returning: bool = True,
+    ) -> Sequence[Model] | Sequence[Mapping[str, ...]]:
+        """Insert many rows at once.
+
+        ORM instances go through the unit of work as before. Plain rows (mappings, or sequences
+        ordered as ``columns``) skip it: they are inserted with a batched ``INSERT ... RETURNING``,
+        or with PostgreSQL ``COPY`` when ``copy`` is set, and come back as column mappings.
+        Without ``returning`` the plain rows are inserted without reading them back, nothing is returned.
+        """
+        if not entities:
+            return []
+        if isinstance(entities[0], self.model):
+            self.session.add_all(entities)
+            await self.session.flush()
+            return entities
+
+        if copy:
+            if isinstance(entities[0], Mapping):
+                columns = list(entities[0])
+                entities = [[entity[column] for column in columns] for entity in entities]
+            copied: Sequence[Mapping[str, ...]] = await self._copy_rows(columns, entities)
+            return copied if returning else []
+        if not isinstance(entities[0], Mapping):
+            entities = [dict(zip(columns, entity)) for entity in entities]
+        return await self._insert_rows(entities, returning=returning)
+
+    async def _insert_rows(
+            self,
+            rows: Sequence[Mapping[str, ...]],
+            returning: bool = True,
+    ) -> Sequence[Mapping[str, ...]]:
+        table: sqlalchemy.Table = self.model.__table__
+        if not returning:
+            # an executemany of the driver, the rows are not sent back
+            await self.session.execute(sqlalchemy.insert(table), rows)
+            return []
+        result: sqlalchemy.CursorResult = await self.session.execute(
+            sqlalchemy
+            .insert(table)
+            .returning(*table.columns, sort_by_parameter_order=True)
+            .execution_options(insertmanyvalues_page_size=settings.db.bulk_insert_batch_size),
+            rows,
+        )
+        return result.mappings().all()
+
+    async def _copy_rows(self, columns: Sequence[str], rows: Sequence[Sequence]) -> Sequence[Mapping[str, ...]]:
+        table: sqlalchemy.Table = self.model.__table__
+        # COPY bypasses SQLAlchemy, so python-side column defaults (e.g. uuid4 primary keys) are applied here
+        defaults: dict[str, sqlalchemy.ColumnDefault] = {
+            column.key: column.default
+            for column in table.columns
+            if column.key not in columns and column.default is not None and not column.default.is_sequence
+        }
+        columns = [*columns, *defaults]
+        records: list[tuple] = [
+            (
+                *row,
+                *(default.arg(None) if default.is_callable else default.arg for default in defaults.values()),
+            )
+            for row in rows
+        ]
+
+        connection: AsyncConnection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        if not raw_connection.driver_connection.is_in_transaction():
+            # the asyncpg dialect opens the transaction lazily on the first statement,
+            # so run one to keep COPY inside the session transaction
+            await connection.execute(sqlalchemy.select(1))
+        try:
+            await raw_connection.driver_connection.copy_records_to_table(
+                table.name,
+                records=records,
+                columns=columns,
+            )
+        except asyncpg.exceptions.IntegrityConstraintViolationError as e:
+            raise sqlalchemy.exc.IntegrityError(f"COPY {table.name}", None, e)
+        return [dict(zip(columns, record)) for record in records]
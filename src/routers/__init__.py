@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 
+from src.routers.metrics import router as metrics_router
 from src.routers.v1 import v1_router
 
 
 root_router = APIRouter(prefix="/api")
 
 root_router.include_router(v1_router)
+root_router.include_router(metrics_router)
@@ -1,2 +1,2 @@
-from src.auth.authenticate import authenticate
+from src.auth.authenticate import authenticate, oauth2_scheme
 from src.database.connection import get_session
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from src.utils.metrics import metrics
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/", response_model=dict[str, float])
+async def get_metrics() -> dict[str, float]:
+    return metrics.snapshot()
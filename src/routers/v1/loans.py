@@ -1,16 +1,28 @@
-from typing import Annotated
+from datetime import date
+from typing import Annotated, AsyncIterator
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, Path, Query, Body, status
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..dependencies import get_session, authenticate
 from src.config import settings
 from src.database.models.loans import Loan
 from src.schemas.loans import LoanCreate, LoanRead, LoanUpdate
-from src.schemas.loan_payments import LoanPaymentCreate, LoanPaymentRead
+from src.schemas.loan_payments import (
+    LoanPaymentCreate,
+    LoanPaymentQuote,
+    LoanPaymentRead,
+    ScheduleAmendment,
+    ScheduleBatchItem,
+    ScheduleBatchResult,
+    ScheduleQuote,
+)
+from src.schemas.token import TokenData
 from src.services.loans import LoanService
 from src.services.loan_payments import LoanPaymentService
+from src.utils.export import ExportFormat
 
 
 router = APIRouter(prefix="/loans", tags=["loans"])
@@ -19,34 +31,91 @@ router = APIRouter(prefix="/loans", tags=["loans"])
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=LoanRead)
 async def create_loan(
         loan_data: Annotated[LoanCreate, Body()],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
 ) -> LoanRead:
     loan_service: LoanService = LoanService()
-    new_loan: LoanRead = await loan_service.create_loan(session=session, email=email, loan_data=loan_data)
+    new_loan: LoanRead = await loan_service.create_loan(
+        session=session,
+        email=user.email,
+        user_id=user.user_id,
+        loan_data=loan_data,
+    )
     return new_loan
 
 
 @router.get("/", response_model=list[LoanRead])
 async def get_all_loans(
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
-        limit: Annotated[int, Query] = settings.pagination.limit,
-        offset: Annotated[int, Query] = settings.pagination.offset,
+        limit: Annotated[int, Query(ge=0, le=settings.pagination.max_limit)] = settings.pagination.limit,
+        offset: Annotated[int, Query(ge=0)] = settings.pagination.offset,
+        after: Annotated[str | None, Query(description="Name of the last loan of the previous page")] = None,
 ) -> list[LoanRead]:
     loan_service: LoanService = LoanService()
-    loans: list[LoanRead] = await loan_service.get_all_loans(session=session, email=email)
-    return loans[offset:offset+limit]
+    loans: list[LoanRead] = await loan_service.get_all_loans(
+        session=session,
+        email=user.email,
+        user_id=user.user_id,
+        limit=limit,
+        offset=offset,
+        after=after,
+    )
+    return loans
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_loans(
+        user: Annotated[TokenData, Depends(authenticate)],
+        export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    loan_service: LoanService = LoanService()
+    return StreamingResponse(
+        loan_service.export_loans(user_id=user.user_id, export_format=export_format),
+        media_type=export_format.media_type,
+    )
+
+
+@router.post("/quote", response_model=list[LoanPaymentQuote])
+async def quote_schedule(
+        quote: Annotated[ScheduleQuote, Body()],
+        user: Annotated[TokenData, Depends(authenticate)],
+) -> Response:
+    payment_service: LoanPaymentService = LoanPaymentService()
+    loan_schedule: bytes = await payment_service.quote_schedule(quote=quote)
+    # the quote is already serialized as list[LoanPaymentQuote], so skip the response model round trip
+    return Response(content=loan_schedule, media_type="application/json")
+
+
+@router.post("/payments", response_model=list[ScheduleBatchResult])
+async def create_schedules(
+        items: Annotated[list[ScheduleBatchItem], Body(max_length=settings.schedule.batch_max_loans)],
+        user: Annotated[TokenData, Depends(authenticate)],
+        session: Annotated[AsyncSession, Depends(get_session)],
+) -> list[ScheduleBatchResult]:
+    payment_service: LoanPaymentService = LoanPaymentService()
+    results: list[ScheduleBatchResult] = await payment_service.create_schedules(
+        session=session,
+        email=user.email,
+        user_id=user.user_id,
+        items=items,
+    )
+    return results
 
 
 @router.get("/{loan_id}", response_model=LoanRead)
 async def get_loan(
         loan_id: Annotated[UUID, Path()],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
 ) -> LoanRead:
     loan_service: LoanService = LoanService()
-    loan: LoanRead = await loan_service.get_loan(session=session, loan_id=loan_id, email=email)
+    loan: LoanRead = await loan_service.get_loan(
+        session=session,
+        loan_id=loan_id,
+        email=user.email,
+        user_id=user.user_id,
+    )
     return loan
 
 
@@ -54,10 +123,15 @@ async def get_loan(
 async def delete_loan(
         loan_id: Annotated[UUID, Path()],
         session: Annotated[AsyncSession, Depends(get_session)],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
 ) -> dict[str, str]:
     loan_service: LoanService = LoanService()
-    loan: Loan = await loan_service.delete_loan(session=session, loan_id=loan_id, email=email)
+    loan: Loan = await loan_service.delete_loan(
+        session=session,
+        loan_id=loan_id,
+        email=user.email,
+        user_id=user.user_id,
+    )
     return {"message": f"The loan with name {loan.name} was deleted successfully"}
 
 
@@ -65,14 +139,15 @@ async def delete_loan(
 async def update_loan(
         loan_id: Annotated[UUID, Path()],
         loan_data: Annotated[LoanUpdate, Body()],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
 ) -> LoanRead:
     loan_service: LoanService = LoanService()
     loan: LoanRead = await loan_service.update_loan(
         session=session,
         loan_id=loan_id,
-        email=email,
+        email=user.email,
+        user_id=user.user_id,
         data=loan_data,
     )
     return loan
@@ -82,7 +157,7 @@ async def update_loan(
 async def create_schedule(
         loan_id: Annotated[UUID, Path()],
         payments: list[LoanPaymentCreate],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
         limit: Annotated[int, Query] = settings.pagination.limit,
         offset: Annotated[int, Query] = settings.pagination.offset,
@@ -91,40 +166,83 @@ async def create_schedule(
     loan_schedule: list[LoanPaymentRead] = await payment_service.create_schedule(
         session=session,
         loan_id=loan_id,
-        email=email,
+        email=user.email,
+        user_id=user.user_id,
         payments=payments,
     )
     return loan_schedule[offset:offset+limit]
 
 
+@router.patch("/{loan_id}/payments", response_model=list[LoanPaymentRead])
+async def amend_schedule(
+        loan_id: Annotated[UUID, Path()],
+        amendment: Annotated[ScheduleAmendment, Body()],
+        user: Annotated[TokenData, Depends(authenticate)],
+        session: Annotated[AsyncSession, Depends(get_session)],
+) -> list[LoanPaymentRead]:
+    payment_service: LoanPaymentService = LoanPaymentService()
+    loan_schedule: list[LoanPaymentRead] = await payment_service.amend_schedule(
+        session=session,
+        loan_id=loan_id,
+        email=user.email,
+        user_id=user.user_id,
+        amendment=amendment,
+    )
+    return loan_schedule
+
+
 @router.get("/{loan_id}/payments", response_model=list[LoanPaymentRead])
 async def get_schedule(
         loan_id: Annotated[UUID, Path()],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
-        limit: Annotated[int, Query] = settings.pagination.limit,
-        offset: Annotated[int, Query] = settings.pagination.offset,
-) -> list[LoanPaymentRead]:
+        limit: Annotated[int, Query(ge=0, le=settings.pagination.max_limit)] = settings.pagination.limit,
+        offset: Annotated[int, Query(ge=0)] = settings.pagination.offset,
+        after: Annotated[date | None, Query(description="Date of the last payment of the previous page")] = None,
+) -> Response:
     payment_service: LoanPaymentService = LoanPaymentService()
-    loan_schedule: list[LoanPaymentRead] = await payment_service.get_schedule(
+    loan_schedule: bytes = await payment_service.get_schedule(
         session=session,
         loan_id=loan_id,
-        email=email,
+        email=user.email,
+        user_id=user.user_id,
+        limit=limit,
+        offset=offset,
+        after=after,
     )
-    return loan_schedule[offset:offset+limit]
+    # the page is already serialized as list[LoanPaymentRead], so skip the response model round trip
+    return Response(content=loan_schedule, media_type="application/json")
+
+
+@router.get("/{loan_id}/payments/export", response_class=StreamingResponse)
+async def export_schedule(
+        loan_id: Annotated[UUID, Path()],
+        user: Annotated[TokenData, Depends(authenticate)],
+        session: Annotated[AsyncSession, Depends(get_session)],
+        export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    payment_service: LoanPaymentService = LoanPaymentService()
+    loan_schedule: AsyncIterator[bytes] = await payment_service.export_schedule(
+        session=session,
+        loan_id=loan_id,
+        user_id=user.user_id,
+        export_format=export_format,
+    )
+    return StreamingResponse(loan_schedule, media_type=export_format.media_type)
 
 
 @router.delete("/{loan_id}/payments", response_model=dict[str, str])
 async def delete_schedule(
         loan_id: Annotated[UUID, Path()],
-        email: Annotated[str, Depends(authenticate)],
+        user: Annotated[TokenData, Depends(authenticate)],
         session: Annotated[AsyncSession, Depends(get_session)],
 ) -> dict[str, str]:
     payment_service: LoanPaymentService = LoanPaymentService()
     await payment_service.delete_schedule(
         session=session,
         loan_id=loan_id,
-        email=email,
+        email=user.email,
+        user_id=user.user_id,
     )
     return {"message": "The schedule for the loan was deleted successfully"}
 
@@ -4,12 +4,12 @@ from fastapi import APIRouter, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.auth.jwt_handler import create_access_token
+from src.auth.jwt_handler import create_access_token, revoke_access_token
 from src.database.models.users import User
-from src.schemas.token import Token
+from src.schemas.token import Token, TokenData
 from src.schemas.users import UserRead, UserCreate
 from src.services.users import UserService
-from ..dependencies import get_session
+from ..dependencies import get_session, authenticate, oauth2_scheme
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -36,5 +36,14 @@ async def login(
 ) -> Token:
     user_service: UserService = UserService()
     user: User = await user_service.login(session=session, user_form=user_form)
-    access_token: str = create_access_token(user.email)
+    access_token: str = create_access_token(user.email, user.id)
     return Token(access_token=access_token)
+
+
+@router.post("/logout", response_model=dict[str, str])
+async def logout(
+        token: Annotated[str, Depends(oauth2_scheme)],
+        user: Annotated[TokenData, Depends(authenticate)],
+) -> dict[str, str]:
+    await revoke_access_token(token, user)
+    return {"message": "The access token was revoked successfully"}
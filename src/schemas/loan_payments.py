@@ -5,6 +5,8 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field, ConfigDict
 
+from src.schemas.loans import LoanCreate
+
 
 type BillionDecimal = Annotated[Decimal, Field(gt=0, max_digits=12, decimal_places=2)]
 
@@ -34,3 +36,44 @@ class LoanPaymentRead(LoanPaymentBase):
     principal_amount: BillionDecimal
     incoming_balance: BillionDecimal
     remaining_balance: Annotated[Decimal, Field(ge=0, max_digits=12, decimal_places=2)]
+
+
+class LoanPaymentQuote(LoanPaymentBase):
+    payment_number: int
+    payment_date: date
+    payment_amount: BillionDecimal
+    interest_amount: Annotated[Decimal, Field(ge=0, max_digits=12, decimal_places=2)]
+    principal_amount: BillionDecimal
+    incoming_balance: BillionDecimal
+    remaining_balance: Annotated[Decimal, Field(ge=0, max_digits=12, decimal_places=2)]
+
+
+class ScheduleQuote(BaseModel):
+    loan: LoanCreate
+    payments: list[LoanPaymentCreate] = []
+
+
+class ScheduleBatchItem(BaseModel):
+    loan_id: UUID
+    payments: list[LoanPaymentCreate] = []
+
+
+class ScheduleBatchResult(BaseModel):
+    loan_id: UUID
+    status_code: int
+    payments_count: int = 0
+    detail: str | None = None
+
+
+class ScheduleAmendment(BaseModel):
+    from_payment_number: Annotated[int, Field(ge=1)]
+    payments: list[LoanPaymentCreate] = []
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "from_payment_number": 3,
+                "payments": [{"payment_date": "2024-03-31", "payment_amount": 150000.00}],
+            }
+        }
+    )
@@ -1,6 +1,14 @@
+from uuid import UUID
+
 from pydantic import BaseModel
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+
+
+class TokenData(BaseModel):
+    email: str
+    user_id: UUID
+    expires_at: int
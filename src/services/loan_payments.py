@@ -1,9 +1,10 @@
+import hashlib
 import logging
-from calendar import monthrange, isleap
+from datetime import date
 from decimal import Decimal
-from typing import Sequence
-from datetime import date, timedelta
-from uuid import UUID
+from functools import partial
+from typing import AsyncIterator, Callable, Iterable, Mapping, Sequence
+from uuid import UUID, uuid4
 
 import redis
 from sqlalchemy.exc import IntegrityError
@@ -11,250 +12,574 @@ from fastapi import HTTPException, status
 from orjson import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.cache.connection import cache
+from src.cache.breaker import cache_errors
+from src.cache.client import CurrentRead, VersionWrite, cache_client
+from src.cache.coalesce import fill_once
+from src.cache.keys import cache_keys, schedule_name
+from src.cache.local import LocalCache
 from src.config import settings
+from src.database.connection import session_maker
 from src.database.models import LoanPayment
 from src.database.models.loans import Loan
 from src.repositories.loans import LoanRepository
 from src.repositories.loan_payments import LoanPaymentRepository
-from src.schemas.loan_payments import LoanPaymentCreate, LoanPaymentRead
-from src.utils.serialization import orjson_default
+from src.schemas.loan_payments import (
+    LoanPaymentCreate,
+    LoanPaymentQuote,
+    LoanPaymentRead,
+    ScheduleAmendment,
+    ScheduleBatchItem,
+    ScheduleBatchResult,
+    ScheduleQuote,
+)
+from src.utils.amortization import CENT, SCHEDULE_COLUMNS, Schedule, ScheduleError, compute_schedule_tail
+from src.utils.schedule_executor import ScheduleInput, schedule_executor
+from src.utils.export import ExportFormat, encode_rows
+from src.utils.metrics import metrics
+from src.utils.schedule_packing import pack_payment, render_payments
+from src.utils.serialization import dumps, join_json_array
 
 
 logger = logging.getLogger(__name__)
 
+# quotes depend only on their inputs, so they are kept until evicted or expired
+quote_cache: LocalCache = LocalCache(
+    max_bytes=settings.schedule.quote_cache_max_bytes,
+    ttl=settings.schedule.quote_cache_ttl,
+    metrics_prefix="schedule.quote_cache",
+)
+
 
 class LoanPaymentService:
 
     @staticmethod
-    def _create_schedule(
+    def _schedule_members(schedule: Iterable[Mapping[str, ...]]) -> dict[bytes, float]:
+        # one packed sorted set member per payment, scored by the payment date for range reads
+        return {pack_payment(payment): payment["payment_date"].toordinal() for payment in schedule}
+
+    @staticmethod
+    def _schedule_input(
             payments: list[LoanPaymentCreate],
             loan: Loan
-    ) -> list[LoanPayment]:
-
-        def get_next_date(actual_date: date) -> date:
-            cur_month_days = monthrange(actual_date.year, actual_date.month)[1]
-            next_date = actual_date + timedelta(days=cur_month_days)
-            return next_date
-
-        schedule: list[LoanPayment] = []
-
-        rate = Decimal(loan.interest_rate_percent) / 100
-        loan_term = loan.loan_term
-        loan_amount = Decimal(loan.loan_amount)
-
-        monthly_interest = rate / 12
-        default_payment_amount = loan_amount * (
-                monthly_interest * (1 + monthly_interest) ** loan_term) / (
-                                         (1 + monthly_interest) ** loan_term - 1
-                                 )
-        default_payment_amount = round(default_payment_amount, 2)
-
-        if payments:
-            payments.sort(key=lambda x: x.payment_date)
-            if loan.start_date > payments[0].payment_date:
-                raise HTTPException(
-                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                    detail='The date of payment can not be earlier than the date of creating the loan'
-                )
+    ) -> ScheduleInput:
+        return ScheduleInput(
+            loan_amount=loan.loan_amount,
+            interest_rate_percent=loan.interest_rate_percent,
+            loan_term=loan.loan_term,
+            start_date=loan.start_date,
+            payments=[(payment.payment_date, payment.payment_amount) for payment in payments],
+        )
 
-        if len(payments) < loan_term:
-            previous_date = loan.start_date
-            for index in range(loan_term):
-                try:
-                    payment = payments[index]
-                    if payment.payment_amount is None:
-                        payment.payment_amount = default_payment_amount
-                    previous_date = payment.payment_date
-                except IndexError:
-                    current_date = get_next_date(previous_date)
-                    payments.append(
-                        LoanPaymentCreate(payment_date=current_date, payment_amount=default_payment_amount)
-                    )
-                    previous_date = current_date
-
-        elif len(payments) > loan_term:
+    @staticmethod
+    async def _create_schedule(
+            payments: list[LoanPaymentCreate],
+            loan: Loan
+    ) -> list[dict[str, ...]]:
+        try:
+            schedule: Schedule = await schedule_executor.compute(
+                LoanPaymentService._schedule_input(payments=payments, loan=loan)
+            )
+        except ScheduleError as e:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail='The quantity of given payments can not be greater than "loan_term" value of the loan'
+                detail=str(e),
             )
+        return [{"loan_id": loan.id, **row} for row in schedule.rows()]
 
-        previous_date = loan.start_date
-        remaining_balance = loan_amount
-
-        for payment_number, payment in enumerate(payments, 1):
-            if remaining_balance == 0:
-                break
-
-            current_date = payment.payment_date
-            payment_amount = payment.payment_amount
-            incoming_balance = remaining_balance
-
-            period_data = {
-                "loan_id": loan.id,
-                "payment_number": payment_number,
-                "payment_date": current_date,
-                "incoming_balance": incoming_balance,
-            }
-
-            # evaluate the part of the year for the interest amount calculation
-            current_date_year_days = 366 if isleap(current_date.year) else 365
-            if current_date.year != previous_date.year:
-                previous_date_year_days = 366 if isleap(previous_date.year) else 365
-                prev_year_part = Decimal(
-                    monthrange(previous_date.year, previous_date.month)[1] - previous_date.day
-                ) / previous_date_year_days
-
-                cur_year_part = Decimal(current_date.day / current_date_year_days)
-                year_part = prev_year_part + cur_year_part
-            else:
-                year_part = Decimal((current_date - previous_date).days) / current_date_year_days
-
-            interest_amount = round(incoming_balance * rate * year_part, 2)
+    @staticmethod
+    def _quote_key(schedule_input: ScheduleInput) -> str:
+        # equal inputs written differently, e.g. 10.75 and 10.7500, share the key
+        canonical: tuple = (
+            str(Decimal(schedule_input["loan_amount"]).quantize(CENT)),
+            str(Decimal(schedule_input["interest_rate_percent"]).normalize()),
+            schedule_input["loan_term"],
+            schedule_input["start_date"].isoformat(),
+            # the dates are not validated yet, a payment without one fails the computation after the lookup
+            sorted(
+                (
+                    (
+                        None if payment_date is None else payment_date.isoformat(),
+                        None if amount is None else str(Decimal(amount).quantize(CENT)),
+                    )
+                    for payment_date, amount in schedule_input["payments"]
+                ),
+                key=lambda payment: payment[0] or "",
+            ),
+        )
+        return hashlib.sha256(orjson.dumps(canonical)).hexdigest()
 
-            if interest_amount > payment_amount:
-                raise HTTPException(
-                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                    detail=f"The amount of interest can not be greater than the payment amount."
-                           f"The payment for the date {current_date} is {payment_amount}, while "
-                           f"the amount of interest for this payment is {interest_amount}"
-                )
+    @staticmethod
+    async def quote_schedule(quote: ScheduleQuote) -> bytes:
+        """Return the schedule of an unsaved loan as a JSON array of ``LoanPaymentQuote``."""
+        schedule_input: ScheduleInput = ScheduleInput(
+            loan_amount=quote.loan.loan_amount,
+            interest_rate_percent=quote.loan.interest_rate_percent,
+            loan_term=quote.loan.loan_term,
+            start_date=quote.loan.start_date,
+            payments=[(payment.payment_date, payment.payment_amount) for payment in quote.payments],
+        )
+        key: str = LoanPaymentService._quote_key(schedule_input)
+        if quote_cache.enabled:
+            cached_quote: bytes | None = quote_cache.get(key)
+            if cached_quote is not None:
+                return cached_quote
 
-            if (payment_amount > interest_amount + incoming_balance) or (payment_number == loan_term):
-                payment_amount = interest_amount + incoming_balance
-
-            principal_amount = payment_amount - interest_amount
-            remaining_balance = incoming_balance - principal_amount
-
-            period_data.update(
-                {
-                    "payment_amount": payment_amount,
-                    "interest_amount": interest_amount,
-                    "principal_amount": principal_amount,
-                    "remaining_balance": remaining_balance,
-                    "year_part": year_part,
-                    "days_in_year": current_date_year_days
-                }
+        try:
+            schedule: Schedule = await schedule_executor.compute(schedule_input)
+        except ScheduleError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e),
             )
-            schedule.append(LoanPayment(**period_data))
-            previous_date = current_date
-        return schedule
+        json_quote: bytes = dumps(
+            [{field: row[field] for field in LoanPaymentQuote.model_fields} for row in schedule.rows()]
+        )
+        if quote_cache.enabled:
+            quote_cache.set(key, json_quote, size=len(json_quote))
+        return json_quote
 
     @staticmethod
     async def create_schedule(
         session: AsyncSession,
         loan_id: UUID,
         email: str,
+        user_id: UUID,
         payments: list[LoanPaymentCreate],
     ) -> list[LoanPaymentRead]:
         payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
         loan_repo: LoanRepository = LoanRepository(session=session)
 
-        loan: Loan = await loan_repo.get(email=email, id=loan_id)
+        loan: Loan = await loan_repo.get(user_id=user_id, id=loan_id)
         if not loan:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="The loan with supplied ID doesn't exist"
             )
 
-        # check if schedule for the loan already exists
-        loan_payments: Sequence[LoanPayment] = await payment_repo.get_many(email=email, loan_id=loan_id)
-        if loan_payments:
+        schedule: list[dict[str, ...]] = await LoanPaymentService._create_schedule(payments=payments, loan=loan)
+        try:
+            db_schedule: Sequence[Mapping[str, ...]] = await payment_repo.create_many(schedule)
+        except IntegrityError as e:
+            # the dates of a schedule are unique, so the unique payment numbers of the loan
+            # detect an existing schedule without probing for it, also one created concurrently
+            logger.exception(e.args)
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="The schedule for the loan with supplied ID already exists"
             )
+        await session.commit()
 
-        schedule: list[LoanPayment] = LoanPaymentService._create_schedule(payments=payments, loan=loan)
+        # redis set key with schedule
+        loan_schedule: list[LoanPaymentRead] = [LoanPaymentRead(**payment) for payment in db_schedule]
         try:
-            db_schedule: Sequence[LoanPayment] = await payment_repo.create_many(schedule)
+            members: dict[bytes, float] = LoanPaymentService._schedule_members(db_schedule)
+            await cache_keys.bump(
+                email, schedule_name(loan_id), writes={schedule_name(loan_id): VersionWrite.set_sorted(members)},
+            )
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
+        return loan_schedule
+
+    @staticmethod
+    async def create_schedules(
+            session: AsyncSession,
+            email: str,
+            user_id: UUID,
+            items: list[ScheduleBatchItem],
+    ) -> list[ScheduleBatchResult]:
+        payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
+        loan_repo: LoanRepository = LoanRepository(session=session)
+
+        loan_ids: list[UUID] = list(dict.fromkeys(item.loan_id for item in items))
+        loans: dict[UUID, Loan] = {loan.id: loan for loan in await loan_repo.get_many(user_id=user_id, ids=loan_ids)}
+        scheduled_loan_ids: set[UUID] = await payment_repo.get_scheduled_loan_ids(loan_ids=list(loans))
+
+        results: list[ScheduleBatchResult | None] = []
+        pending: dict[int, Loan] = {}
+        processed_loan_ids: set[UUID] = set()
+        for item in items:
+            loan: Loan | None = loans.get(item.loan_id)
+            if item.loan_id in processed_loan_ids:
+                results.append(ScheduleBatchResult(
+                    loan_id=item.loan_id,
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="The loan with supplied ID is repeated in the request",
+                ))
+                continue
+            processed_loan_ids.add(item.loan_id)
+            if not loan:
+                results.append(ScheduleBatchResult(
+                    loan_id=item.loan_id,
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="The loan with supplied ID doesn't exist",
+                ))
+                continue
+            if loan.id in scheduled_loan_ids:
+                results.append(ScheduleBatchResult(
+                    loan_id=item.loan_id,
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The schedule for the loan with supplied ID already exists",
+                ))
+                continue
+            # the result is filled in once all the schedules of the batch are computed
+            pending[len(results)] = loan
+            results.append(None)
+
+        schedules: list[Schedule | ScheduleError] = await schedule_executor.compute_many([
+            LoanPaymentService._schedule_input(payments=items[index].payments, loan=loan)
+            for index, loan in pending.items()
+        ])
+        rows: list[dict[str, ...]] = []
+        schedule_members: dict[UUID, dict[bytes, float]] = {}
+        for (index, loan), schedule in zip(pending.items(), schedules):
+            if isinstance(schedule, ScheduleError):
+                results[index] = ScheduleBatchResult(
+                    loan_id=loan.id,
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=str(schedule),
+                )
+                continue
+
+            loan_rows: list[dict[str, ...]] = [{"id": uuid4(), "loan_id": loan.id, **row} for row in schedule.rows()]
+            rows.extend(loan_rows)
+            schedule_members[loan.id] = LoanPaymentService._schedule_members(loan_rows)
+            results[index] = ScheduleBatchResult(
+                loan_id=loan.id,
+                status_code=status.HTTP_201_CREATED,
+                payments_count=len(loan_rows),
+            )
+
+        if not rows:
+            return results
+
+        try:
+            # the results were built from the rows, they are not read back
+            await payment_repo.create_many(rows, copy=settings.db.bulk_insert_copy, returning=False)
         except IntegrityError as e:
             logger.exception(e.args)
             raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail='There are repetitions among the transmitted dates. Each payment date must be unique.',
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Schedules for some of the supplied loans were created concurrently, retry the request",
             )
         await session.commit()
 
-        # redis set key with schedule
-        loan_schedule: list[LoanPaymentRead] = []
-        raw_schedule: list[dict[str, ...]] = []
-        for payment in db_schedule:
-            payment_read: LoanPaymentRead = LoanPaymentRead(**payment.__dict__)
-            loan_schedule.append(payment_read)
-            raw_schedule.append(payment_read.model_dump())
-
-        json_schedule: bytes = orjson.dumps(raw_schedule, default=orjson_default)
         try:
-            await cache.set(f'user:{email}.loan:{loan_id}.payments', json_schedule, ex=settings.cache.ttl)
+            await cache_keys.bump(
+                email,
+                *map(schedule_name, schedule_members),
+                writes={
+                    schedule_name(schedule_loan_id): VersionWrite.set_sorted(members)
+                    for schedule_loan_id, members in schedule_members.items()
+                },
+            )
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
-        return loan_schedule
+            cache_errors.exception(logger, e)
+        return results
 
     @staticmethod
-    async def get_schedule(session: AsyncSession, loan_id: UUID, email: str) -> list[LoanPaymentRead]:
-        try:
-            cached_schedule: bytes = await cache.get(f'user:{email}.loan:{loan_id}.payments')
-            if cached_schedule:
-                raw_payments: list[dict[str, ...]] = orjson.loads(cached_schedule)
-                loan_schedule = [LoanPaymentRead(**pay) for pay in raw_payments]
-                return loan_schedule
-        except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+    async def amend_schedule(
+            session: AsyncSession,
+            loan_id: UUID,
+            email: str,
+            user_id: UUID,
+            amendment: ScheduleAmendment,
+    ) -> list[LoanPaymentRead]:
+        """Recompute the schedule from ``amendment.from_payment_number`` onward with the given payments.
 
+        Only the payments that differ from the stored ones are rewritten, both in the database
+        and in the cached schedule. Return the recomputed payments.
+        """
         payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
         loan_repo: LoanRepository = LoanRepository(session=session)
 
-        loan: Loan = await loan_repo.get(email=email, id=loan_id)
+        loan: Loan = await loan_repo.get(user_id=user_id, id=loan_id)
         if not loan:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="The loan with supplied ID doesn't exist"
             )
 
-        loan_payments: Sequence[LoanPayment] = await payment_repo.get_many(email=email, loan_id=loan_id)
-        if not loan_payments:
+        first_number: int = amendment.from_payment_number
+        stored_payments: Sequence[LoanPayment] = await payment_repo.get_from_number(
+            user_id=user_id,
+            loan_id=loan_id,
+            payment_number=first_number - 1,
+        )
+        previous: LoanPayment | None = None
+        if first_number > 1:
+            if not stored_payments or stored_payments[0].payment_number != first_number - 1:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"The payment number {first_number - 1} of the schedule does not exist"
+                )
+            previous, *stored_payments = stored_payments
+        elif not stored_payments:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="The schedule for the loan with supplied ID does not exist"
             )
 
-        loan_schedule: list[LoanPaymentRead] = []
-        raw_schedule: list[dict[str, ...]] = []
-        for payment in loan_payments:
-            payment_read: LoanPaymentRead = LoanPaymentRead(**payment.__dict__)
-            loan_schedule.append(payment_read)
-            raw_schedule.append(payment_read.model_dump())
+        try:
+            tail: Schedule = compute_schedule_tail(
+                loan_amount=loan.loan_amount,
+                interest_rate_percent=loan.interest_rate_percent,
+                loan_term=loan.loan_term,
+                first_payment_number=first_number,
+                previous_date=previous.payment_date if previous else loan.start_date,
+                previous_balance=previous.remaining_balance if previous else loan.loan_amount,
+                payments=[(payment.payment_date, payment.payment_amount) for payment in amendment.payments],
+            )
+        except ScheduleError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e),
+            )
 
-        json_schedule: bytes = orjson.dumps(raw_schedule, default=orjson_default)
+        stored: dict[int, LoanPayment] = {payment.payment_number: payment for payment in stored_payments}
+        amended_schedule: list[LoanPaymentRead] = []
+        changed_rows: list[dict[str, ...]] = []
+        replaced: list[LoanPayment] = []
+        for row in tail.rows():
+            payment: LoanPayment | None = stored.pop(row["payment_number"], None)
+            if payment is not None and all(getattr(payment, column) == row[column] for column in SCHEDULE_COLUMNS):
+                amended_schedule.append(LoanPaymentRead(**payment.__dict__))
+                continue
+            if payment is not None:
+                replaced.append(payment)
+            changed_rows.append({"id": payment.id if payment else uuid4(), "loan_id": loan_id, **row})
+        # the stored payments left are beyond the end of the amended schedule
+        replaced.extend(stored.values())
+
+        # the changed payments are deleted and inserted again, since updating the dates in place
+        # could collide with the unique dates of the other payments
+        db_schedule: Sequence[Mapping[str, ...]] = []
         try:
-            await cache.set(f'user:{email}.loan:{loan_id}.payments', json_schedule, ex=settings.cache.ttl)
-        except redis.exceptions.ConnectionError as e:
+            if replaced:
+                await payment_repo.delete_by_numbers(
+                    loan_id=loan_id,
+                    payment_numbers=[payment.payment_number for payment in replaced],
+                )
+            if changed_rows:
+                db_schedule = await payment_repo.create_many(changed_rows)
+        except IntegrityError as e:
+            # a concurrent amendment or recreation of the schedule inserted the same numbers or dates
             logger.exception(e.args)
-        return loan_schedule
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The schedule for the loan with supplied ID was changed concurrently, retry the request",
+            )
+        await session.commit()
+
+        changed_schedule: list[LoanPaymentRead] = [LoanPaymentRead(**payment) for payment in db_schedule]
+        removed_members: list[bytes] = [pack_payment(payment.__dict__) for payment in replaced]
+        try:
+            # the new version is the previous one patched, if it is cached
+            await cache_keys.bump(
+                email,
+                schedule_name(loan_id),
+                writes={
+                    schedule_name(loan_id): VersionWrite.patch_sorted(
+                        removed_members,
+                        LoanPaymentService._schedule_members(db_schedule),
+                    ),
+                },
+            )
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
+
+        amended_schedule.extend(changed_schedule)
+        amended_schedule.sort(key=lambda payment: payment.payment_number)
+        return amended_schedule
 
     @staticmethod
-    async def delete_schedule(
+    async def get_schedule(
+            session: AsyncSession,
             loan_id: UUID,
             email: str,
-            session: AsyncSession,
-    ) -> None:
+            user_id: UUID,
+            limit: int,
+            offset: int = 0,
+            after: date | None = None,
+    ) -> bytes:
+        """Return a page of the schedule as a JSON array serialized exactly as ``list[LoanPaymentRead]``.
+
+        The page is either ``limit`` payments from ``offset`` or, if ``after`` is given,
+        ``limit`` payments dated later than ``after``.
+        """
+        if limit <= 0:
+            # a range to ``offset - 1`` would be read from the end of the cached schedule
+            return join_json_array([])
+        cache_available: bool = True
         try:
-            await cache.delete(f'user:{email}.loan:{loan_id}.payments')
+            render: Callable[[list[bytes]], bytes] = partial(render_payments, loan_id=loan_id)
+            # the page and the marker of a missing schedule are read together with its key
+            current: CurrentRead[bytes] = await cache_keys.read_current(
+                email,
+                schedule_name(loan_id),
+                read=lambda name: cache_client.get_current_range(
+                    name,
+                    start=offset,
+                    stop=offset + limit - 1,
+                    decode=render,
+                ) if after is None else cache_client.get_current_range_after(
+                    name,
+                    score=after.toordinal(),
+                    count=limit,
+                    decode=render,
+                ),
+            )
+            key: str = current.key
+            if current.value is not None:
+                return current.value
+            if current.missing is not None:
+                metrics.incr("cache.negative_hits.schedule")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=current.missing)
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+            cache_errors.exception(logger, e)
+            cache_available = False
+
+        if cache_available:
+            # concurrent misses of the key share a single rebuild
+            members: dict[bytes, float] = await fill_once(
+                key,
+                read=lambda: LoanPaymentService._read_schedule(key),
+                rebuild=lambda: LoanPaymentService._rebuild_schedule(
+                    session=session,
+                    key=key,
+                    loan_id=loan_id,
+                    user_id=user_id,
+                ),
+            )
+            if after is not None:
+                return render_payments(
+                    [member for member, score in members.items() if score > after.toordinal()][:limit],
+                    loan_id=loan_id,
+                )
+            return render_payments(list(members)[offset:offset + limit], loan_id=loan_id)
 
-        loan_repo: LoanRepository = LoanRepository(session=session)
-        loan: Loan = await loan_repo.get(email=email, id=loan_id)
-        if not loan:
+        # without the cache just the page is loaded, the page query checks the owner of the loan
+        payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
+        loan_payments: Sequence[LoanPayment] = await payment_repo.get_many(
+            user_id=user_id,
+            loan_id=loan_id,
+            after=after,
+            offset=None if after else offset,
+            limit=limit,
+        )
+        if not loan_payments:
+            # an empty page is either past the end of the schedule or there is nothing to page
+            await LoanPaymentService._check_schedule(payment_repo=payment_repo, loan_id=loan_id, user_id=user_id)
+            return join_json_array([])
+        return dumps([LoanPaymentRead(**payment.__dict__) for payment in loan_payments])
+
+    @staticmethod
+    async def _check_schedule(payment_repo: LoanPaymentRepository, loan_id: UUID, user_id: UUID) -> None:
+        """Raise the 404 error if the user loan or its schedule does not exist."""
+        has_loan, has_schedule = await payment_repo.get_state(user_id=user_id, loan_id=loan_id)
+        if not has_loan:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="The loan with supplied ID doesn't exist"
             )
-        payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
-        deleted_payments: Sequence[LoanPayment] = await payment_repo.delete_many(loan_id=loan_id)
-        if not deleted_payments:
+        if not has_schedule:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="The schedule for the loan with supplied ID does not exist"
             )
+
+    @staticmethod
+    async def _check_missing(key: str) -> None:
+        """Raise the 404 error if the loan or the schedule of the key is cached as missing."""
+        reason: str | None = await cache_client.get_missing(key)
+        if reason is not None:
+            metrics.incr("cache.negative_hits.schedule")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=reason)
+
+    @staticmethod
+    async def _read_schedule(key: str) -> dict[bytes, float] | None:
+        # the requests waiting for a rebuild that found nothing get its 404 error
+        members: dict[bytes, float] | None = await cache_client.get_sorted(key)
+        if members is None:
+            await LoanPaymentService._check_missing(key)
+        return members
+
+    @staticmethod
+    async def _rebuild_schedule(
+            session: AsyncSession,
+            key: str,
+            loan_id: UUID,
+            user_id: UUID,
+    ) -> dict[bytes, float]:
+        """Load the whole schedule and write it to the cache, return the members of its sorted set."""
+        payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
+
+        loan_payments: Sequence[Mapping[str, ...]] = await payment_repo.get_with_loan(user_id=user_id, loan_id=loan_id)
+        detail: str | None = None
+        if not loan_payments:
+            detail = "The loan with supplied ID doesn't exist"
+        elif loan_payments[0]["id"] is None:
+            detail = "The schedule for the loan with supplied ID does not exist"
+        if detail is not None:
+            # clients polling for the schedule are answered from the cache for a while
+            try:
+                async with cache_client.batch() as batch:
+                    batch.set_missing(key, detail)
+            except redis.exceptions.ConnectionError as e:
+                cache_errors.exception(logger, e)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=detail
+            )
+
+        members: dict[bytes, float] = LoanPaymentService._schedule_members(loan_payments)
+        try:
+            async with cache_client.batch() as batch:
+                batch.set_sorted(key, members)
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
+        return members
+
+    @staticmethod
+    async def export_schedule(
+            session: AsyncSession,
+            loan_id: UUID,
+            user_id: UUID,
+            export_format: ExportFormat,
+    ) -> AsyncIterator[bytes]:
+        """Check that the schedule exists and return the stream of its rows encoded in ``export_format``."""
+        payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
+        await LoanPaymentService._check_schedule(payment_repo=payment_repo, loan_id=loan_id, user_id=user_id)
+        return LoanPaymentService._stream_schedule(loan_id=loan_id, user_id=user_id, export_format=export_format)
+
+    @staticmethod
+    async def _stream_schedule(loan_id: UUID, user_id: UUID, export_format: ExportFormat) -> AsyncIterator[bytes]:
+        # the response is streamed after the request session is closed, so the export has its own
+        async with session_maker() as session:
+            payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
+            columns: tuple[str, ...] = tuple(LoanPaymentRead.model_fields)
+            partitions: AsyncIterator = payment_repo.stream_many(
+                loan_id=loan_id,
+                user_id=user_id,
+                columns=columns,
+                batch_size=settings.db.stream_batch_size,
+            )
+            async for chunk in encode_rows(columns, partitions, export_format):
+                yield chunk
+
+    @staticmethod
+    async def delete_schedule(
+            loan_id: UUID,
+            email: str,
+            user_id: UUID,
+            session: AsyncSession,
+    ) -> None:
+        payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
+        deleted_payment_ids: Sequence[UUID] = await payment_repo.delete_schedule(user_id=user_id, loan_id=loan_id)
+        if not deleted_payment_ids:
+            await LoanPaymentService._check_schedule(payment_repo=payment_repo, loan_id=loan_id, user_id=user_id)
+        await session.commit()
+
+        try:
+            await cache_keys.bump(email, schedule_name(loan_id))
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
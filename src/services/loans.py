@@ -1,44 +1,50 @@
 import logging
 from datetime import date
-from typing import Sequence
+from typing import AsyncIterator, Awaitable, Callable, Sequence
 from uuid import UUID
 
 import redis
 from fastapi import HTTPException, status
-from orjson import orjson
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
+from src.cache.breaker import cache_errors
+from src.cache.client import CurrentRead, VersionWrite, cache_client
+from src.cache.coalesce import fill_once
+from src.cache.keys import LOANS_NAME, cache_keys, loan_name, schedule_name
 from src.config import settings
-from src.cache.connection import cache
-from src.database.models import User, LoanPayment
+from src.database.connection import session_maker
 from src.database.models.loans import Loan
 from src.repositories.loans import LoanRepository
 from src.repositories.loan_payments import LoanPaymentRepository
-from src.repositories.users import UserRepository
 from src.schemas.loans import LoanCreate, LoanRead, LoanUpdate
-from src.utils.serialization import orjson_default
+from src.utils.export import ExportFormat, encode_rows
+from src.utils.metrics import metrics
+from src.utils.serialization import dumps
 
 
 logger = logging.getLogger(__name__)
 
+LOANS_ADAPTER: TypeAdapter[list[LoanRead]] = TypeAdapter(list[LoanRead])
+
 
 class LoanService:
     @staticmethod
-    async def create_loan(session: AsyncSession, email: str, loan_data: LoanCreate) -> LoanRead:
+    def _decode_loan(json_loan: bytes) -> LoanRead:
+        return LoanRead.model_validate_json(json_loan)
+
+    @staticmethod
+    def _decode_loans(json_loans: bytes) -> list[LoanRead]:
+        return LOANS_ADAPTER.validate_json(json_loans)
+
+    @staticmethod
+    async def create_loan(session: AsyncSession, email: str, user_id: UUID, loan_data: LoanCreate) -> LoanRead:
         loan_repo: LoanRepository = LoanRepository(session=session)
-        user_repo: UserRepository = UserRepository(session=session)
-        user: User | None = await user_repo.get(email=email)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
         if loan_data.start_date is None:
             loan_data.start_date = date.today()
         loan_dict: dict[str, ...] = loan_data.model_dump()
-        loan_dict["user_id"] = user.id
+        loan_dict["user_id"] = user_id
         try:
             loan_db: Loan = await loan_repo.create(**loan_dict)
         except IntegrityError as e:
@@ -50,67 +56,181 @@ class LoanService:
         await session.commit()
 
         loan: LoanRead = LoanRead(**loan_db.__dict__)
-        json_loan: bytes = orjson.dumps(loan.model_dump(), default=orjson_default)
+        json_loan: bytes = dumps(loan)
         try:
-            await cache.set(f'user:{email}.loan:{loan.id}', json_loan, ex=settings.cache.ttl)
-            await cache.delete(f'user:{email}.loans')
+            # the schedule is bumped too, its key might be cached as missing
+            await cache_keys.bump(
+                email, LOANS_NAME, loan_name(loan.id), schedule_name(loan.id),
+                writes={loan_name(loan.id): VersionWrite.set(json_loan)},
+            )
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+            cache_errors.exception(logger, e)
         return loan
 
     @staticmethod
-    async def get_all_loans(session: AsyncSession, email: str) -> list[LoanRead]:
+    async def get_all_loans(
+            session: AsyncSession,
+            email: str,
+            user_id: UUID,
+            limit: int,
+            offset: int = 0,
+            after: str | None = None,
+    ) -> list[LoanRead]:
         loan_repo: LoanRepository = LoanRepository(session=session)
-        loans: list[LoanRead]
 
+        # keyset pages are served by the (user_id, name) index directly
+        if after is not None:
+            page_loans: Sequence[Loan] = await loan_repo.get_all(user_id=user_id, after=after, limit=limit)
+            return [LoanRead(**loan.__dict__) for loan in page_loans]
+        if limit <= 0:
+            return []
+
+        # the list is cached in chunks of fixed size, stored as fields of one hash
+        chunk_size: int = settings.cache.list_chunk_size
+        first_chunk: int = offset // chunk_size
+        chunk_ids: list[str] = [str(chunk) for chunk in range(first_chunk, (offset + limit - 1) // chunk_size + 1)]
+        chunks: list[list[LoanRead] | None] = [None] * len(chunk_ids)
+        key: str | None = None
         try:
-            loans_cache: bytes = await cache.get(f'user:{email}.loans')
-            if loans_cache:
-                raw_loans: list[dict[str, ...]] = orjson.loads(loans_cache)
-                loans = [LoanRead(**loan) for loan in raw_loans]
-                return loans
+            current: CurrentRead[list[list[LoanRead] | None]] = await cache_keys.read_current(
+                email,
+                LOANS_NAME,
+                read=lambda name: cache_client.get_current_fields(name, chunk_ids, decode=LoanService._decode_loans),
+            )
+            key, chunks = current.key, current.value
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+            cache_errors.exception(logger, e)
 
-        db_loans: Sequence[Loan] = await loan_repo.get_all(email=email)
-        loans = [LoanRead(**loan.__dict__) for loan in db_loans]
-        data_loans: list[dict[str, ...]] = [loan.model_dump() for loan in loans]
-        json_loans: bytes = orjson.dumps(data_loans, default=orjson_default)
+        missing: list[int] = [index for index, chunk in enumerate(chunks) if chunk is None]
+        if missing:
+            missing_ids: list[str] = chunk_ids[missing[0]:missing[-1] + 1]
+            rebuild: Callable[[], Awaitable[list[list[LoanRead]]]] = lambda: LoanService._rebuild_chunks(
+                session=session,
+                key=key,
+                user_id=user_id,
+                chunk_ids=missing_ids,
+            )
+            if key is None:
+                missing_chunks: list[list[LoanRead]] = await rebuild()
+            else:
+                # concurrent misses of the same chunks share a single rebuild
+                missing_chunks = await fill_once(
+                    f'{key}:{missing_ids[0]}-{missing_ids[-1]}',
+                    read=lambda: LoanService._read_chunks(key=key, chunk_ids=missing_ids),
+                    rebuild=rebuild,
+                )
+            chunks[missing[0]:missing[-1] + 1] = missing_chunks
 
-        try:
-            await cache.set(f'user:{email}.loans', json_loans, ex=settings.cache.ttl)
-        except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
-        return loans
+        page_start: int = offset - first_chunk * chunk_size
+        return [loan for chunk in chunks for loan in chunk][page_start:page_start + limit]
 
     @staticmethod
-    async def get_loan(session: AsyncSession, loan_id: UUID, email: str) -> LoanRead:
+    async def _read_chunks(key: str, chunk_ids: list[str]) -> list[list[LoanRead]] | None:
+        chunks: list[list[LoanRead] | None] = await cache_client.get_fields(
+            key,
+            chunk_ids,
+            decode=LoanService._decode_loans,
+        )
+        if any(chunk is None for chunk in chunks):
+            return None
+        return chunks
+
+    @staticmethod
+    async def _rebuild_chunks(
+            session: AsyncSession,
+            key: str | None,
+            user_id: UUID,
+            chunk_ids: list[str],
+    ) -> list[list[LoanRead]]:
+        """Load the loans of the consecutive chunks and write them to the cache key if it is given."""
         loan_repo: LoanRepository = LoanRepository(session=session)
-        loan: LoanRead | None = None
+        chunk_size: int = settings.cache.list_chunk_size
+        db_loans: Sequence[Loan] = await loan_repo.get_all(
+            user_id=user_id,
+            offset=int(chunk_ids[0]) * chunk_size,
+            limit=len(chunk_ids) * chunk_size,
+        )
+        loans: list[LoanRead] = [LoanRead(**loan.__dict__) for loan in db_loans]
+        chunks: list[list[LoanRead]] = [
+            loans[index * chunk_size:(index + 1) * chunk_size] for index in range(len(chunk_ids))
+        ]
+        if key is None:
+            return chunks
         try:
-            cache_loan: bytes | None = await cache.get(f'user:{email}.loan:{loan_id}')
-            if cache_loan:
-                loan_dict: dict[str, ...] = orjson.loads(cache_loan)
-                loan = LoanRead(**loan_dict)
-            else:
-                loan_db: Loan | None = await loan_repo.get(id=loan_id, email=email)
-                loan = LoanRead(**loan_db.__dict__)
-                json_loan: bytes = orjson.dumps(loan.model_dump(), default=orjson_default)
-                await cache.set(f'user:{email}.loan:{loan.id}', json_loan, ex=settings.cache.ttl)
-
-            if not loan:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="The loan with supplied ID doesn't exist"
+            async with cache_client.batch() as batch:
+                batch.set_fields(
+                    key,
+                    {
+                        chunk_id: dumps(chunk)
+                        for chunk_id, chunk in zip(chunk_ids, chunks)
+                    },
                 )
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+            cache_errors.exception(logger, e)
+        return chunks
+
+    @staticmethod
+    async def export_loans(user_id: UUID, export_format: ExportFormat) -> AsyncIterator[bytes]:
+        # the response is streamed after the request session is closed, so the export has its own
+        async with session_maker() as session:
+            loan_repo: LoanRepository = LoanRepository(session=session)
+            columns: tuple[str, ...] = tuple(LoanRead.model_fields)
+            partitions: AsyncIterator = loan_repo.stream_all(
+                user_id=user_id,
+                columns=columns,
+                batch_size=settings.db.stream_batch_size,
+            )
+            async for chunk in encode_rows(columns, partitions, export_format):
+                yield chunk
+
+    @staticmethod
+    async def get_loan(session: AsyncSession, loan_id: UUID, email: str, user_id: UUID) -> LoanRead:
+        key: str | None = None
+        try:
+            # the loan and the marker of a missing one are read together with its key
+            current: CurrentRead[LoanRead] = await cache_keys.read_current(
+                email,
+                loan_name(loan_id),
+                read=lambda name: cache_client.get_current_decoded_or_missing(name, decode=LoanService._decode_loan),
+            )
+            key = current.key
+            if current.value is not None:
+                return current.value
+            if current.missing is not None:
+                metrics.incr("cache.negative_hits.loan")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=current.missing)
+        except redis.exceptions.ConnectionError as e:
+            cache_errors.exception(logger, e)
+
+        loan_repo: LoanRepository = LoanRepository(session=session)
+        loan_db: Loan | None = await loan_repo.get(id=loan_id, user_id=user_id)
+        if not loan_db:
+            detail: str = "The loan with supplied ID doesn't exist"
+            if key is not None:
+                # a client polling for the loan is answered from the cache for a while
+                try:
+                    async with cache_client.batch() as batch:
+                        batch.set_missing(key, detail)
+                except redis.exceptions.ConnectionError as e:
+                    cache_errors.exception(logger, e)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=detail
+            )
+
+        loan = LoanRead(**loan_db.__dict__)
+        if key is not None:
+            try:
+                async with cache_client.batch() as batch:
+                    batch.set(key, dumps(loan))
+            except redis.exceptions.ConnectionError as e:
+                cache_errors.exception(logger, e)
         return loan
 
     @staticmethod
-    async def delete_loan(session: AsyncSession, loan_id: UUID, email: str) -> Loan:
+    async def delete_loan(session: AsyncSession, loan_id: UUID, email: str, user_id: UUID) -> Loan:
         loan_repo: LoanRepository = LoanRepository(session=session)
-        loan: Loan | None = await loan_repo.delete(id=loan_id, email=email)
+        loan: Loan | None = await loan_repo.delete(id=loan_id, user_id=user_id)
         if not loan:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -118,10 +238,9 @@ class LoanService:
             )
         await session.commit()
         try:
-            await cache.delete(f'user:{email}.loan:{loan_id}')
-            await cache.delete(f'user:{email}.loans')
+            await cache_keys.bump(email, LOANS_NAME, loan_name(loan_id), schedule_name(loan_id))
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+            cache_errors.exception(logger, e)
         return loan
 
     @staticmethod
@@ -129,17 +248,19 @@ class LoanService:
             session: AsyncSession,
             loan_id: UUID,
             email: str,
+            user_id: UUID,
             data: LoanUpdate,
     ) -> LoanRead:
         loan_data_dict: dict[str, ...] = data.model_dump(exclude_unset=True)
         loan_repo: LoanRepository = LoanRepository(session=session)
         loan_payment_repo: LoanPaymentRepository = LoanPaymentRepository(session=session)
-        payments: Sequence[LoanPayment] = await loan_payment_repo.get_many(loan_id=loan_id, email=email)
-        if payments:
-            match (data.start_date, data.loan_amount, data.interest_rate_percent, data.loan_term):
-                case (None, None, None, None):
-                    pass
-                case _:
+        match (data.start_date, data.loan_amount, data.interest_rate_percent, data.loan_term):
+            case (None, None, None, None):
+                pass
+            case _:
+                # the schedule is probed only when the update could change it
+                _, has_schedule = await loan_payment_repo.get_state(loan_id=loan_id, user_id=user_id)
+                if has_schedule:
                     raise HTTPException(
                         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                         detail="Parameters: start_date, loan_amount, interest_rate_percent, loan_term cannot be "
@@ -147,20 +268,26 @@ class LoanService:
                                "depends on these parameters."
                     )
         try:
-            loan_db: Loan | None = await loan_repo.update(data=loan_data_dict, id=loan_id, email=email)
+            loan_db: Loan | None = await loan_repo.update(data=loan_data_dict, id=loan_id, user_id=user_id)
         except IntegrityError as e:
             logger.exception(e.args)
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail=f'The loan with name "{data.name}" already exists',
             )
+        if not loan_db:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="The loan with supplied ID doesn't exist"
+            )
         await session.commit()
 
         loan: LoanRead = LoanRead(**loan_db.__dict__)
-        json_loan: bytes = orjson.dumps(loan.model_dump(), default=orjson_default)
+        json_loan: bytes = dumps(loan)
         try:
-            await cache.delete(f'user:{email}.loans')
-            await cache.set(f'user:{email}.loan:{loan_id}', json_loan, ex=settings.cache.ttl)
+            await cache_keys.bump(
+                email, LOANS_NAME, loan_name(loan_id), writes={loan_name(loan_id): VersionWrite.set(json_loan)},
+            )
         except redis.exceptions.ConnectionError as e:
-            logger.exception(e.args)
+            cache_errors.exception(logger, e)
         return loan
@@ -25,7 +25,7 @@ class UserService:
                 status_code=status.HTTP_409_CONFLICT,
                 detail="User with supplied email already exists",
             )
-        hashed_password: str = hash_password.create_hash(user_data.password)
+        hashed_password: str = await hash_password.create_hash_async(user_data.password)
         created_user: User = await user_repo.create(
             email=user_data.email,
             hashed_password=hashed_password,
@@ -51,7 +51,7 @@ class UserService:
                 raise
         if not (
             user.is_active
-            and hash_password.verify_hash(user_form.password, user.hashed_password)
+            and await hash_password.verify_hash_async(user_form.password, user.hashed_password)
         ):
             raise incorrect_credentials
         return user
@@ -0,0 +1,248 @@
+from calendar import isleap
+from dataclasses import dataclass, field, fields
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import cache
+from typing import Iterator, Sequence
+
+
+MONTH_DAYS: tuple[int, ...] = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+CENT: Decimal = Decimal("0.01")
+
+type PaymentOverride = tuple[date, Decimal | None]
+
+
+class ScheduleError(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class Schedule:
+    """Column-oriented amortization schedule, one list per payment attribute."""
+
+    payment_number: list[int] = field(default_factory=list)
+    payment_date: list[date] = field(default_factory=list)
+    payment_amount: list[Decimal] = field(default_factory=list)
+    interest_amount: list[Decimal] = field(default_factory=list)
+    principal_amount: list[Decimal] = field(default_factory=list)
+    incoming_balance: list[Decimal] = field(default_factory=list)
+    remaining_balance: list[Decimal] = field(default_factory=list)
+    year_part: list[Decimal] = field(default_factory=list)
+    days_in_year: list[int] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.payment_number)
+
+    def rows(self) -> Iterator[dict[str, ...]]:
+        for values in zip(
+            self.payment_number,
+            self.payment_date,
+            self.payment_amount,
+            self.interest_amount,
+            self.principal_amount,
+            self.incoming_balance,
+            self.remaining_balance,
+            self.year_part,
+            self.days_in_year,
+        ):
+            yield dict(zip(SCHEDULE_COLUMNS, values))
+
+    # schedules are sent between processes, dates and decimals are pickled as ordinals
+    # and strings since pickling them as objects costs more than computing the schedule
+    def __getstate__(self) -> tuple:
+        return (
+            self.payment_number,
+            [payment_date.toordinal() for payment_date in self.payment_date],
+            *("|".join(map(str, column)) for column in (
+                self.payment_amount,
+                self.interest_amount,
+                self.principal_amount,
+                self.incoming_balance,
+                self.remaining_balance,
+                self.year_part,
+            )),
+            self.days_in_year,
+        )
+
+    def __setstate__(self, state: tuple) -> None:
+        payment_number, ordinals, *decimal_columns, days_in_year = state
+        self.payment_number = payment_number
+        self.payment_date = [date.fromordinal(ordinal) for ordinal in ordinals]
+        (
+            self.payment_amount,
+            self.interest_amount,
+            self.principal_amount,
+            self.incoming_balance,
+            self.remaining_balance,
+            self.year_part,
+        ) = ([Decimal(value) for value in column.split("|")] if column else [] for column in decimal_columns)
+        self.days_in_year = days_in_year
+
+
+SCHEDULE_COLUMNS: tuple[str, ...] = tuple(column.name for column in fields(Schedule))
+
+
+def days_in_month(year: int, month: int) -> int:
+    if month == 2 and isleap(year):
+        return 29
+    return MONTH_DAYS[month - 1]
+
+
+def days_in_year(year: int) -> int:
+    return 366 if isleap(year) else 365
+
+
+def next_payment_date(actual_date: date) -> date:
+    return actual_date + timedelta(days=days_in_month(actual_date.year, actual_date.month))
+
+
+def annuity_payment(loan_amount: Decimal, interest_rate_percent: Decimal, loan_term: int) -> Decimal:
+    monthly_interest = Decimal(interest_rate_percent) / 100 / 12
+    growth = (1 + monthly_interest) ** loan_term
+    payment_amount = Decimal(loan_amount) * (monthly_interest * growth) / (growth - 1)
+    return round(payment_amount, 2)
+
+
+@cache
+def _same_year_part(days: int, year_days: int) -> Decimal:
+    return Decimal(days) / year_days
+
+
+def year_parts(previous_date: date, dates: Sequence[date]) -> tuple[list[Decimal], list[int]]:
+    """Evaluate the part of the year between consecutive payment dates for the interest calculation."""
+    parts: list[Decimal] = []
+    year_days: list[int] = []
+    for current_date in dates:
+        current_year_days = days_in_year(current_date.year)
+        if current_date.year != previous_date.year:
+            previous_year_part = Decimal(
+                days_in_month(previous_date.year, previous_date.month) - previous_date.day
+            ) / days_in_year(previous_date.year)
+            current_year_part = Decimal(current_date.day / current_year_days)
+            parts.append(previous_year_part + current_year_part)
+        else:
+            parts.append(_same_year_part((current_date - previous_date).days, current_year_days))
+        year_days.append(current_year_days)
+        previous_date = current_date
+    return parts, year_days
+
+
+def _check_dates(payments: Sequence[PaymentOverride]) -> None:
+    # the dates are optional in the schemas of the payments
+    if any(payment_date is None for payment_date, _ in payments):
+        raise ScheduleError('The date of each transmitted payment must be given')
+
+
+def payment_plan(
+        start_date: date,
+        loan_term: int,
+        default_payment_amount: Decimal,
+        payments: Sequence[PaymentOverride] = (),
+) -> tuple[list[date], list[Decimal]]:
+    """Merge the given payments with the regular monthly ones up to ``loan_term`` payments."""
+    _check_dates(payments)
+    overrides: list[PaymentOverride] = sorted(payments, key=lambda payment: payment[0])
+    if overrides and start_date > overrides[0][0]:
+        raise ScheduleError('The date of payment can not be earlier than the date of creating the loan')
+    if len(overrides) > loan_term:
+        raise ScheduleError(
+            'The quantity of given payments can not be greater than "loan_term" value of the loan'
+        )
+
+    dates: list[date] = [payment_date for payment_date, _ in overrides]
+    if len(set(dates)) != len(dates):
+        raise ScheduleError('There are repetitions among the transmitted dates. Each payment date must be unique.')
+    amounts: list[Decimal] = [
+        default_payment_amount if amount is None else Decimal(amount).quantize(CENT)
+        for _, amount in overrides
+    ]
+    previous_date = dates[-1] if dates else start_date
+    for _ in range(loan_term - len(overrides)):
+        previous_date = next_payment_date(previous_date)
+        dates.append(previous_date)
+        amounts.append(default_payment_amount)
+    return dates, amounts
+
+
+def compute_schedule(
+        loan_amount: Decimal,
+        interest_rate_percent: Decimal,
+        loan_term: int,
+        start_date: date,
+        payments: Sequence[PaymentOverride] = (),
+) -> Schedule:
+    return compute_schedule_tail(
+        loan_amount=loan_amount,
+        interest_rate_percent=interest_rate_percent,
+        loan_term=loan_term,
+        first_payment_number=1,
+        previous_date=start_date,
+        previous_balance=loan_amount,
+        payments=payments,
+    )
+
+
+def compute_schedule_tail(
+        loan_amount: Decimal,
+        interest_rate_percent: Decimal,
+        loan_term: int,
+        first_payment_number: int,
+        previous_date: date,
+        previous_balance: Decimal,
+        payments: Sequence[PaymentOverride] = (),
+) -> Schedule:
+    """Compute the payments from ``first_payment_number`` onward after the previous payment.
+
+    ``previous_date`` and ``previous_balance`` are the date and the remaining balance of the
+    previous payment, or the start date and the amount of the loan for the first one.
+    The result is the same as the tail of the whole schedule computed with the previous
+    payments given explicitly.
+    """
+    if not 1 <= first_payment_number <= loan_term:
+        raise ScheduleError(f'The number of payment must be from 1 to {loan_term}')
+    _check_dates(payments)
+    if first_payment_number > 1 and any(payment_date <= previous_date for payment_date, _ in payments):
+        raise ScheduleError('The date of payment must be later than the date of the previous payment')
+
+    rate = Decimal(interest_rate_percent) / 100
+    balance = Decimal(previous_balance).quantize(CENT)
+    default_payment_amount = annuity_payment(loan_amount, interest_rate_percent, loan_term)
+    payments_count = loan_term - first_payment_number + 1
+
+    dates, amounts = payment_plan(previous_date, payments_count, default_payment_amount, payments)
+    parts, year_days = year_parts(previous_date, dates)
+
+    schedule = Schedule()
+    for index in range(payments_count):
+        if balance == 0:
+            break
+
+        payment_number = first_payment_number + index
+        current_date = dates[index]
+        payment_amount = amounts[index]
+        year_part = parts[index]
+        incoming_balance = balance
+
+        interest_amount = round(incoming_balance * rate * year_part, 2)
+        if interest_amount > payment_amount:
+            raise ScheduleError(
+                f"The amount of interest can not be greater than the payment amount."
+                f"The payment for the date {current_date} is {payment_amount}, while "
+                f"the amount of interest for this payment is {interest_amount}"
+            )
+        if (payment_amount > interest_amount + incoming_balance) or (payment_number == loan_term):
+            payment_amount = interest_amount + incoming_balance
+
+        principal_amount = payment_amount - interest_amount
+        balance = incoming_balance - principal_amount
+
+        schedule.payment_number.append(payment_number)
+        schedule.payment_date.append(current_date)
+        schedule.payment_amount.append(payment_amount)
+        schedule.interest_amount.append(interest_amount)
+        schedule.principal_amount.append(principal_amount)
+        schedule.incoming_balance.append(incoming_balance)
+        schedule.remaining_balance.append(balance)
+        schedule.year_part.append(year_part)
+        schedule.days_in_year.append(year_days[index])
+    return schedule
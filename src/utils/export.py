@@ -0,0 +1,47 @@
+import csv
+import io
+from enum import StrEnum
+from typing import AsyncIterable, AsyncIterator, Sequence
+
+from orjson import orjson
+
+
+class ExportFormat(StrEnum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+    @property
+    def media_type(self) -> str:
+        return {
+            ExportFormat.NDJSON: "application/x-ndjson",
+            ExportFormat.CSV: "text/csv",
+        }[self]
+
+
+async def encode_rows(
+        columns: Sequence[str],
+        partitions: AsyncIterable[Sequence[tuple]],
+        export_format: ExportFormat,
+) -> AsyncIterator[bytes]:
+    """Encode partitions of database rows one by one, yielding one chunk per partition.
+
+    The values are written as they are, so decimals and UUIDs are expected to be read as strings.
+    """
+    if export_format is ExportFormat.CSV:
+        buffer: io.StringIO = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        async for rows in partitions:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+        return
+
+    async for rows in partitions:
+        yield b"".join(
+            orjson.dumps(dict(zip(columns, row)), option=orjson.OPT_APPEND_NEWLINE)
+            for row in rows
+        )
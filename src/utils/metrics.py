@@ -0,0 +1,32 @@
+from collections import defaultdict
+from typing import Callable
+
+
+class Metrics:
+    """In-process counters and gauges of one worker."""
+
+    def __init__(self):
+        self._counters: defaultdict[str, float] = defaultdict(float)
+        self._gauges: dict[str, Callable[[], float]] = {}
+        self._maximums: defaultdict[str, float] = defaultdict(float)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        self._counters[name] += value
+
+    def gauge(self, name: str, func: Callable[[], float]) -> None:
+        self._gauges[name] = func
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a sample, e.g. a duration, as the ``count``, ``sum`` and ``max`` of the name."""
+        self._counters[f"{name}.count"] += 1
+        self._counters[f"{name}.sum"] += value
+        self._maximums[f"{name}.max"] = max(self._maximums[f"{name}.max"], value)
+
+    def snapshot(self) -> dict[str, float]:
+        data: dict[str, float] = dict(self._counters)
+        data.update(self._maximums)
+        data.update({name: func() for name, func in self._gauges.items()})
+        return dict(sorted(data.items()))
+
+
+metrics: Metrics = Metrics()
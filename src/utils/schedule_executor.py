@@ -0,0 +1,78 @@
+import asyncio
+import math
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+from typing import Sequence, TypedDict
+
+from src.config import settings
+from src.utils.amortization import PaymentOverride, Schedule, ScheduleError, compute_schedule
+
+
+class ScheduleInput(TypedDict):
+    """Plain arguments of ``compute_schedule``, picklable to be sent to a worker process."""
+
+    loan_amount: Decimal
+    interest_rate_percent: Decimal
+    loan_term: int
+    start_date: date
+    payments: Sequence[PaymentOverride]
+
+
+def compute_schedules(inputs: Sequence[ScheduleInput]) -> list[Schedule | ScheduleError]:
+    results: list[Schedule | ScheduleError] = []
+    for schedule_input in inputs:
+        try:
+            results.append(compute_schedule(**schedule_input))
+        except ScheduleError as e:
+            results.append(e)
+    return results
+
+
+class ScheduleExecutor:
+    """Computes schedules on the event loop, or in a pool of processes in the ``process`` mode.
+
+    Batches are split into chunks of at most ``chunk_size`` schedules spread over the workers.
+    """
+
+    def __init__(self, mode: str, workers: int, chunk_size: int):
+        self.mode: str = mode
+        self.workers: int = workers
+        self.chunk_size: int = chunk_size
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def compute(self, schedule_input: ScheduleInput) -> Schedule:
+        result: Schedule | ScheduleError = (await self.compute_many([schedule_input]))[0]
+        if isinstance(result, ScheduleError):
+            raise result
+        return result
+
+    async def compute_many(self, inputs: Sequence[ScheduleInput]) -> list[Schedule | ScheduleError]:
+        """Compute the schedules in the order of the inputs, errors are returned in place of the failed ones."""
+        if self.mode != "process" or not inputs:
+            return compute_schedules(inputs)
+        chunk_size: int = min(self.chunk_size, math.ceil(len(inputs) / self.workers))
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        chunks: list[list[Schedule | ScheduleError]] = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, compute_schedules, inputs[start:start + chunk_size])
+            for start in range(0, len(inputs), chunk_size)
+        ))
+        return [result for chunk in chunks for result in chunk]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+schedule_executor: ScheduleExecutor = ScheduleExecutor(
+    mode=settings.schedule.executor,
+    workers=settings.schedule.workers,
+    chunk_size=settings.schedule.chunk_size,
+)
@@ -0,0 +1,61 @@
+"""Packed binary rows of cached schedules.
+
+A payment is packed in 64 bytes: its id, number, date ordinal and amounts in cents.
+The loan id is the same for all the payments of a schedule, so it is not packed and is
+given back when the rows are rendered as the JSON of ``list[LoanPaymentRead]``.
+"""
+import struct
+from datetime import date
+from decimal import Decimal
+from typing import Mapping, Sequence
+from uuid import UUID
+
+
+PAYMENT: struct.Struct = struct.Struct("<16sIi5q")
+
+AMOUNT_COLUMNS: tuple[str, ...] = (
+    "payment_amount",
+    "interest_amount",
+    "principal_amount",
+    "incoming_balance",
+    "remaining_balance",
+)
+
+# the fields are in the order of LoanPaymentRead
+PAYMENT_JSON: bytes = (
+    b'{"payment_date":"%s","payment_amount":"%s","id":"%s","loan_id":"%s","payment_number":%d,'
+    b'"interest_amount":"%s","principal_amount":"%s","incoming_balance":"%s","remaining_balance":"%s"}'
+)
+
+
+def pack_payment(payment: Mapping[str, ...]) -> bytes:
+    """Pack a payment given with the values of the ``LoanPayment`` columns.
+
+    The amounts have two decimal places and are not negative, as ``LoanPaymentRead`` requires.
+    """
+    amounts: list[int] = [int(Decimal(payment[column]) * 100) for column in AMOUNT_COLUMNS]
+    if min(amounts) < 0:
+        raise ValueError("The amounts of a packed payment can not be negative")
+    return PAYMENT.pack(payment["id"].bytes, payment["payment_number"], payment["payment_date"].toordinal(), *amounts)
+
+
+def render_payments(rows: Sequence[bytes], loan_id: UUID) -> bytes:
+    """Render the packed payments of the loan as the JSON array of ``LoanPaymentRead``."""
+    json_loan_id: bytes = str(loan_id).encode()
+    payments: list[bytes] = []
+    for raw_id, number, ordinal, payment, interest, principal, incoming, remaining in PAYMENT.iter_unpack(
+            b"".join(rows)
+    ):
+        hex_id: bytes = raw_id.hex().encode()
+        payments.append(PAYMENT_JSON % (
+            date.fromordinal(ordinal).isoformat().encode(),
+            b"%d.%02d" % divmod(payment, 100),
+            b"%s-%s-%s-%s-%s" % (hex_id[:8], hex_id[8:12], hex_id[12:16], hex_id[16:20], hex_id[20:]),
+            json_loan_id,
+            number,
+            b"%d.%02d" % divmod(interest, 100),
+            b"%d.%02d" % divmod(principal, 100),
+            b"%d.%02d" % divmod(incoming, 100),
+            b"%d.%02d" % divmod(remaining, 100),
+        ))
+    return b"[" + b",".join(payments) + b"]"
@@ -1,7 +1,16 @@
-from decimal import Decimal
+from typing import Any, Sequence
 
+from pydantic_core import to_json
 
-def orjson_default(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    return str(obj)
+
+def dumps(value: Any) -> bytes:
+    """Serialize the value to JSON without Python callbacks.
+
+    Decimals are written exactly as strings, the same way the API responses do,
+    UUIDs and dates as strings, models by their own serializers.
+    """
+    return to_json(value)
+
+
+def join_json_array(items: Sequence[bytes]) -> bytes:
+    return b"[" + b",".join(items) + b"]"
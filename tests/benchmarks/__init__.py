@@ -0,0 +1,16 @@
+"""Benchmarks of the hot paths, they print their measures and run only with ``-m benchmark``."""
+import timeit
+from decimal import Decimal
+from typing import Any, Callable
+
+
+def orjson_default(value: Any) -> Any:
+    """The callback the schedules were serialized with before, money as floats."""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def us_per_call(func: Callable[[], Any], rounds: int = 100) -> float:
+    """Return the µs per call of the best of five rounds."""
+    return min(timeit.repeat(func, number=rounds, repeat=5)) / rounds * 1e6
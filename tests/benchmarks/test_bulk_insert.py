@@ -0,0 +1,69 @@
+"""Rows per second of the bulk inserts of schedules, with and without reading the rows back.
+
+Each insert runs in a transaction which is rolled back.
+"""
+import time
+from datetime import date
+from decimal import Decimal
+from typing import AsyncIterator
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy import text
+
+from src.database.connection import engine, session_maker
+from src.repositories.loan_payments import LoanPaymentRepository
+from src.utils.amortization import compute_schedule
+
+
+pytestmark = [pytest.mark.anyio, pytest.mark.benchmark]
+
+ROUNDS: int = 5
+
+
+@pytest.fixture(scope="module")
+async def loan(database, event_loop_lease) -> AsyncIterator[UUID]:
+    user_id: UUID = uuid4()
+    loan_id: UUID = uuid4()
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO users (id, email, hashed_password, is_active) VALUES (:id, :email, '', true)"),
+            {"id": user_id, "email": f"user-{user_id.hex[:12]}@example.com"},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO loans (id, name, start_date, interest_rate_percent, loan_amount, loan_term, user_id) "
+                "VALUES (:id, 'loan', DATE '2000-01-01', 10, 1000000, 10000, :user_id)"
+            ),
+            {"id": loan_id, "user_id": user_id},
+        )
+    yield loan_id
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+
+
+@pytest.mark.parametrize("size", [12, 360, 10_000])
+@pytest.mark.parametrize("mode", ["returning", "no returning", "copy"])
+async def test_bulk_insert(loan: UUID, size: int, mode: str):
+    schedule_rows: list[dict[str, ...]] = list(compute_schedule(
+        loan_amount=Decimal("1000000"),
+        interest_rate_percent=Decimal("0.01"),
+        loan_term=size,
+        start_date=date(2000, 1, 1),
+    ).rows())
+
+    seconds: list[float] = []
+    for _ in range(ROUNDS):
+        rows: list[dict[str, ...]] = [{"id": uuid4(), "loan_id": loan, **row} for row in schedule_rows]
+        async with session_maker() as session:
+            started_at: float = time.perf_counter()
+            inserted = await LoanPaymentRepository(session=session).create_many(
+                rows,
+                copy=mode == "copy",
+                returning=mode != "no returning",
+            )
+            seconds.append(time.perf_counter() - started_at)
+            await session.rollback()
+        assert len(inserted) == (0 if mode == "no returning" else size)
+
+    print(f"\n{size} rows, {mode}: {size / min(seconds):,.0f} rows/s")
@@ -0,0 +1,41 @@
+"""Schedules per second of a batch computed inline and in pools of 1, 4 and 8 processes."""
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from src.config import settings
+from src.utils.schedule_executor import ScheduleExecutor, ScheduleInput
+
+
+pytestmark = [pytest.mark.anyio, pytest.mark.benchmark]
+
+LOANS: int = 1000
+LOAN_TERM: int = 360
+
+
+@pytest.mark.parametrize(("mode", "workers"), [("inline", 1), ("process", 1), ("process", 4), ("process", 8)])
+async def test_compute_many(event_loop_lease, mode: str, workers: int):
+    inputs: list[ScheduleInput] = [
+        ScheduleInput(
+            loan_amount=Decimal(100000 + index),
+            interest_rate_percent=Decimal("10.75"),
+            loan_term=LOAN_TERM,
+            start_date=date(2024, 1, 31),
+            payments=[],
+        )
+        for index in range(LOANS)
+    ]
+    executor: ScheduleExecutor = ScheduleExecutor(mode=mode, workers=workers, chunk_size=settings.schedule.chunk_size)
+    try:
+        # the pool is started by a first batch
+        await executor.compute_many(inputs[:workers])
+        started_at: float = time.perf_counter()
+        results = await executor.compute_many(inputs)
+        seconds: float = time.perf_counter() - started_at
+    finally:
+        executor.shutdown()
+
+    assert len(results) == LOANS
+    print(f"\n{mode}, {workers} workers: {LOANS / seconds:,.0f} schedules of {LOAN_TERM} payments/s")
@@ -0,0 +1,64 @@
+"""Bytes per row in Redis and µs per schedule of the cached schedule formats.
+
+The schedules were cached as orjson arrays of the payment dicts, read back through the response
+models. They are cached as packed rows rendered to JSON on every read; the members could be
+cached as their JSON instead, joined on the read, at several times the bytes.
+"""
+import uuid
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+import orjson
+import pytest
+
+from src.schemas.loan_payments import LoanPaymentRead
+from src.utils.amortization import compute_schedule
+from src.utils.schedule_packing import pack_payment, render_payments
+from src.utils.serialization import dumps, join_json_array
+from tests.benchmarks import orjson_default, us_per_call
+
+
+pytestmark = pytest.mark.benchmark
+
+LOAN_TERM: int = 360
+
+
+def test_cached_schedule_formats():
+    loan_id: uuid.UUID = uuid.uuid4()
+    rows: list[dict[str, Any]] = [
+        {"id": uuid.uuid4(), "loan_id": loan_id, **row}
+        for row in compute_schedule(
+            loan_amount=Decimal("100000"),
+            interest_rate_percent=Decimal("10.75"),
+            loan_term=LOAN_TERM,
+            start_date=date(2024, 1, 31),
+        ).rows()
+    ]
+
+    orjson_schedule: bytes = orjson.dumps(rows, default=orjson_default)
+    json_members: list[bytes] = [dumps(LoanPaymentRead(**row)) for row in rows]
+    packed_members: list[bytes] = [pack_payment(row) for row in rows]
+    # the served bodies of the cached formats are the same
+    assert join_json_array(json_members) == render_payments(packed_members, loan_id=loan_id)
+
+    formats: dict[str, tuple[int, float, float]] = {
+        "orjson dicts": (
+            len(orjson_schedule),
+            us_per_call(lambda: orjson.dumps(rows, default=orjson_default)),
+            us_per_call(lambda: dumps([LoanPaymentRead(**payment) for payment in orjson.loads(orjson_schedule)])),
+        ),
+        "JSON members": (
+            sum(map(len, json_members)),
+            us_per_call(lambda: [dumps(LoanPaymentRead(**row)) for row in rows]),
+            us_per_call(lambda: join_json_array(json_members)),
+        ),
+        "packed rows": (
+            sum(map(len, packed_members)),
+            us_per_call(lambda: [pack_payment(row) for row in rows]),
+            us_per_call(lambda: render_payments(packed_members, loan_id=loan_id)),
+        ),
+    }
+    print(f"\n{'format':<14}{'bytes/row':>10}{'write µs':>10}{'read µs':>10}{'read µs/row':>12}")
+    for name, (size, write, read) in formats.items():
+        print(f"{name:<14}{size / LOAN_TERM:>10.0f}{write:>10.0f}{read:>10.0f}{read / LOAN_TERM:>12.2f}")
@@ -0,0 +1,65 @@
+"""µs of the native serialization against orjson with the ``orjson_default`` callback it replaced."""
+import uuid
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+import orjson
+import pytest
+from pydantic import TypeAdapter
+
+from src.schemas.loan_payments import LoanPaymentRead
+from src.utils.amortization import compute_schedule
+from src.utils.serialization import dumps
+from tests.benchmarks import orjson_default, us_per_call
+
+
+pytestmark = pytest.mark.benchmark
+
+VALUES: int = 10_000
+LOAN_TERM: int = 360
+
+
+def print_results(title: str, count: int, results: dict[str, float]) -> None:
+    print(f"\n{title}")
+    for name, us in results.items():
+        print(f"  {name:<34}{us:>10.0f} µs{us * 1000 / count:>10.0f} ns each")
+
+
+def test_values():
+    decimals: list[Decimal] = [Decimal(index) / 100 for index in range(VALUES)]
+    uuids: list[uuid.UUID] = [uuid.uuid4() for _ in range(VALUES)]
+    dates: list[date] = [date.fromordinal(730_000 + index) for index in range(VALUES)]
+    for name, values in (("decimals", decimals), ("UUIDs", uuids), ("dates", dates)):
+        print_results(f"{VALUES} {name}", VALUES, {
+            "dumps": us_per_call(lambda: dumps(values), rounds=10),
+            "orjson.dumps with orjson_default": us_per_call(
+                lambda: orjson.dumps(values, default=orjson_default),
+                rounds=10,
+            ),
+        })
+
+
+def test_schedule():
+    loan_id: uuid.UUID = uuid.uuid4()
+    payments: list[LoanPaymentRead] = [
+        LoanPaymentRead(id=uuid.uuid4(), loan_id=loan_id, **row)
+        for row in compute_schedule(
+            loan_amount=Decimal("100000"),
+            interest_rate_percent=Decimal("10.75"),
+            loan_term=LOAN_TERM,
+            start_date=date(2024, 1, 31),
+        ).rows()
+    ]
+    dicts: list[dict[str, Any]] = [payment.model_dump() for payment in payments]
+    adapter: TypeAdapter[list[LoanPaymentRead]] = TypeAdapter(list[LoanPaymentRead])
+    assert dumps(payments) == adapter.dump_json(payments)
+
+    print_results(f"a schedule of {LOAN_TERM} payments", LOAN_TERM, {
+        "dumps of the models": us_per_call(lambda: dumps(payments)),
+        "dump_json of the response model": us_per_call(lambda: adapter.dump_json(payments)),
+        "orjson.dumps of the dicts": us_per_call(lambda: orjson.dumps(dicts, default=orjson_default)),
+        "orjson.dumps of the model dumps": us_per_call(
+            lambda: orjson.dumps([payment.model_dump() for payment in payments], default=orjson_default),
+        ),
+    })
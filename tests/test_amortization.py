@@ -0,0 +1,186 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from src.utils.amortization import ScheduleError, compute_schedule, compute_schedule_tail, payment_plan
+from src.utils.schedule_executor import ScheduleInput, compute_schedules
+
+
+def schedule_input(**kwargs) -> ScheduleInput:
+    return ScheduleInput(**{
+        "loan_amount": Decimal("100000"),
+        "interest_rate_percent": Decimal("10.75"),
+        "loan_term": 12,
+        "start_date": date(2024, 1, 31),
+        "payments": [],
+        **kwargs,
+    })
+
+
+def test_payment_plan_without_date():
+    with pytest.raises(ScheduleError):
+        payment_plan(date(2024, 1, 31), 12, Decimal("100"), [(date(2024, 3, 1), None), (None, Decimal("10"))])
+
+
+def test_schedule_tail_without_date():
+    with pytest.raises(ScheduleError):
+        compute_schedule_tail(
+            loan_amount=Decimal("100000"),
+            interest_rate_percent=Decimal("10.75"),
+            loan_term=12,
+            first_payment_number=3,
+            previous_date=date(2024, 3, 31),
+            previous_balance=Decimal("80000"),
+            payments=[(None, Decimal("5000"))],
+        )
+
+
+def test_batch_without_date_fails_only_its_item():
+    results = compute_schedules([
+        schedule_input(),
+        schedule_input(payments=[(None, None)]),
+    ])
+
+    assert len(list(results[0].rows())) == 12
+    assert isinstance(results[1], ScheduleError)
+
+
+def test_schedule_with_dates():
+    schedule = compute_schedule(**schedule_input(payments=[(date(2024, 3, 1), Decimal("20000"))]))
+
+    rows = list(schedule.rows())
+    assert rows[0]["payment_date"] == date(2024, 3, 1)
+    assert rows[0]["payment_amount"] == Decimal("20000.00")
+    assert rows[-1]["remaining_balance"] == 0
+
+
+# the schedules of the loan endpoint before the engine was column-oriented, the rows are
+# (payment_date, incoming_balance, payment_amount, interest_amount, principal_amount, remaining_balance,
+# year_part, days_in_year)
+PINNED_SCHEDULES: dict[str, tuple[dict[str, ...], list[tuple[str, ...]]]] = {
+    "year_boundary": (
+        {
+            "loan_amount": Decimal("50000"),
+            "interest_rate_percent": Decimal("12.5"),
+            "loan_term": 4,
+            "start_date": date(2022, 11, 15),
+            "payments": [],
+        },
+        [
+            ("2022-12-15", "50000", "12827.21", "513.70", "12313.51", "37686.49",
+             "0.08219178082191780821917808219", "365"),
+            ("2023-01-15", "37686.49", "12827.21", "400.10", "12427.11", "25259.38",
+             "0.08493150684931506621187049735", "365"),
+            ("2023-02-15", "25259.38", "12827.21", "268.16", "12559.05", "12700.33",
+             "0.08493150684931506849315068493", "365"),
+            ("2023-03-15", "12700.33", "12822.11", "121.78", "12700.33", "0.00",
+             "0.07671232876712328767123287671", "365"),
+        ],
+    ),
+    "leap_year": (
+        {
+            "loan_amount": Decimal("100000"),
+            "interest_rate_percent": Decimal("10.75"),
+            "loan_term": 4,
+            "start_date": date(2023, 12, 31),
+            "payments": [],
+        },
+        [
+            ("2024-01-31", "100000", "25562.39", "910.52", "24651.87", "75348.13",
+             "0.08469945355191256519677978076", "366"),
+            ("2024-03-02", "75348.13", "25562.39", "686.06", "24876.33", "50471.80",
+             "0.08469945355191256830601092896", "366"),
+            ("2024-04-02", "50471.80", "25562.39", "459.56", "25102.83", "25368.97",
+             "0.08469945355191256830601092896", "366"),
+            ("2024-05-02", "25368.97", "25592.51", "223.54", "25368.97", "0.00",
+             "0.08196721311475409836065573770", "366"),
+        ],
+    ),
+    "overrides": (
+        {
+            "loan_amount": Decimal("30000"),
+            "interest_rate_percent": Decimal("8"),
+            "loan_term": 5,
+            "start_date": date(2024, 1, 31),
+            "payments": [(date(2024, 2, 20), Decimal("10000")), (date(2024, 4, 5), None)],
+        },
+        [
+            ("2024-02-20", "30000", "10000", "131.15", "9868.85", "20131.15",
+             "0.05464480874316939890710382514", "366"),
+            ("2024-04-05", "20131.15", "6120.53", "198.01", "5922.52", "14208.63",
+             "0.1229508196721311475409836066", "366"),
+            ("2024-05-05", "14208.63", "6120.53", "93.17", "6027.36", "8181.27",
+             "0.08196721311475409836065573770", "366"),
+            ("2024-06-05", "8181.27", "6120.53", "55.44", "6065.09", "2116.18",
+             "0.08469945355191256830601092896", "366"),
+            ("2024-07-05", "2116.18", "2130.06", "13.88", "2116.18", "0.00",
+             "0.08196721311475409836065573770", "366"),
+        ],
+    ),
+    "early_payoff": (
+        {
+            "loan_amount": Decimal("20000"),
+            "interest_rate_percent": Decimal("9.9"),
+            "loan_term": 6,
+            "start_date": date(2024, 5, 10),
+            "payments": [(date(2024, 6, 10), Decimal("5000")), (date(2024, 7, 1), Decimal("30000"))],
+        },
+        [
+            ("2024-06-10", "20000", "5000", "167.70", "4832.30", "15167.70",
+             "0.08469945355191256830601092896", "366"),
+            ("2024-07-01", "15167.70", "15253.86", "86.16", "15167.70", "0.00",
+             "0.05737704918032786885245901639", "366"),
+        ],
+    ),
+    "exactly_loan_term": (
+        {
+            "loan_amount": Decimal("12000"),
+            "interest_rate_percent": Decimal("6"),
+            "loan_term": 3,
+            "start_date": date(2024, 2, 29),
+            "payments": [
+                (date(2024, 3, 29), Decimal("4000")),
+                (date(2024, 4, 29), Decimal("4000")),
+                (date(2024, 5, 29), Decimal("4000")),
+            ],
+        },
+        [
+            ("2024-03-29", "12000", "4000", "57.05", "3942.95", "8057.05",
+             "0.07923497267759562841530054645", "366"),
+            ("2024-04-29", "8057.05", "4000", "40.95", "3959.05", "4098.00",
+             "0.08469945355191256830601092896", "366"),
+            ("2024-05-29", "4098.00", "4118.15", "20.15", "4098.00", "0.00",
+             "0.08196721311475409836065573770", "366"),
+        ],
+    ),
+}
+
+
+@pytest.mark.parametrize("name", PINNED_SCHEDULES)
+def test_pinned_schedule(name: str):
+    loan, expected = PINNED_SCHEDULES[name]
+    rows = list(compute_schedule(**loan).rows())
+
+    assert [row["payment_number"] for row in rows] == list(range(1, len(expected) + 1))
+    assert [
+        (
+            row["payment_date"],
+            row["incoming_balance"],
+            row["payment_amount"],
+            row["interest_amount"],
+            row["principal_amount"],
+            row["remaining_balance"],
+            row["year_part"],
+            row["days_in_year"],
+        )
+        for row in rows
+    ] == [
+        (date.fromisoformat(payment_date), *map(Decimal, amounts), int(days))
+        for payment_date, *amounts, days in expected
+    ]
+
+
+def test_interest_greater_than_payment():
+    with pytest.raises(ScheduleError, match=r"is 100\.00, while the amount of interest for this payment is 881\.15$"):
+        compute_schedule(**schedule_input(payments=[(date(2024, 3, 1), Decimal("100"))]))
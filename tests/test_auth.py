@@ -0,0 +1,114 @@
+"""The verified tokens are cached per worker, the revoked ones are denied through Redis."""
+import socket
+import time
+import uuid
+from datetime import timedelta
+from typing import AsyncIterator
+
+import fakeredis
+import httpx
+import pytest
+import redis.asyncio as aioredis
+from fastapi import HTTPException
+
+from src.auth.jwt_handler import create_access_token, hash_token, revoke_access_token, verify_access_token
+from src.auth.token_cache import verified_tokens
+from src.cache.client import cache_client
+from src.schemas.token import TokenData
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def token() -> str:
+    return create_access_token(f"user-{uuid.uuid4().hex[:12]}@example.com", uuid.uuid4())
+
+
+@pytest.fixture
+async def redis_down(event_loop_lease, monkeypatch: pytest.MonkeyPatch) -> AsyncIterator[None]:
+    """Send the cache commands to a port nobody listens on."""
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port: int = free_socket.getsockname()[1]
+    client: aioredis.Redis = aioredis.Redis(port=port, socket_connect_timeout=0.1, socket_timeout=0.1)
+    monkeypatch.setattr(cache_client, "client", client)
+    yield
+    await client.aclose()
+
+
+def test_token_cache_expiry(monkeypatch: pytest.MonkeyPatch):
+    token_data: TokenData = TokenData(email="user@example.com", user_id=uuid.uuid4(), expires_at=0)
+    verified_tokens.set("expired", token_data, expires_at=time.time() - 1)
+    verified_tokens.set("valid", token_data, expires_at=time.time() + 60)
+    assert verified_tokens.get("expired") is None
+    assert verified_tokens.get("valid") == token_data
+
+    # an entry is kept for ``ttl`` at most, also when the token is valid longer
+    monkeypatch.setattr(verified_tokens, "ttl", -1)
+    verified_tokens.set("valid", token_data, expires_at=time.time() + 60)
+    assert verified_tokens.get("valid") is None
+
+
+def test_token_cache_evicts_least_recent(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(verified_tokens, "max_size", 2)
+    token_data: TokenData = TokenData(email="user@example.com", user_id=uuid.uuid4(), expires_at=0)
+    for token_hash in ("first", "second"):
+        verified_tokens.set(token_hash, token_data, expires_at=time.time() + 60)
+    assert verified_tokens.get("first") == token_data
+    verified_tokens.set("third", token_data, expires_at=time.time() + 60)
+    assert verified_tokens.get("second") is None
+    assert verified_tokens.get("first") == verified_tokens.get("third") == token_data
+    for token_hash in ("first", "third"):
+        verified_tokens.discard(token_hash)
+
+
+async def test_verified_token_cached(token: str, cache: fakeredis.FakeAsyncRedis):
+    token_data: TokenData = await verify_access_token(token)
+    hits: int = verified_tokens.hits
+    # the denylist is not read again while the token is cached
+    await cache.set(f"token:revoked:{hash_token(token)}", b"1")
+    assert await verify_access_token(token) == token_data
+    assert verified_tokens.hits == hits + 1
+
+
+@pytest.mark.parametrize("expires_delta", [timedelta(seconds=-1), timedelta(minutes=5)])
+async def test_rejected_token(expires_delta: timedelta, cache: fakeredis.FakeAsyncRedis):
+    token: str = create_access_token("user@example.com", uuid.uuid4(), expires_delta=expires_delta)
+    if expires_delta > timedelta(0):
+        # revoked by another worker
+        await cache.set(f"token:revoked:{hash_token(token)}", b"1")
+    with pytest.raises(HTTPException) as error:
+        await verify_access_token(token)
+    assert error.value.status_code == 401
+
+
+async def test_revoked_token(token: str, cache: fakeredis.FakeAsyncRedis):
+    token_data: TokenData = await verify_access_token(token)
+    await revoke_access_token(token, token_data)
+    assert await cache.ttl(f"token:revoked:{hash_token(token)}") > 0
+    with pytest.raises(HTTPException) as error:
+        await verify_access_token(token)
+    assert error.value.status_code == 401
+
+
+async def test_redis_down(token: str, redis_down):
+    # the token is accepted but not cached, so that the denylist is checked once Redis is back
+    token_data: TokenData = await verify_access_token(token)
+    assert verified_tokens.get(hash_token(token)) is None
+
+    with pytest.raises(HTTPException) as error:
+        await revoke_access_token(token, token_data)
+    assert error.value.status_code == 503
+
+
+async def test_logout(client: httpx.AsyncClient, headers: dict[str, str]):
+    response: httpx.Response = await client.get("/api/v1/loans/", headers=headers)
+    assert response.status_code == 200, response.text
+    response = await client.post("/api/v1/users/logout", headers=headers)
+    assert response.status_code == 200, response.text
+
+    response = await client.get("/api/v1/loans/", headers=headers)
+    assert response.status_code == 401, response.text
+    response = await client.post("/api/v1/users/logout", headers=headers)
+    assert response.status_code == 401, response.text
@@ -0,0 +1,85 @@
+import asyncio
+import random
+import uuid
+
+import httpx
+import pytest
+
+from src.cache.client import CurrentRead, VersionWrite, cache_client
+from src.cache.keys import LOANS_NAME, cache_keys, loan_name, schedule_name
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def read(email: str, name: str) -> CurrentRead[bytes]:
+    return await cache_keys.read_current(
+        email,
+        name,
+        read=lambda versioned: cache_client.get_current_decoded_or_missing(versioned, decode=bytes),
+    )
+
+
+async def test_read_racing_a_bump_is_unreachable(cache):
+    email: str = f"user-{uuid.uuid4().hex[:12]}@example.com"
+    name: str = loan_name(uuid.uuid4())
+    old_read, list_read = await read(email, name), await read(email, LOANS_NAME)
+
+    # a read of the data before the change caches it after the change was committed
+    versions = await cache_keys.bump(email, name)
+    async with cache_client.batch() as batch:
+        batch.set(old_read.key, b"stale").set(list_read.key, b"list")
+
+    new_read, new_list_read = await read(email, name), await read(email, LOANS_NAME)
+    assert versions[0].previous == old_read.key
+    assert versions[0].current == new_read.key != old_read.key
+    assert new_read.value is None
+    # the names not bumped keep their keys
+    assert new_list_read.key == list_read.key
+    assert new_list_read.value == b"list"
+
+
+async def test_bump_writes_the_new_keys(cache):
+    email: str = f"user-{uuid.uuid4().hex[:12]}@example.com"
+    name, schedule = loan_name(uuid.uuid4()), schedule_name(uuid.uuid4())
+    range_read = lambda versioned: cache_client.get_current_range(versioned, 0, -1, decode=list)
+
+    await cache_keys.bump(
+        email, name, schedule,
+        writes={name: VersionWrite.set(b"loan"), schedule: VersionWrite.set_sorted({b"a": 1, b"b": 2})},
+    )
+    assert (await read(email, name)).value == b"loan"
+    assert (await cache_keys.read_current(email, schedule, read=range_read)).value == [b"a", b"b"]
+
+    versions = await cache_keys.bump(email, schedule, writes={schedule: VersionWrite.patch_sorted([b"a"], {b"c": 3})})
+    assert (await cache_keys.read_current(email, schedule, read=range_read)).value == [b"b", b"c"]
+
+    # nothing is patched without the previous set
+    await cache.delete(versions[0].current)
+    await cache_keys.bump(email, schedule, writes={schedule: VersionWrite.patch_sorted([], {b"d": 4})})
+    assert (await cache_keys.read_current(email, schedule, read=range_read)).value is None
+
+
+async def test_interleaved_reads_and_writes(client: httpx.AsyncClient, headers: dict[str, str], loan_id: str):
+    """After each round of concurrent requests, the reads see the last change of the round."""
+    for round_number in range(20):
+        requests: list = [
+            client.put(f"/api/v1/loans/{loan_id}", json={"description": f"round {round_number}"}, headers=headers),
+            *(client.get(f"/api/v1/loans/{loan_id}", headers=headers) for _ in range(4)),
+            *(client.get("/api/v1/loans/", headers=headers) for _ in range(3)),
+            *(client.get(f"/api/v1/loans/{loan_id}/payments?limit=3", headers=headers) for _ in range(4)),
+        ]
+        if round_number % 2 == 0:
+            requests.append(client.post(f"/api/v1/loans/{loan_id}/payments", json=[], headers=headers))
+        else:
+            requests.append(client.delete(f"/api/v1/loans/{loan_id}/payments", headers=headers))
+        random.shuffle(requests)
+        for response in await asyncio.gather(*requests):
+            assert response.status_code < 500, response.text
+
+        loan: httpx.Response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+        loans: httpx.Response = await client.get("/api/v1/loans/", headers=headers)
+        schedule: httpx.Response = await client.get(f"/api/v1/loans/{loan_id}/payments?limit=3", headers=headers)
+        assert loan.json()["description"] == f"round {round_number}"
+        assert loans.json()[0]["description"] == f"round {round_number}"
+        assert schedule.status_code == (200 if round_number % 2 == 0 else 404)
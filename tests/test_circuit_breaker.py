@@ -0,0 +1,185 @@
+"""The circuit breaker against a Redis server that is killed or stopped mid-run."""
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import AsyncIterator, Iterator
+
+import httpx
+import pytest
+import redis
+import redis.asyncio as aioredis
+
+from src.cache.breaker import BreakerConnection, CircuitOpenError, circuit_breaker
+from src.cache.client import cache_client
+
+
+pytestmark = pytest.mark.anyio
+
+FAILURE_THRESHOLD: int = 3
+RESET_TIMEOUT: float = 0.5
+SOCKET_TIMEOUT: float = 0.2
+
+SERVER: str = """
+import sys
+from fakeredis import TcpFakeServer
+TcpFakeServer(("127.0.0.1", int(sys.argv[1])), server_type="redis").serve_forever()
+"""
+
+
+class RedisServer:
+    """An in-memory Redis served on a TCP port by a process of its own."""
+
+    def __init__(self, port: int):
+        self.port: int = port
+        self.process: subprocess.Popen | None = None
+
+    def start(self) -> None:
+        self.process = subprocess.Popen([sys.executable, "-c", SERVER, str(self.port)])
+        deadline: float = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.1).close()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+    def pause(self) -> None:
+        os.kill(self.process.pid, signal.SIGSTOP)
+
+    def resume(self) -> None:
+        os.kill(self.process.pid, signal.SIGCONT)
+
+
+@pytest.fixture
+def redis_server() -> Iterator[RedisServer]:
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port: int = free_socket.getsockname()[1]
+    server: RedisServer = RedisServer(port)
+    server.start()
+    yield server
+    if server.process.poll() is None:
+        server.resume()
+        server.kill()
+
+
+@pytest.fixture
+def breaker(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(circuit_breaker, "failure_threshold", FAILURE_THRESHOLD)
+    monkeypatch.setattr(circuit_breaker, "reset_timeout", RESET_TIMEOUT)
+    monkeypatch.setattr(circuit_breaker, "failures", 0)
+    monkeypatch.setattr(circuit_breaker, "opened_at", None)
+    monkeypatch.setattr(circuit_breaker, "probe", None)
+
+
+@pytest.fixture
+async def redis_client(redis_server: RedisServer, breaker, event_loop_lease) -> AsyncIterator[aioredis.Redis]:
+    client: aioredis.Redis = aioredis.from_url(
+        url=f"redis://127.0.0.1:{redis_server.port}",
+        socket_timeout=SOCKET_TIMEOUT,
+        socket_connect_timeout=SOCKET_TIMEOUT,
+        connection_class=BreakerConnection,
+    )
+    yield client
+    await client.aclose()
+
+
+async def _fail_until_open(client: aioredis.Redis) -> None:
+    for _ in range(FAILURE_THRESHOLD):
+        with pytest.raises(redis.exceptions.ConnectionError):
+            await client.get("key")
+    assert circuit_breaker.opened_at is not None
+
+
+async def _rejected_fast(client: aioredis.Redis) -> None:
+    started_at: float = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        await client.get("key")
+    assert time.monotonic() - started_at < SOCKET_TIMEOUT / 10
+
+
+async def _recovers(client: aioredis.Redis) -> None:
+    await asyncio.sleep(RESET_TIMEOUT)
+    assert await client.get("key") == b"value"
+    assert circuit_breaker.opened_at is None
+    assert circuit_breaker.failures == 0
+
+
+async def test_killed_server(redis_server: RedisServer, redis_client: aioredis.Redis):
+    await redis_client.set("key", b"value")
+    redis_server.kill()
+
+    await _fail_until_open(redis_client)
+    await _rejected_fast(redis_client)
+
+    redis_server.start()
+    # the restarted server is empty
+    await asyncio.sleep(RESET_TIMEOUT)
+    assert await redis_client.get("key") is None
+    await redis_client.set("key", b"value")
+    await _recovers(redis_client)
+
+
+async def test_unresponsive_server(redis_server: RedisServer, redis_client: aioredis.Redis):
+    await redis_client.set("key", b"value")
+    redis_server.pause()
+
+    # the timeouts count as failures and are raised as connection errors
+    await _fail_until_open(redis_client)
+    await _rejected_fast(redis_client)
+
+    redis_server.resume()
+    await _recovers(redis_client)
+
+
+async def test_failed_probe_opens_again(redis_server: RedisServer, redis_client: aioredis.Redis):
+    await redis_client.set("key", b"value")
+    redis_server.kill()
+    await _fail_until_open(redis_client)
+
+    await asyncio.sleep(RESET_TIMEOUT)
+    with pytest.raises(redis.exceptions.ConnectionError) as error:
+        await redis_client.get("key")
+    assert not isinstance(error.value, CircuitOpenError)
+    await _rejected_fast(redis_client)
+
+
+async def test_requests_served_while_open(
+        redis_server: RedisServer,
+        redis_client: aioredis.Redis,
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(cache_client, "client", redis_client)
+    response: httpx.Response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    redis_server.kill()
+
+    for _ in range(FAILURE_THRESHOLD):
+        response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+        assert response.status_code == 200, response.text
+    assert circuit_breaker.opened_at is not None
+
+    response = await client.put(f"/api/v1/loans/{loan_id}", json={"description": "changed"}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+    assert response.json()["description"] == "changed"
+
+    redis_server.start()
+    await asyncio.sleep(RESET_TIMEOUT)
+    for _ in range(2):
+        response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+        assert response.json()["description"] == "changed"
+    assert circuit_breaker.opened_at is None
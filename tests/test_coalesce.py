@@ -0,0 +1,117 @@
+"""Concurrent misses of a cache key are filled by a single rebuild."""
+import asyncio
+
+import fakeredis
+import httpx
+import pytest
+
+from src.cache.keys import LOANS_NAME, CacheKeys, schedule_name
+from src.config import settings
+from src.utils.metrics import metrics
+
+
+pytestmark = pytest.mark.anyio
+
+READS: int = 20
+
+
+def counters() -> tuple[float, float, float]:
+    """Return the statements, the rebuilds and the lock waits counted so far."""
+    snapshot: dict[str, float] = metrics.snapshot()
+    return (
+        snapshot.get("db.session.statements.sum", 0),
+        snapshot.get("cache.fill.rebuilds", 0),
+        snapshot.get("cache.fill.lock_waits", 0),
+    )
+
+
+async def concurrent_reads(
+        client: httpx.AsyncClient,
+        url: str,
+        headers: dict[str, str],
+) -> tuple[list[bytes], tuple[float, ...]]:
+    """Read the url ``READS`` times at once, return the bodies and how much the counters grew."""
+    before: tuple[float, float, float] = counters()
+    responses: list[httpx.Response] = await asyncio.gather(*(client.get(url, headers=headers) for _ in range(READS)))
+    for response in responses:
+        assert response.status_code == 200, response.text
+    return [response.content for response in responses], tuple(a - b for a, b in zip(counters(), before))
+
+
+@pytest.fixture
+async def schedule_url(client: httpx.AsyncClient, headers: dict[str, str], loan_id: str) -> str:
+    url: str = f"/api/v1/loans/{loan_id}/payments"
+    response: httpx.Response = await client.post(url, json=[], headers=headers)
+    assert response.status_code == 200, response.text
+    return f"{url}?limit=5"
+
+
+async def test_schedule_rebuilt_once(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        schedule_url: str,
+        cache: fakeredis.FakeAsyncRedis,
+):
+    await cache.flushall()
+    bodies, (statements, rebuilds, _) = await concurrent_reads(client, schedule_url, headers)
+    assert len(set(bodies)) == 1
+    assert (statements, rebuilds) == (1, 1)
+
+
+async def test_loans_rebuilt_once(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        cache: fakeredis.FakeAsyncRedis,
+):
+    await cache.flushall()
+    bodies, (statements, rebuilds, _) = await concurrent_reads(client, "/api/v1/loans/", headers)
+    assert len(set(bodies)) == 1
+    assert (statements, rebuilds) == (1, 1)
+
+
+async def test_lock_holder_fills_the_schedule(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        email: str,
+        loan_id: str,
+        schedule_url: str,
+        cache: fakeredis.FakeAsyncRedis,
+):
+    """The reads wait for the worker holding the lock of the key and are served what it wrote."""
+    await cache.flushall()
+    expected: bytes = (await client.get(schedule_url, headers=headers)).content
+    key: str = CacheKeys.key(email, schedule_name(loan_id), 0)
+    members: list[tuple[bytes, float]] = await cache.zrange(key, 0, -1, withscores=True)
+    await cache.delete(key)
+    await cache.set(f"lock:{key}", "other-worker", px=int(settings.cache.lock_ttl * 1000))
+
+    async def other_worker_rebuild() -> None:
+        await asyncio.sleep(settings.cache.lock_poll_interval * 3)
+        await cache.zadd(key, dict(members))
+
+    rebuild: asyncio.Task = asyncio.create_task(other_worker_rebuild())
+    bodies, (statements, rebuilds, lock_waits) = await concurrent_reads(client, schedule_url, headers)
+    await rebuild
+    assert set(bodies) == {expected}
+    # the reads of this worker share one wait
+    assert (statements, rebuilds, lock_waits) == (0, 0, 1)
+
+
+async def test_lock_wait_times_out(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        email: str,
+        loan_id: str,
+        cache: fakeredis.FakeAsyncRedis,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    """The reads rebuild the list themselves if the lock holder does not write it in time."""
+    monkeypatch.setattr(settings.cache, "lock_wait", settings.cache.lock_poll_interval * 3)
+    await cache.flushall()
+    key: str = CacheKeys.key(email, LOANS_NAME, 0)
+    await cache.set(f"lock:{key}:0-0", "other-worker", px=int(settings.cache.lock_ttl * 1000))
+
+    bodies, (statements, rebuilds, lock_waits) = await concurrent_reads(client, "/api/v1/loans/", headers)
+    assert len(set(bodies)) == 1
+    assert (statements, rebuilds, lock_waits) == (1, 0, 1)
@@ -0,0 +1,91 @@
+"""The exports are streamed in partitions, their memory does not grow with the number of rows."""
+import os
+import tracemalloc
+from typing import AsyncIterator
+from uuid import UUID, uuid4
+
+import httpx
+import orjson
+import pytest
+from sqlalchemy import text
+
+from src.database.connection import engine
+from src.services.loan_payments import LoanPaymentService
+from src.utils.export import ExportFormat
+
+
+pytestmark = pytest.mark.anyio
+
+ROWS: int = int(os.environ.get("TEST_EXPORT_ROWS", 1_000_000))
+PEAK_BYTES: int = 32 * 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+async def large_schedule(database, event_loop_lease) -> AsyncIterator[tuple[UUID, UUID]]:
+    """Return the ids of a loan and its owner, the loan has a schedule of ``ROWS`` payments."""
+    user_id: UUID = uuid4()
+    loan_id: UUID = uuid4()
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO users (id, email, hashed_password, is_active) VALUES (:id, :email, '', true)"),
+            {"id": user_id, "email": f"user-{user_id.hex[:12]}@example.com"},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO loans (id, name, start_date, interest_rate_percent, loan_amount, loan_term, user_id) "
+                "VALUES (:id, 'loan', DATE '2000-01-01', 10, 1000, 12, :user_id)"
+            ),
+            {"id": loan_id, "user_id": user_id},
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO loan_payments ("
+                "id, loan_id, payment_number, payment_date, payment_amount, interest_amount, principal_amount, "
+                "incoming_balance, remaining_balance, year_part, days_in_year"
+                ") SELECT gen_random_uuid(), :loan_id, number, DATE '2000-01-01' + number, "
+                "100.00, 1.00, 99.00, 1000.00, 901.00, 0.08, 365 FROM generate_series(1, :rows) AS number"
+            ),
+            {"loan_id": loan_id, "rows": ROWS},
+        )
+    yield loan_id, user_id
+    async with engine.begin() as conn:
+        # the loans and their payments are deleted with the user
+        await conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+
+
+@pytest.mark.parametrize("export_format", ExportFormat)
+async def test_schedule_export_memory(large_schedule: tuple[UUID, UUID], export_format: ExportFormat):
+    loan_id, user_id = large_schedule
+    lines: int = 0
+    size: int = 0
+    first_chunk: bytes = b""
+    tracemalloc.start()
+    try:
+        async for chunk in LoanPaymentService._stream_schedule(
+                loan_id=loan_id,
+                user_id=user_id,
+                export_format=export_format,
+        ):
+            first_chunk = first_chunk or chunk
+            lines += chunk.count(b"\n")
+            size += len(chunk)
+        peak: int = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    header_lines: int = 1 if export_format is ExportFormat.CSV else 0
+    assert lines == ROWS + header_lines
+    if export_format is ExportFormat.NDJSON:
+        assert orjson.loads(first_chunk.split(b"\n", 1)[0])["payment_number"] == 1
+    assert peak < PEAK_BYTES, f"{peak} bytes at peak for {size} bytes exported"
+
+
+async def test_schedule_export_response(client: httpx.AsyncClient, headers: dict[str, str], loan_id: str):
+    response: httpx.Response = await client.get(f"/api/v1/loans/{loan_id}/payments/export", headers=headers)
+    assert response.status_code == 404, response.text
+    await client.post(f"/api/v1/loans/{loan_id}/payments", json=[], headers=headers)
+
+    response = await client.get(f"/api/v1/loans/{loan_id}/payments/export?format=csv", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+    assert len(response.text.splitlines()) == 25
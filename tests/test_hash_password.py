@@ -0,0 +1,100 @@
+"""The password hashes run in a bounded pool, the other requests are served while logins queue."""
+import asyncio
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+
+from src.auth.hash_password import hash_password
+from src.utils.metrics import metrics
+from tests.conftest import LOAN
+
+
+pytestmark = pytest.mark.anyio
+
+LOGIN_RPS: float = float(os.environ.get("TEST_LOGIN_RPS", 4))
+LOAD_SECONDS: float = float(os.environ.get("TEST_LOAD_SECONDS", 2))
+LOANS_P99_SECONDS: float = 0.25
+
+
+def p99(latencies: list[float]) -> float:
+    return statistics.quantiles(latencies, n=100, method="inclusive")[98]
+
+
+async def test_semaphore_caps_concurrent_hashes(event_loop_lease, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(hash_password, "_semaphore", asyncio.Semaphore(2))
+    release: threading.Event = threading.Event()
+    lock: threading.Lock = threading.Lock()
+    concurrency: list[int] = [0, 0]
+
+    def blocking_hash(value: int) -> int:
+        with lock:
+            concurrency[0] += 1
+            concurrency[1] = max(concurrency)
+        release.wait(timeout=5)
+        with lock:
+            concurrency[0] -= 1
+        return value
+
+    tasks: list[asyncio.Task] = [asyncio.create_task(hash_password._run(blocking_hash, value)) for value in range(6)]
+    while hash_password.running < 2:
+        await asyncio.sleep(0.01)
+    snapshot: dict[str, float] = metrics.snapshot()
+    assert snapshot["auth.hash.running"] == 2
+    assert snapshot["auth.hash.queue_depth"] == 4
+
+    release.set()
+    assert await asyncio.gather(*tasks) == list(range(6))
+    # the pool has more workers than the semaphore lets in
+    assert concurrency[1] == 2
+    assert metrics.snapshot()["auth.hash.queue_depth"] == 0
+
+
+async def test_loans_served_during_logins(client: httpx.AsyncClient):
+    """Logins at ``LOGIN_RPS`` do not block the event loop serving the cached loans."""
+    email: str = f"user-{uuid.uuid4().hex[:12]}@example.com"
+    response: httpx.Response = await client.post("/api/v1/users/", json={"email": email, "password": "secret1"})
+    assert response.status_code == 201, response.text
+    response = await client.post("/api/v1/users/login", data={"username": email, "password": "secret1"})
+    headers: dict[str, str] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await client.post("/api/v1/loans/", json=LOAN, headers=headers)
+    assert response.status_code == 201, response.text
+
+    login_latencies: list[float] = []
+    loans_latencies: list[float] = []
+
+    async def login() -> None:
+        started_at: float = time.perf_counter()
+        login_response: httpx.Response = await client.post(
+            "/api/v1/users/login",
+            data={"username": email, "password": "secret1"},
+        )
+        assert login_response.status_code == 200, login_response.text
+        login_latencies.append(time.perf_counter() - started_at)
+
+    async def logins() -> None:
+        tasks: list[asyncio.Task] = []
+        deadline: float = time.perf_counter() + LOAD_SECONDS
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(login()))
+            await asyncio.sleep(1 / LOGIN_RPS)
+        await asyncio.gather(*tasks)
+
+    login_task: asyncio.Task = asyncio.create_task(logins())
+    while not login_task.done():
+        started_at: float = time.perf_counter()
+        loans_response: httpx.Response = await client.get("/api/v1/loans/", headers=headers)
+        assert loans_response.status_code == 200, loans_response.text
+        loans_latencies.append(time.perf_counter() - started_at)
+        await asyncio.sleep(0.01)
+    await login_task
+
+    print(
+        f"\n{len(login_latencies)} logins at {LOGIN_RPS:g} rps, p99 {p99(login_latencies) * 1000:.1f} ms;"
+        f" {len(loans_latencies)} loan lists, p99 {p99(loans_latencies) * 1000:.1f} ms"
+    )
+    assert p99(loans_latencies) < LOANS_P99_SECONDS
@@ -0,0 +1,133 @@
+import uuid
+
+import httpx
+import pytest
+
+from src.cache.client import cache_client
+from src.repositories.loan_payments import LoanPaymentRepository
+from src.utils.metrics import metrics
+from tests.conftest import LOAN
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_quote_payment_without_date(client: httpx.AsyncClient, headers: dict[str, str]):
+    quote: dict[str, ...] = {"loan": LOAN, "payments": [{"payment_date": None, "payment_amount": 1000}]}
+    response: httpx.Response = await client.post("/api/v1/loans/quote", json=quote, headers=headers)
+    assert response.status_code == 422, response.text
+
+    quote["payments"].append({"payment_date": "2024-03-31", "payment_amount": None})
+    response = await client.post("/api/v1/loans/quote", json=quote, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+async def test_amend_payment_without_date(client: httpx.AsyncClient, headers: dict[str, str], loan_id: str):
+    response: httpx.Response = await client.post(f"/api/v1/loans/{loan_id}/payments", json=[], headers=headers)
+    assert response.status_code == 200, response.text
+    response = await client.patch(
+        f"/api/v1/loans/{loan_id}/payments",
+        json={"from_payment_number": 3, "payments": [{"payment_date": None, "payment_amount": 1000}]},
+        headers=headers,
+    )
+    assert response.status_code == 422, response.text
+    assert response.json()["detail"] == "The date of each transmitted payment must be given"
+
+
+async def test_amend_concurrent_change(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    response: httpx.Response = await client.post(f"/api/v1/loans/{loan_id}/payments", json=[], headers=headers)
+    assert response.status_code == 200, response.text
+
+    async def delete_by_numbers(self, **kwargs) -> None:
+        """Leave the payments, as if another request inserted them again in the meantime."""
+
+    monkeypatch.setattr(LoanPaymentRepository, "delete_by_numbers", delete_by_numbers)
+    response = await client.patch(
+        f"/api/v1/loans/{loan_id}/payments",
+        json={"from_payment_number": 3, "payments": [{"payment_date": "2024-04-30", "payment_amount": 20000}]},
+        headers=headers,
+    )
+    assert response.status_code == 409, response.text
+
+
+async def test_missing_loan_cached(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        monkeypatch: pytest.MonkeyPatch,
+):
+    url: str = f"/api/v1/loans/{uuid.uuid4()}"
+    response: httpx.Response = await client.get(url, headers=headers)
+    assert response.status_code == 404, response.text
+
+    commands: list[str] = []
+    execute_command = cache_client.client.execute_command
+
+    async def counted_execute_command(*args, **kwargs):
+        commands.append(args[0])
+        return await execute_command(*args, **kwargs)
+
+    monkeypatch.setattr(cache_client.client, "execute_command", counted_execute_command)
+    statements: float = metrics.snapshot()["db.session.statements.sum"]
+    response = await client.get(url, headers=headers)
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == "The loan with supplied ID doesn't exist"
+    assert metrics.snapshot()["db.session.statements.sum"] == statements
+    # the generation of the key, the loan and the marker of a missing one are read in one round trip
+    assert len(commands) == 1, commands
+
+
+@pytest.mark.parametrize("data", [{"description": "changed"}, {"loan_term": 12}])
+async def test_update_missing_loan(client: httpx.AsyncClient, headers: dict[str, str], data: dict[str, ...]):
+    response: httpx.Response = await client.put(f"/api/v1/loans/{uuid.uuid4()}", json=data, headers=headers)
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == "The loan with supplied ID doesn't exist"
+
+
+async def test_create_schedules(client: httpx.AsyncClient, headers: dict[str, str], loan_id: str):
+    """Each item of the batch gets its own status, the results are in the order of the items."""
+    loan_ids: dict[str, str] = {"new": loan_id}
+    for name in ("scheduled", "bad payments"):
+        response: httpx.Response = await client.post("/api/v1/loans/", json={**LOAN, "name": name}, headers=headers)
+        assert response.status_code == 201, response.text
+        loan_ids[name] = response.json()["id"]
+    response = await client.post(f"/api/v1/loans/{loan_ids['scheduled']}/payments", json=[], headers=headers)
+    assert response.status_code == 200, response.text
+
+    other_email: str = f"user-{uuid.uuid4().hex[:12]}@example.com"
+    await client.post("/api/v1/users/", json={"email": other_email, "password": "secret1"})
+    response = await client.post("/api/v1/users/login", data={"username": other_email, "password": "secret1"})
+    other_headers: dict[str, str] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await client.post("/api/v1/loans/", json=LOAN, headers=other_headers)
+    loan_ids["foreign"] = response.json()["id"]
+    loan_ids["missing"] = str(uuid.uuid4())
+
+    items: list[dict[str, ...]] = [
+        {"loan_id": loan_ids["new"]},
+        {"loan_id": loan_ids["foreign"]},
+        {"loan_id": loan_ids["scheduled"]},
+        {"loan_id": loan_ids["missing"]},
+        {"loan_id": loan_ids["new"]},
+        # the interest of the first month is more than the payment
+        {"loan_id": loan_ids["bad payments"], "payments": [{"payment_date": "2024-02-29", "payment_amount": 1}]},
+    ]
+    response = await client.post("/api/v1/loans/payments", json=items, headers=headers)
+    assert response.status_code == 200, response.text
+    results: list[dict[str, ...]] = response.json()
+    assert [result["loan_id"] for result in results] == [item["loan_id"] for item in items]
+    assert [result["status_code"] for result in results] == [201, 404, 409, 404, 422, 422]
+    assert results[0]["payments_count"] == LOAN["loan_term"]
+    assert results[4]["detail"] == "The loan with supplied ID is repeated in the request"
+    assert results[5]["detail"].startswith("The amount of interest can not be greater than the payment amount.")
+
+    # only the schedule of the created item is stored
+    response = await client.get(f"/api/v1/loans/{loan_ids['new']}/payments", headers=headers)
+    assert len(response.json()) == LOAN["loan_term"]
+    response = await client.get(f"/api/v1/loans/{loan_ids['bad payments']}/payments", headers=headers)
+    assert response.status_code == 404, response.text
+    response = await client.get(f"/api/v1/loans/{loan_ids['foreign']}/payments", headers=other_headers)
+    assert response.status_code == 404, response.text
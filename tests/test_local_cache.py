@@ -0,0 +1,129 @@
+"""The per-worker cache of decoded values and its invalidation by the other workers."""
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Iterator
+
+import fakeredis
+import pytest
+from orjson import orjson
+
+from src.cache.client import CacheBatch, CurrentRead, VersionedName, cache_client
+from src.cache.keys import CacheKeys, loan_name
+from src.cache.local import LocalCache, listen_invalidations, local_cache
+from src.config import settings
+from tests.conftest import fake_server
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def enabled_local_cache(monkeypatch: pytest.MonkeyPatch) -> Iterator[LocalCache]:
+    monkeypatch.setattr(local_cache, "max_bytes", 1024 * 1024)
+    yield local_cache
+    local_cache.clear()
+
+
+@pytest.fixture
+async def other_worker(event_loop_lease) -> AsyncIterator[fakeredis.FakeAsyncRedis]:
+    """A client of another worker connected to the same Redis."""
+    client: fakeredis.FakeAsyncRedis = fakeredis.FakeAsyncRedis(server=fake_server)
+    yield client
+    await client.aclose()
+
+
+def test_evicts_least_recent_by_bytes():
+    cache: LocalCache = LocalCache(max_bytes=10, ttl=60, metrics_prefix="test.local")
+    cache.set("a", "A", size=4)
+    cache.set("b", "B", size=4, part="page:1")
+    assert cache.get("a") == "A"
+    cache.set("c", "C", size=4)
+    assert cache.get("b", "page:1") is None
+    assert (cache.get("a"), cache.get("c"), cache.size) == ("A", "C", 8)
+
+    # a value larger than the whole cache is not kept
+    cache.set("d", "D", size=11)
+    assert cache.get("d") is None
+    assert cache.size == 8
+
+
+def test_expires_after_ttl():
+    cache: LocalCache = LocalCache(max_bytes=10, ttl=0.01, metrics_prefix="test.local")
+    cache.set("a", "A", size=4)
+    assert cache.get("a") == "A"
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+def test_invalidates_all_parts():
+    cache: LocalCache = LocalCache(max_bytes=10, ttl=60, metrics_prefix="test.local")
+    cache.set("a", "page 1", size=2, part="page:1")
+    cache.set("a", "page 2", size=2, part="page:2")
+    cache.set("b", "B", size=2)
+    epoch: int = cache.epoch
+    cache.invalidate("a")
+    assert cache.epoch == epoch + 1
+    assert cache.get("a", "page:1") is cache.get("a", "page:2") is None
+    assert (cache.get("b"), cache.size) == ("B", 2)
+
+
+async def test_batch_publishes_invalidations(
+        enabled_local_cache: LocalCache,
+        other_worker: fakeredis.FakeAsyncRedis,
+        cache: fakeredis.FakeAsyncRedis,
+):
+    async with other_worker.pubsub() as pubsub:
+        await pubsub.subscribe(settings.cache.invalidation_channel)
+        await pubsub.get_message(timeout=1)
+        enabled_local_cache.set("key", b"value", size=5)
+        async with CacheBatch(cache) as batch:
+            batch.set("key", b"changed").delete("other")
+
+        message: dict = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+        assert orjson.loads(message["data"]) == ["key", "other"]
+    # the keys are dropped from the local cache of the worker writing them at once
+    assert enabled_local_cache.get("key") is None
+
+
+async def test_listens_to_other_workers(enabled_local_cache: LocalCache, other_worker: fakeredis.FakeAsyncRedis):
+    epoch: int = enabled_local_cache.epoch
+    listener: asyncio.Task = asyncio.create_task(listen_invalidations())
+    try:
+        # the listener clears the local cache once it is subscribed
+        while enabled_local_cache.epoch == epoch:
+            await asyncio.sleep(0.01)
+        enabled_local_cache.set("key", b"value", size=5)
+        enabled_local_cache.set("other", b"value", size=5)
+
+        await other_worker.publish(settings.cache.invalidation_channel, orjson.dumps(["key"]))
+        while enabled_local_cache.get("key") is not None:
+            await asyncio.sleep(0.01)
+        assert enabled_local_cache.get("other") == b"value"
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+@pytest.mark.parametrize("invalidated", [False, True])
+async def test_generation_read_during_invalidation(
+        invalidated: bool,
+        enabled_local_cache: LocalCache,
+        cache: fakeredis.FakeAsyncRedis,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    """A generation read while an invalidation arrived may be stale, so it is not kept."""
+    name: VersionedName = CacheKeys.versioned(f"user-{uuid.uuid4().hex[:12]}@example.com", loan_name(uuid.uuid4()))
+    read_current_script = cache_client._read_current_script
+
+    async def racing_read_current_script(*args, **kwargs) -> list:
+        result: list = await read_current_script(*args, **kwargs)
+        if invalidated:
+            enabled_local_cache.invalidate(name.generations_key)
+        return result
+
+    monkeypatch.setattr(cache_client, "_read_current_script", racing_read_current_script)
+    current: CurrentRead[bytes] = await cache_client.get_current_decoded_or_missing(name, decode=bytes)
+    kept: int | None = enabled_local_cache.get(name.generations_key, f"field:{name.name}")
+    assert kept == (None if invalidated else current.generation)
@@ -0,0 +1,149 @@
+"""The hot queries of the repositories are served by the expected index scans.
+
+The repository methods run in a transaction which is rolled back, their statements are
+explained with sequential scans disabled, so that the plans do not depend on the amount
+of data. A dropped or changed index shows as a different scan or index.
+"""
+from datetime import date
+from typing import Awaitable, Callable, Iterator
+from uuid import uuid4
+
+import pytest
+from orjson import orjson
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.connection import engine, session_maker
+from src.database.routing import read_from_primary
+from src.repositories.loan_payments import LoanPaymentRepository
+from src.repositories.loans import LoanRepository
+from src.repositories.users import UserRepository
+
+
+pytestmark = pytest.mark.anyio
+
+type Query = Callable[[AsyncSession], Awaitable]
+type Scan = tuple[str, str, str | None]
+# the node type, the relation and the indexes any of which may serve it
+type ExpectedScan = tuple[str, str, frozenset[str]]
+
+LOANS_BY_USER: ExpectedScan = ("Index Scan", "loans", frozenset({"uq_loans_user_id_name"}))
+PAYMENTS_BY_DATE: ExpectedScan = (
+    "Index Only Scan", "loan_payments", frozenset({"ix_loan_payments_loan_id_payment_date"}),
+)
+# the probes of the payments of a loan only filter on its id, which leads both unique indexes,
+# the planner chooses between them by the order they were created in
+PAYMENTS_OF_LOAN: ExpectedScan = (
+    "Index Only Scan",
+    "loan_payments",
+    frozenset({"uq_loan_payments_loan_id_payment_number", "ix_loan_payments_loan_id_payment_date"}),
+)
+
+QUERIES: dict[str, tuple[Query, list[ExpectedScan]]] = {
+    "user by email": (
+        lambda session: UserRepository(session).get(email="user@example.com"),
+        [("Index Scan", "users", frozenset({"uq_users_email"}))],
+    ),
+    "loans of user": (
+        lambda session: LoanRepository(session).get_all(user_id=uuid4(), limit=20),
+        [LOANS_BY_USER],
+    ),
+    "loans of user after name": (
+        lambda session: LoanRepository(session).get_all(user_id=uuid4(), after="loan", limit=20),
+        [LOANS_BY_USER],
+    ),
+    "loan by id": (
+        lambda session: LoanRepository(session).get(user_id=uuid4(), id=uuid4()),
+        [LOANS_BY_USER],
+    ),
+    "loans by ids": (
+        lambda session: LoanRepository(session).get_many(user_id=uuid4(), ids=[uuid4()]),
+        [LOANS_BY_USER],
+    ),
+    "schedule of loan": (
+        lambda session: LoanPaymentRepository(session).get_many(user_id=uuid4(), loan_id=uuid4(), limit=20),
+        [PAYMENTS_BY_DATE, LOANS_BY_USER],
+    ),
+    "schedule of loan after date": (
+        lambda session: LoanPaymentRepository(session).get_many(
+            user_id=uuid4(), loan_id=uuid4(), after=date(2024, 1, 1), limit=20,
+        ),
+        [PAYMENTS_BY_DATE, LOANS_BY_USER],
+    ),
+    "schedule with loan": (
+        lambda session: LoanPaymentRepository(session).get_with_loan(user_id=uuid4(), loan_id=uuid4()),
+        [LOANS_BY_USER, PAYMENTS_BY_DATE],
+    ),
+    "schedule state": (
+        lambda session: LoanPaymentRepository(session).get_state(user_id=uuid4(), loan_id=uuid4()),
+        [LOANS_BY_USER, LOANS_BY_USER, PAYMENTS_OF_LOAN],
+    ),
+    "scheduled loans": (
+        lambda session: LoanPaymentRepository(session).get_scheduled_loan_ids(loan_ids=[uuid4()]),
+        [PAYMENTS_OF_LOAN],
+    ),
+}
+
+
+def _scans(plan: dict) -> Iterator[Scan]:
+    subplans: list[dict] = plan.get("Plans", [])
+    if "Relation Name" in plan:
+        index: str | None = plan.get("Index Name")
+        if plan["Node Type"] == "Bitmap Heap Scan":
+            index = ", ".join(subplan["Index Name"] for subplan in subplans if "Index Name" in subplan)
+            subplans = [subplan for subplan in subplans if "Index Name" not in subplan]
+        yield plan["Node Type"], plan["Relation Name"], index
+    for subplan in subplans:
+        yield from _scans(subplan)
+
+
+async def _capture(query: Query) -> list[tuple[str, tuple]]:
+    statements: list[tuple[str, tuple]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    # the statements are captured on the primary, the replicas have the same indexes
+    read_from_primary()
+    try:
+        async with session_maker() as session:
+            await query(session)
+            await session.rollback()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+async def _explain(statement: str, parameters: tuple) -> dict:
+    async with engine.connect() as conn:
+        driver_connection = (await conn.get_raw_connection()).driver_connection
+        async with driver_connection.transaction():
+            await driver_connection.execute("SET LOCAL enable_seqscan = off")
+            # the asyncpg dialect uses the numbered placeholders of the driver
+            plan: str | list = await driver_connection.fetchval(f"EXPLAIN (FORMAT JSON) {statement}", *parameters)
+    # the dialect registers a json codec on its connections, the plain ones return text
+    if isinstance(plan, str):
+        plan = orjson.loads(plan)
+    return plan[0]["Plan"]
+
+
+@pytest.mark.parametrize("name", QUERIES)
+async def test_query_plan(name: str, database, event_loop_lease):
+    query, expected_scans = QUERIES[name]
+    scans: list[Scan] = []
+    for statement, parameters in await _capture(query):
+        scans.extend(_scans(await _explain(statement, parameters)))
+    unmatched: list[ExpectedScan] = list(expected_scans)
+    for scan in scans:
+        node_type, relation, index = scan
+        expected: ExpectedScan | None = next(
+            (
+                expected for expected in unmatched
+                if expected[:2] == (node_type, relation) and index in expected[2]
+            ),
+            None,
+        )
+        assert expected is not None, f"Unexpected {node_type} on {relation} using {index}, expected {unmatched}"
+        unmatched.remove(expected)
+    assert not unmatched, f"Missing scans {unmatched}"
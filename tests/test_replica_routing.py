@@ -0,0 +1,171 @@
+"""The reads and writes of the sessions go to the expected engines.
+
+The replicas are stand-ins: engines of the primary's database, so the routing is
+checked by the engines the statements are sent on.
+"""
+from collections import Counter
+from typing import AsyncIterator
+from uuid import uuid4
+
+import httpx
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+import src.database.connection
+from src.config import settings
+from src.database.connection import _create_engine, engine
+from src.database.models.users import User
+from src.database.routing import ReplicaRouter, RoutingSession, primary_reads, read_from_primary
+
+
+pytestmark = pytest.mark.anyio
+
+
+class Engines:
+    """The primary and two stand-in replicas, counting the statements sent on each."""
+
+    def __init__(self, replicas: list[AsyncEngine]):
+        self.replicas: list[AsyncEngine] = replicas
+        self.names: dict[Engine, str] = {engine.sync_engine: "primary"}
+        self.names.update({replica.sync_engine: f"replica {index}" for index, replica in enumerate(replicas)})
+        self.statements: Counter[str] = Counter()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements[self.names[conn.engine]] += 1
+
+    def session_maker(self, balancing: str = "round_robin") -> async_sessionmaker[AsyncSession]:
+        return async_sessionmaker[AsyncSession](
+            sync_session_class=RoutingSession,
+            router=ReplicaRouter(
+                primary=engine.sync_engine,
+                replicas=[replica.sync_engine for replica in self.replicas],
+                balancing=balancing,
+            ),
+            autocommit=False,
+            autoflush=False,
+            expire_on_commit=False,
+        )
+
+    def counted(self) -> dict[str, int]:
+        """Return the statements counted since the last call."""
+        statements: dict[str, int] = dict(self.statements)
+        self.statements.clear()
+        return statements
+
+
+@pytest.fixture
+async def engines(database, event_loop_lease) -> AsyncIterator[Engines]:
+    engines: Engines = Engines([_create_engine(settings.db.url) for _ in range(2)])
+    for sync_engine in engines.names:
+        event.listen(sync_engine, "before_cursor_execute", engines.before_cursor_execute)
+    primary_reads.set(False)
+    yield engines
+    primary_reads.set(False)
+    for sync_engine in engines.names:
+        event.remove(sync_engine, "before_cursor_execute", engines.before_cursor_execute)
+    for replica in engines.replicas:
+        await replica.dispose()
+
+
+async def test_reads_from_replica_until_write(engines: Engines):
+    async with engines.session_maker()() as session:
+        await session.execute(select(User).limit(1))
+        await session.execute(select(User).limit(1))
+        # a session keeps its replica
+        assert engines.counted() == {"replica 0": 2}
+
+        session.add(User(id=uuid4(), email=f"user-{uuid4().hex[:12]}@example.com", hashed_password=""))
+        await session.flush()
+        assert engines.counted() == {"primary": 1}
+
+        # then reads what it wrote
+        await session.execute(select(User).limit(1))
+        assert engines.counted() == {"primary": 1}
+        await session.rollback()
+
+
+async def test_locking_reads_from_primary(engines: Engines):
+    async with engines.session_maker()() as session:
+        await session.execute(select(User).limit(1).with_for_update())
+        assert engines.counted() == {"primary": 1}
+        await session.execute(select(User).limit(1))
+        assert engines.counted() == {"replica 0": 1}
+
+
+async def test_read_from_primary(engines: Engines):
+    async with engines.session_maker()() as session:
+        read_from_primary()
+        await session.execute(select(User).limit(1))
+        assert engines.counted() == {"primary": 1}
+
+
+async def test_round_robin(engines: Engines):
+    session_maker: async_sessionmaker[AsyncSession] = engines.session_maker("round_robin")
+    for replica_index in (0, 1, 0, 1):
+        async with session_maker() as session:
+            await session.execute(select(User).limit(1))
+        assert engines.counted() == {f"replica {replica_index}": 1}
+
+
+async def test_least_connections(engines: Engines):
+    session_maker: async_sessionmaker[AsyncSession] = engines.session_maker("least_connections")
+    async with engines.replicas[0].connect():
+        for _ in range(2):
+            async with session_maker() as session:
+                await session.execute(select(User).limit(1))
+            assert engines.counted() == {"replica 1": 1}
+    async with engines.replicas[1].connect():
+        async with session_maker() as session:
+            await session.execute(select(User).limit(1))
+        assert engines.counted() == {"replica 0": 1}
+
+
+async def test_request_sessions(
+        engines: Engines,
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(src.database.connection, "session_maker", engines.session_maker())
+    monkeypatch.setattr(settings.cache, "bypass", True)
+    engines.counted()
+
+    response: httpx.Response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert set(engines.counted()) == {"replica 0"}
+
+    # the sessions of the other methods read from the primary what they change
+    response = await client.put(f"/api/v1/loans/{loan_id}", json={"description": "changed"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert set(engines.counted()) == {"primary"}
+
+
+async def test_recent_changes_read_from_primary(
+        engines: Engines,
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        monkeypatch: pytest.MonkeyPatch,
+        cache,
+):
+    monkeypatch.setattr(src.database.connection, "session_maker", engines.session_maker())
+    response: httpx.Response = await client.put(
+        f"/api/v1/loans/{loan_id}", json={"description": "changed"}, headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    await cache.delete(*[key async for key in cache.scan_iter("*.loan:*")])
+    engines.counted()
+
+    # the loan changed within the replica lag, a lagging replica could fill its new key with the old loan
+    response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+    assert response.json()["description"] == "changed"
+    assert set(engines.counted()) == {"primary"}
+
+    monkeypatch.setattr(settings.db, "replica_lag", 0)
+    await cache.delete(*[key async for key in cache.scan_iter("*.loan:*")])
+    response = await client.get(f"/api/v1/loans/{loan_id}", headers=headers)
+    assert response.json()["description"] == "changed"
+    assert set(engines.counted()) == {"replica 0"}
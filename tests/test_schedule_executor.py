@@ -0,0 +1,96 @@
+"""The schedules computed in the pool of processes are the ones computed inline."""
+import pickle
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from typing import Iterator
+
+import pytest
+
+from src.utils.amortization import Schedule, ScheduleError, compute_schedule
+from src.utils.schedule_executor import ScheduleExecutor, ScheduleInput, compute_schedules
+
+
+pytestmark = pytest.mark.anyio
+
+
+def schedule_input(loan_term: int = 12, **kwargs) -> ScheduleInput:
+    return ScheduleInput(**{
+        "loan_amount": Decimal("100000"),
+        "interest_rate_percent": Decimal("10.75"),
+        "loan_term": loan_term,
+        "start_date": date(2024, 1, 31),
+        "payments": [],
+        **kwargs,
+    })
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """Runs the chunks in threads and records their sizes."""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.chunk_sizes: list[int] = []
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        self.chunk_sizes.append(len(args[0]))
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.fixture
+def process_executor(event_loop_lease) -> Iterator[ScheduleExecutor]:
+    executor: ScheduleExecutor = ScheduleExecutor(mode="process", workers=2, chunk_size=2)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("schedule", [
+    compute_schedule(**schedule_input(payments=[(date(2024, 3, 1), Decimal("20000"))])),
+    Schedule(),
+])
+def test_schedule_pickle(schedule: Schedule):
+    restored: Schedule = pickle.loads(pickle.dumps(schedule))
+    assert restored == schedule
+    # the decimals keep their exponents
+    assert [str(amount) for amount in restored.payment_amount] == [str(amount) for amount in schedule.payment_amount]
+
+
+@pytest.mark.parametrize(("inputs", "chunk_sizes"), [(10, [3, 3, 3, 1]), (4, [1, 1, 1, 1]), (1, [1])])
+async def test_compute_many_chunks(event_loop_lease, inputs: int, chunk_sizes: list[int]):
+    """The chunks are at most ``chunk_size`` long and spread over the workers."""
+    executor: ScheduleExecutor = ScheduleExecutor(mode="process", workers=4, chunk_size=3)
+    recorder: RecordingExecutor = RecordingExecutor()
+    executor._executor = recorder
+    try:
+        results: list[Schedule | ScheduleError] = await executor.compute_many([
+            schedule_input(loan_term=term) for term in range(1, inputs + 1)
+        ])
+    finally:
+        executor.shutdown()
+    assert recorder.chunk_sizes == chunk_sizes
+    # the results are in the order of the inputs
+    assert [len(result) for result in results] == list(range(1, inputs + 1))
+
+
+async def test_compute_many_in_processes(process_executor: ScheduleExecutor):
+    inputs: list[ScheduleInput] = [
+        schedule_input(),
+        schedule_input(payments=[(None, None)]),
+        schedule_input(loan_term=360, start_date=date(2023, 12, 31)),
+        schedule_input(payments=[(date(2024, 1, 1), Decimal("1"))]),
+        schedule_input(loan_term=1),
+    ]
+    results: list[Schedule | ScheduleError] = await process_executor.compute_many(inputs)
+    expected: list[Schedule | ScheduleError] = compute_schedules(inputs)
+
+    assert [type(result) for result in results] == [Schedule, ScheduleError, Schedule, ScheduleError, Schedule]
+    for result, expected_result in zip(results, expected):
+        if isinstance(expected_result, ScheduleError):
+            assert str(result) == str(expected_result)
+        else:
+            assert result == expected_result
+
+
+async def test_compute_raises_in_processes(process_executor: ScheduleExecutor):
+    with pytest.raises(ScheduleError, match="interest can not be greater"):
+        await process_executor.compute(schedule_input(payments=[(date(2024, 3, 1), Decimal("100"))]))
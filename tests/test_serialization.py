@@ -0,0 +1,90 @@
+"""The schedules serialized without the response models match FastAPI's serialization byte for byte."""
+import uuid
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from src.config import settings
+from src.schemas.loan_payments import LoanPaymentQuote, LoanPaymentRead
+from src.utils.schedule_packing import AMOUNT_COLUMNS, pack_payment, render_payments
+from src.utils.serialization import dumps, join_json_array
+
+
+pytestmark = pytest.mark.anyio
+
+LOAN_ID: uuid.UUID = uuid.uuid4()
+
+# the values of the LoanPayment columns, the amounts of Numeric(12, 2) have two decimal places
+PAYMENTS: list[dict[str, Any]] = [
+    {
+        "id": uuid.UUID(int=number * 0x1000_0000_0000_0000_0000_0001),
+        "loan_id": LOAN_ID,
+        "payment_number": number,
+        "payment_date": payment_date,
+        **dict(zip(AMOUNT_COLUMNS, map(Decimal, amounts))),
+    }
+    for number, payment_date, amounts in [
+        (1, date(2024, 2, 29), ("4649.19", "910.52", "3738.67", "100000.00", "96261.33")),
+        (2, date(2024, 3, 31), ("0.01", "0.00", "0.01", "0.10", "0.09")),
+        (3, date(1999, 12, 31), ("9999999999.99", "0.05", "10.00", "9999999999.99", "0.00")),
+        (4, date(2024, 1, 1), ("100.00", "99.90", "0.10", "1000000.00", "999999.90")),
+    ]
+]
+
+
+async def _response_model_json(response_model: Any, content: Any) -> bytes:
+    """Return the body FastAPI answers with for the content of a route with the response model."""
+    app: FastAPI = FastAPI()
+
+    @app.get("/", response_model=response_model)
+    async def route() -> Any:
+        return content
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return (await client.get("/")).content
+
+
+async def test_rendered_packed_payments():
+    expected: bytes = await _response_model_json(list[LoanPaymentRead], PAYMENTS)
+    assert render_payments([pack_payment(payment) for payment in PAYMENTS], loan_id=LOAN_ID) == expected
+    assert render_payments([], loan_id=LOAN_ID) == await _response_model_json(list[LoanPaymentRead], [])
+
+
+async def test_dumped_payments():
+    expected: bytes = await _response_model_json(list[LoanPaymentRead], PAYMENTS)
+    assert dumps([LoanPaymentRead(**payment) for payment in PAYMENTS]) == expected
+    assert join_json_array([]) == await _response_model_json(list[LoanPaymentRead], [])
+
+
+async def test_dumped_quote():
+    rows: list[dict[str, Any]] = [
+        {field: payment[field] for field in LoanPaymentQuote.model_fields} for payment in PAYMENTS
+    ]
+    assert dumps(rows) == await _response_model_json(list[LoanPaymentQuote], rows)
+
+
+async def test_schedule_responses(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        monkeypatch: pytest.MonkeyPatch,
+):
+    response: httpx.Response = await client.post(f"/api/v1/loans/{loan_id}/payments", json=[], headers=headers)
+    assert response.status_code == 200, response.text
+    schedule: list[dict[str, Any]] = response.json()
+    pages: dict[str, list[dict[str, Any]]] = {
+        "limit=30": schedule,
+        "limit=5&offset=3": schedule[3:8],
+        "limit=2&after=2024-06-02": [payment for payment in schedule if payment["payment_date"] > "2024-06-02"][:2],
+    }
+
+    # the pages are read from the database, then cached and read from the cache
+    for bypass in (True, False, False):
+        monkeypatch.setattr(settings.cache, "bypass", bypass)
+        for query, page in pages.items():
+            response = await client.get(f"/api/v1/loans/{loan_id}/payments?{query}", headers=headers)
+            assert response.content == await _response_model_json(list[LoanPaymentRead], page)
@@ -0,0 +1,41 @@
+"""The number of statements each schedule endpoint sends to the database."""
+import uuid
+from typing import Awaitable
+
+import fakeredis
+import httpx
+import pytest
+
+from src.utils.metrics import metrics
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def _statements(request: Awaitable[httpx.Response], status_code: int) -> int:
+    """Return the number of statements of the request, counted by its session."""
+    before: float = metrics.snapshot().get("db.session.statements.sum", 0)
+    response: httpx.Response = await request
+    assert response.status_code == status_code, response.text
+    return int(metrics.snapshot()["db.session.statements.sum"] - before)
+
+
+async def test_schedule_statements(
+        client: httpx.AsyncClient,
+        headers: dict[str, str],
+        loan_id: str,
+        cache: fakeredis.FakeAsyncRedis,
+):
+    url: str = f"/api/v1/loans/{loan_id}/payments"
+    # the loan is read and the schedule inserted, an existing schedule fails the insert
+    assert await _statements(client.post(url, json=[], headers=headers), 200) == 2
+    assert await _statements(client.post(url, json=[], headers=headers), 409) == 2
+
+    await cache.flushall()
+    # one join of the loan and its payments
+    assert await _statements(client.get(f"{url}?limit=5", headers=headers), 200) == 1
+    assert await _statements(client.get(f"{url}?limit=5", headers=headers), 200) == 0
+    assert await _statements(client.get(f"/api/v1/loans/{uuid.uuid4()}/payments", headers=headers), 404) == 1
+
+    # one delete of the payments of the user loan, returning their ids
+    assert await _statements(client.delete(url, headers=headers), 200) == 1